@@ -0,0 +1,90 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks
+    ~~~~~~~~~~
+
+    Benchmarking Flask-Redis
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import socket
+import subprocess
+import time
+import timeit
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+import redis
+
+
+def session_data(size):
+    """Returns a representative session dict: `small` holds a login,
+    `medium` adds preferences and flashed messages, `large` a shopping cart
+    of a few hundred items.
+    """
+    data = {'_fresh': True, '_id': 'f' * 128, 'user_id': u'4711',
+            'csrf_token': 'c' * 40}
+    if size in ('medium', 'large'):
+        data['preferences'] = dict(lang=u'de', tz=u'Europe/Berlin',
+                                   theme=u'dark', page_size=50)
+        data['_flashes'] = [(u'message', u'Profile saved.'),
+                            (u'error', u'Your card expires soon.')]
+    if size == 'large':
+        data['cart'] = [dict(sku=u'SKU-%05d' % i, qty=i % 5 + 1,
+                             price=9.99 + i, title=u'Product number %d' % i)
+                        for i in range(300)]
+    return data
+
+
+SESSION_SIZES = ('small', 'medium', 'large')
+
+
+def measure(func, number=None, repeat=5):
+    """Returns the best time of one call to `func` in microseconds."""
+    timer = timeit.Timer(func)
+    if number is None:
+        if hasattr(timer, 'autorange'):
+            number = timer.autorange()[0]
+        else:
+            number = 1000
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def spawn_redis_server():
+    """Starts a throwaway redis-server without persistence on a free port.
+
+    :returns: tuple of the process and its port, `None` without a
+              redis-server binary
+    """
+    executable = which('redis-server')
+    if executable is None:
+        return None
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    devnull = open(os.devnull, 'w')
+    process = subprocess.Popen(
+        [executable, '--port', str(port), '--bind', '127.0.0.1',
+         '--save', '', '--appendonly', 'no'], stdout=devnull, stderr=devnull)
+    client = redis.StrictRedis(port=port)
+    for _ in range(100):
+        try:
+            client.ping()
+            return process, port
+        except redis.ConnectionError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError('redis-server did not start on port %d' % port)
+
+
+def create_fake_pool():
+    import fakeredis
+    return redis.ConnectionPool(connection_class=fakeredis.FakeConnection,
+                                server=fakeredis.FakeServer())
@@ -0,0 +1,299 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.app
+    ~~~~~~~~~~~~~~
+
+    Drives a Flask application through its test client and measures the hot
+    paths of the extension: connecting, the command proxy, session ID
+    generation and opening and saving sessions. Requests are sent by 1, 4
+    and 16 threads with small, medium and large sessions, reporting
+    requests per second, p50 and p99 latency and round trips and bytes per
+    request as recorded by :mod:`flask_redis.instrumentation`.
+
+    Commands go to a redis-server spawned on a free port when one is found
+    on the ``PATH``, otherwise to fakeredis. Run with
+    ``python -m benchmarks.app``. ``--save`` stores the results as baseline
+    of the backend in ``benchmarks/baselines.json``; later runs exit with
+    status 1 when round trips or bytes per request grew. Timings depend on
+    the machine and its load, so they are only reported relative to the
+    baseline, unless ``--tolerance`` is given to fail on timings regressed
+    by more than that on the machine which recorded the baseline.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import flask
+
+import flask_redis
+from flask_redis.instrumentation import Sink, timer
+from benchmarks import (SESSION_SIZES, create_fake_pool, measure,
+                        session_data, spawn_redis_server)
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+CONCURRENCY = (1, 4, 16)
+
+
+class _Collector(Sink):
+    """Keeps the stats of every request."""
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, stats):
+        self.requests.append(stats)
+
+
+def create_app(config, size):
+    """Creates the application under test. ``/login`` stores a session of
+    `size`, ``/`` reads it and ``/write`` modifies it.
+    """
+    app = flask.Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['REDIS_SESSION'] = True
+    app.config['REDIS_INSTRUMENTATION'] = True
+    app.config['REDIS_STATS_HEADER'] = False
+    collector = _Collector()
+    app.config['REDIS_INSTRUMENTATION_SINKS'] = [collector]
+    app.config.update(config)
+    extension = flask_redis.Redis(app)
+
+    @app.route('/login')
+    def login():
+        flask.session.update(session_data(size))
+        return 'ok'
+
+    @app.route('/')
+    def read():
+        return flask.session.get('user_id', u'')
+
+    @app.route('/write')
+    def write():
+        flask.session['counter'] = flask.session.get('counter', 0) + 1
+        return 'ok'
+
+    return app, extension, collector
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_requests(app, collector, path, threads, requests):
+    """Sends `requests` requests to `path` from each of `threads` logged in
+    clients.
+
+    :rtype: dict
+    """
+    clients = []
+    for _ in range(threads):
+        client = app.test_client()
+        client.get('/login')
+        clients.append(client)
+    del collector.requests[:]
+    latencies = [[] for _ in range(threads)]
+
+    def work(client, latencies):
+        for _ in range(requests):
+            started = timer()
+            client.get(path)
+            latencies.append(timer() - started)
+
+    workers = [threading.Thread(target=work, args=args)
+               for args in zip(clients, latencies)]
+    started = timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = timer() - started
+
+    latencies = [latency for thread in latencies for latency in thread]
+    stats = collector.requests
+    return dict(
+        requests_per_second=len(latencies) / elapsed,
+        p50_ms=percentile(latencies, 0.5) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        round_trips=float(sum(s.round_trips for s in stats)) / len(stats),
+        bytes=float(sum(s.bytes for s in stats)) / len(stats))
+
+
+def run_micro(app, extension, size):
+    """Measures single hot paths in microseconds.
+
+    :rtype: dict
+    """
+    interface = app.session_interface
+    results = {}
+    with app.test_request_context():
+        results['connection'] = measure(lambda: extension._connection)
+        results['proxy'] = measure(lambda: extension.get)
+    results['generate_sid'] = measure(interface.generate_sid)
+
+    with app.test_request_context('/'):
+        session = interface.open_session(app, flask.request)
+        session.update(session_data(size))
+        interface.save_session(app, session, app.response_class())
+    cookie = '%s=%s' % (app.session_cookie_name, session.sid)
+    with app.test_request_context('/', headers={'Cookie': cookie}):
+        request = flask.request._get_current_object()
+        session = interface.open_session(app, request)
+        session.modified = True
+        response = app.response_class()
+        results['open_session'] = measure(
+            lambda: interface.open_session(app, request))
+        results['save_session'] = measure(
+            lambda: interface.save_session(app, session, response))
+    return results
+
+
+def run(config, requests):
+    results = dict(requests=OrderedDict(), micro=OrderedDict())
+    for size in SESSION_SIZES:
+        app, extension, collector = create_app(config, size)
+        for path in ('/', '/write'):
+            for threads in CONCURRENCY:
+                name = '%s %s x%d' % (path, size, threads)
+                results['requests'][name] = run_requests(
+                    app, collector, path, threads, requests)
+        for name, value in sorted(run_micro(app, extension, size).items()):
+            results['micro']['%s %s' % (name, size)] = value
+    return results
+
+
+def report(results):
+    print('%-20s %10s %9s %9s %7s %9s' % ('requests', 'req/s', 'p50 (ms)',
+                                          'p99 (ms)', 'trips', 'bytes'))
+    for name in results['requests']:
+        r = results['requests'][name]
+        print('%-20s %10.0f %9.3f %9.3f %7.1f %9.0f' % (
+            name, r['requests_per_second'], r['p50_ms'], r['p99_ms'],
+            r['round_trips'], r['bytes']))
+    print('')
+    print('%-20s %10s' % ('hot path', 'us'))
+    for name in results['micro']:
+        print('%-20s %10.2f' % (name, results['micro'][name]))
+
+
+def compare(results, baseline, tolerance=None):
+    """Returns descriptions of the metrics of `results` which regressed
+    compared to `baseline`: round trips and bytes, and timings only with a
+    `tolerance` given.
+
+    :rtype: list of str
+    """
+    regressions = []
+
+    def check(name, value, expected, limit):
+        if limit is not None and value > limit:
+            regressions.append('%s: %.3f, baseline %.3f' % (name, value,
+                                                            expected))
+
+    def timing_limit(expected, factor=1):
+        if tolerance is None:
+            return None
+        return expected * (1 + factor * tolerance)
+
+    for name, expected in baseline['requests'].items():
+        r = results['requests'].get(name)
+        if r is None:
+            continue
+        check(name + ' round trips', r['round_trips'],
+              expected['round_trips'], expected['round_trips'])
+        # pickled sessions may differ in a few bytes, e.g. timestamps
+        check(name + ' bytes', r['bytes'], expected['bytes'],
+              expected['bytes'] * 1.05)
+        check(name + ' p50', r['p50_ms'], expected['p50_ms'],
+              timing_limit(expected['p50_ms']))
+        # tail latencies of threads contending for the GIL are noisy
+        check(name + ' p99', r['p99_ms'], expected['p99_ms'],
+              timing_limit(expected['p99_ms'], 2))
+        slowdown = expected['requests_per_second'] / r['requests_per_second']
+        check(name + ' slowdown', slowdown, 1.0, timing_limit(1.0))
+    for name, expected in baseline['micro'].items():
+        if name in results['micro']:
+            check(name, results['micro'][name], expected,
+                  timing_limit(expected))
+    return regressions
+
+
+def report_timings(results, baseline):
+    """Prints the timings of `results` relative to `baseline`, for
+    information only."""
+    print('\ntimings relative to the baseline (1.00 = unchanged)')
+    for name, expected in baseline['requests'].items():
+        r = results['requests'].get(name)
+        if r is not None:
+            print('%-28s p50 %5.2f  req/s %5.2f' % (
+                name, r['p50_ms'] / expected['p50_ms'],
+                r['requests_per_second'] / expected['requests_per_second']))
+    for name, expected in baseline['micro'].items():
+        if name in results['micro']:
+            print('%-28s     %5.2f' % (name,
+                                       results['micro'][name] / expected))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--fakeredis', action='store_true',
+                        help='use fakeredis even if redis-server is found')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per thread and scenario')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as baseline')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='fail on timings regressed by more than this '
+                             'fraction, off by default')
+    args = parser.parse_args(argv)
+
+    server = None if args.fakeredis else spawn_redis_server()
+    if server is None:
+        backend = 'fakeredis'
+        config = dict(REDIS_CONNECTION_POOL=create_fake_pool())
+    else:
+        backend = 'redis-server'
+        config = dict(REDIS_HOST='127.0.0.1', REDIS_PORT=server[1])
+    print('backend: %s' % backend)
+    try:
+        results = run(config, args.requests)
+    finally:
+        if server is not None:
+            server[0].terminate()
+            server[0].wait()
+    report(results)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    if args.save:
+        baselines[backend] = results
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print('\nbaseline of %s saved' % backend)
+        return 0
+    if backend not in baselines:
+        print('\nno baseline of %s to compare with' % backend)
+        return 0
+
+    report_timings(results, baselines[backend])
+    regressions = compare(results, baselines[backend], args.tolerance)
+    if regressions:
+        print('\nREGRESSIONS against the %s baseline:' % backend)
+        for regression in regressions:
+            print('  ' + regression)
+        return 1
+    print('\nno regressions against the %s baseline' % backend)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.compression
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares stored bytes and CPU cost of compressing serialized sessions.
+    Run with ``python -m benchmarks.compression``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+from flask_redis import compression, serializers
+from benchmarks import SESSION_SIZES, measure, session_data
+
+
+def run():
+    serializer = serializers.get_serializer('pickle')
+    candidates = [('none', None)]
+    for name in sorted(compression.compressors):
+        candidates.append((name, compression.get_compressor(name)))
+
+    print('%-8s %-6s %10s %8s %15s %17s' % ('size', 'codec', 'bytes', 'ratio',
+                                            'compress (us)',
+                                            'decompress (us)'))
+    for size in SESSION_SIZES:
+        value = serializers.dumps(session_data(size), serializer)
+        for name, compressor in candidates:
+            stored = compression.compress(value, compressor)
+            compress = measure(lambda: compression.compress(value,
+                                                            compressor))
+            decompress = measure(lambda: compression.decompress(stored))
+            print('%-8s %-6s %10d %8.2f %15.2f %17.2f' % (
+                size, name, len(stored), float(len(value)) / len(stored),
+                compress, decompress))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.instrumentation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the overhead instrumentation adds to a command issued through
+    the extension. Commands are executed in-process by fakeredis so the
+    network does not drown the difference; as fakeredis itself varies by
+    several microseconds between runs the cost of recording a round trip is
+    measured on its own as well. Run with
+    ``python -m benchmarks.instrumentation``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import fakeredis
+import flask
+import redis
+
+import flask_redis
+from flask_redis.instrumentation import (Instrumentation, RequestStats,
+                                         count_keys, payload_size)
+from benchmarks import measure
+
+
+def create_extension(instrumentation):
+    app = flask.Flask(__name__)
+    app.config['REDIS_CONNECTION_POOL'] = redis.ConnectionPool(
+        connection_class=fakeredis.FakeConnection,
+        server=fakeredis.FakeServer())
+    app.config['REDIS_INSTRUMENTATION'] = instrumentation
+    return app, flask_redis.Redis(app)
+
+
+def run():
+    print('%-14s %12s %12s' % ('instrumented', 'get (us)', 'pipe (us)'))
+    for instrumentation in (False, True):
+        app, extension = create_extension(instrumentation)
+        with app.app_context():
+            extension.set('key', 'x' * 100)
+
+            def pipelined():
+                pipe = extension.pipeline(transaction=False)
+                pipe.get('key')
+                pipe.get('key')
+                pipe.execute()
+            get, pipe = (
+                measure(lambda: extension.get('key')), measure(pipelined))
+        print('%-14s %12.2f %12.2f' % (instrumentation, get, pipe))
+
+    instrumentation = Instrumentation()
+    stats = RequestStats('index')
+    args = ('GET', 'key')
+    reply = b'x' * 100
+
+    def record():
+        instrumentation.record_command(
+            args[0], 1, count_keys(args),
+            payload_size(args) + payload_size(reply), 0.0001, stats)
+    print('recording a round trip: %.2f us' % measure(record))
+
+
+if __name__ == '__main__':
+    run()
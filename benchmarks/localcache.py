@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.localcache
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Measures opening a session without local cache, with the session cached
+    by this process (hit) and changed by another process since (stale),
+    along with the bytes of session values fetched per open. Runs against a
+    redis-server spawned on a free port, or fakeredis without one. Run with
+    ``python -m benchmarks.localcache``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import sys
+
+import flask
+import redis
+
+from flask_redis.session import (LocalSessionCache, RedisSession,
+                                 RedisSessionInterface)
+from benchmarks import (SESSION_SIZES, create_fake_pool, measure,
+                        session_data, spawn_redis_server)
+
+
+class Request(object):
+    def __init__(self, sid):
+        self.cookies = {'session': sid}
+
+
+def run(client):
+    app = flask.Flask(__name__)
+    app.config['REDIS_SESSION_REFRESH_INTERVAL'] = 0
+    plain = RedisSessionInterface(client)
+    cache = LocalSessionCache()
+    cached = RedisSessionInterface(client, local_cache=cache)
+
+    print('%-8s %-8s %12s %10s' % ('size', 'cache', 'open (us)', 'bytes'))
+    for size in SESSION_SIZES:
+        session = RedisSession(sid='benchmark-%s' % size)
+        session.update(session_data(size))
+        cached.save_session(app, session, flask.Response())
+        request = Request(session.sid)
+        data = len(client.get(plain.get_redis_key(session.sid)))
+        version = len(client.get(plain.get_redis_key(session.sid, 'version')))
+
+        def stale():
+            cache.put(session.sid, b'outdated', b'')
+            cached.open_session(app, request)
+
+        for name, func, fetched in (
+                ('off', lambda: plain.open_session(app, request), data),
+                ('hit', lambda: cached.open_session(app, request), version),
+                ('stale', stale, data + version)):
+            print('%-8s %-8s %12.2f %10d' % (size, name, measure(func),
+                                              fetched))
+    stats = cache.stats()
+    print('hits %(hits)d, stale %(stale)d, misses %(misses)d' % stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--fake', action='store_true',
+                        help='use fakeredis even if redis-server is found')
+    args = parser.parse_args(argv)
+
+    server = None if args.fake else spawn_redis_server()
+    if server is None:
+        run(redis.StrictRedis(connection_pool=create_fake_pool()))
+        return 0
+    try:
+        run(redis.StrictRedis(port=server[1]))
+    finally:
+        server[0].terminate()
+        server[0].wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.messaging
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Measures the messages per second the dispatcher passes to handlers
+    against a redis-server spawned on a free port: published Pub/Sub
+    messages, and stream entries read by a consumer group with 1, 10 and
+    100 entries per XREADGROUP, each batch acknowledged by one XACK
+    pipelined with the next read. Messages are sent in pipelines ahead of
+    consumption so the dispatcher is the bottleneck. Run with
+    ``python -m benchmarks.messaging``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import sys
+import threading
+
+import flask
+
+import flask_redis
+from flask_redis.instrumentation import timer
+from benchmarks import spawn_redis_server
+
+BATCH_SIZES = (1, 10, 100)
+
+
+def create_extension(port):
+    app = flask.Flask(__name__)
+    app.config['REDIS_HOST'] = '127.0.0.1'
+    app.config['REDIS_PORT'] = port
+    return flask_redis.Redis(app)
+
+
+def consume(extension, count, register, produce):
+    """Registers a handler with `register`, sends `count` messages with
+    `produce` and waits until all were handled.
+
+    :returns: messages per second
+    """
+    done = threading.Event()
+    handled = [0]
+
+    def handler(*args):
+        handled[0] += 1
+        if handled[0] == count:
+            done.set()
+
+    register(handler)
+    extension.dispatcher.start()
+    try:
+        started = timer()
+        produce()
+        if not done.wait(60):
+            raise RuntimeError('Only %d of %d messages handled'
+                               % (handled[0], count))
+        return count / (timer() - started)
+    finally:
+        extension.dispatcher.stop()
+
+
+def send(extension, count, command, *args):
+    pipe = extension.pipeline(transaction=False)
+    for i in range(count):
+        getattr(pipe, command)(*args)
+        if i % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+
+
+def run(port, count):
+    print('%-24s %12s' % ('scenario', 'messages/s'))
+
+    extension = create_extension(port)
+
+    def wait_subscribed():
+        # the listener subscribes in the background
+        while not extension.pubsub_numsub('benchmark')[0][1]:
+            pass
+        send(extension, count, 'publish', 'benchmark', 'payload')
+
+    print('%-24s %12.0f' % ('pubsub', consume(
+        extension, count, extension.subscribe('benchmark'),
+        wait_subscribed)))
+
+    for batch_size in BATCH_SIZES:
+        extension = create_extension(port)
+        stream = 'benchmark:%d' % batch_size
+        register = extension.consume(stream, 'benchmark',
+                                     batch_size=batch_size, start_id='0')
+        print('%-24s %12.0f' % ('stream batch %d' % batch_size, consume(
+            extension, count, register,
+            lambda: send(extension, count, 'xadd', stream,
+                         {'payload': 'x' * 64}))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--messages', type=int, default=20000,
+                        help='messages per scenario')
+    args = parser.parse_args(argv)
+
+    server = spawn_redis_server()
+    if server is None:
+        print('redis-server not found on the PATH')
+        return 1
+    try:
+        run(server[1], args.messages)
+    finally:
+        server[0].terminate()
+        server[0].wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.prewarm
+    ~~~~~~~~~~~~~~~~~~
+
+    Measures the first requests of a freshly forked worker with and without
+    REDIS_POOL_PREWARM: the worker forks like those of a preforking server,
+    settles for ``--boot`` seconds and serves ``--concurrency`` requests at
+    once, timing the first command of each. Runs against a redis-server
+    spawned on a free port. Run with ``python -m benchmarks.prewarm``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import os
+import pickle
+import sys
+import threading
+import time
+
+import flask
+
+import flask_redis
+from flask_redis.instrumentation import timer
+from benchmarks import spawn_redis_server
+
+
+def serve_first_requests(ext, app, concurrency):
+    barrier = threading.Barrier(concurrency)
+    durations = []
+
+    def request():
+        with app.test_request_context():
+            barrier.wait()
+            started = timer()
+            ext.get('greeting')
+            durations.append(timer() - started)
+
+    threads = [threading.Thread(target=request) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return durations
+
+
+def fork_worker(ext, app, concurrency, boot):
+    """Serves the first requests in a forked child, returning their
+    durations and the connections the child opened."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if not pid:
+        try:
+            os.close(read_fd)
+            time.sleep(boot)
+            durations = serve_first_requests(ext, app, concurrency)
+            created = ext.pool_stats()['primary']['created']
+            os.write(write_fd, pickle.dumps((durations, created)))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as reader:
+        result = pickle.loads(reader.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def run(port, concurrency, boot, workers):
+    print('%-8s %12s %12s %12s' % ('prewarm', 'mean (us)', 'max (us)',
+                                   'connections'))
+    for prewarm in (0, concurrency):
+        app = flask.Flask(__name__)
+        app.config.update(REDIS_PORT=port, REDIS_POOL_PREWARM=prewarm,
+                          REDIS_DISPATCHER_AUTOSTART=False)
+        ext = flask_redis.Redis(app)
+        durations = []
+        for _ in range(workers):
+            worker_durations, created = fork_worker(ext, app, concurrency,
+                                                    boot)
+            durations.extend(worker_durations)
+        print('%-8d %12.1f %12.1f %12d' % (
+            prewarm, sum(durations) / len(durations) * 1e6,
+            max(durations) * 1e6, created))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='requests served at once by each worker')
+    parser.add_argument('--boot', type=float, default=0.1,
+                        help='seconds a worker settles before serving')
+    parser.add_argument('--workers', type=int, default=20,
+                        help='workers forked per setting')
+    args = parser.parse_args(argv)
+
+    server = spawn_redis_server()
+    if server is None:
+        print('redis-server not found on the PATH')
+        return 1
+    try:
+        run(server[1], args.concurrency, args.boot, args.workers)
+    finally:
+        server[0].terminate()
+        server[0].wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.proxy
+    ~~~~~~~~~~~~~~~~
+
+    Compares the cost of a command issued through the extension with the
+    same command issued on a bare :class:`redis.StrictRedis`. Connections
+    answer without any I/O, so the numbers show the client side cost only.
+    Run with ``python -m benchmarks.proxy``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import flask
+import redis
+
+import flask_redis
+from benchmarks import measure
+
+
+class NullConnection(redis.Connection):
+    """Connection sending nothing and reading ``b'value'`` replies."""
+
+    def connect(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return False
+
+    def send_packed_command(self, command, check_health=True):
+        pass
+
+    def read_response(self, *args, **kwargs):
+        return b'value'
+
+
+def run():
+    pool = redis.ConnectionPool(connection_class=NullConnection)
+    bare = redis.StrictRedis(connection_pool=pool)
+    app = flask.Flask(__name__)
+    app.config['REDIS_CONNECTION_POOL'] = pool
+    extension = flask_redis.Redis(app)
+
+    # warm up
+    measure(lambda: bare.get('key'))
+    results = [('StrictRedis.get', measure(lambda: bare.get('key'))),
+               ('Redis.get', measure(lambda: extension.get('key')))]
+    with app.app_context():
+        results.append(('Redis.get in context',
+                        measure(lambda: extension.get('key'))))
+
+    print('%-24s %10s %14s' % ('call', 'us', 'overhead (us)'))
+    for name, value in results:
+        print('%-24s %10.3f %14.3f' % (name, value, value - results[0][1]))
+
+
+if __name__ == '__main__':
+    run()
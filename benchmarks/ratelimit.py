@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.ratelimit
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Measures rate limit checks and lock round trips per second against a
+    redis-server spawned on a free port, as fakeredis cannot run Lua.
+    Checks are sent by 1, 4 and 16 threads for each algorithm, once invoked
+    by digest with EVALSHA as :class:`flask_redis.ratelimit.RateLimiter`
+    does and once sending the whole script with EVAL for comparison, along
+    with the bytes of script each check sends. Over loopback both perform
+    alike; EVALSHA saves the bandwidth on real networks. Run with
+    ``python -m benchmarks.ratelimit``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import sys
+import threading
+
+import flask
+
+import flask_redis
+from flask_redis.instrumentation import timer
+from flask_redis.ratelimit import SCRIPTS
+from benchmarks import spawn_redis_server
+
+CONCURRENCY = (1, 4, 16)
+
+
+def per_second(func, threads, calls):
+    """Calls `func` `calls` times from each of `threads` threads.
+
+    :returns: calls per second
+    """
+    def work():
+        for _ in range(calls):
+            func()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    started = timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * calls / (timer() - started)
+
+
+def run(port, calls):
+    app = flask.Flask(__name__)
+    app.config['REDIS_HOST'] = '127.0.0.1'
+    app.config['REDIS_PORT'] = port
+    extension = flask_redis.Redis(app)
+    limiter = extension.rate_limiter
+    limiter.load_scripts()
+    # never exhausted, so every check runs the whole script
+    rate = (10 ** 9, 60)
+
+    row = '%-24s' + ' %10.0f' * (len(CONCURRENCY) + 1)
+    header = ('checks/s',) + tuple('x%d' % threads for threads in CONCURRENCY)
+    print(row.replace('.0f', 's') % (header + ('bytes',)))
+    for algorithm in sorted(SCRIPTS):
+        args = [rate[0], rate[1] * 1000, 1]
+        if algorithm == 'token-bucket':
+            args.append(rate[0])
+        source = SCRIPTS[algorithm]
+
+        def evalsha():
+            limiter.hit('benchmark', rate, algorithm=algorithm)
+
+        def eval_():
+            extension.eval(source, 1, limiter.prefix + 'benchmark', *args)
+
+        for name, func, size in (('evalsha', evalsha, 40),
+                                 ('eval', eval_, len(source))):
+            func()
+            print(row % (('%s %s' % (algorithm, name),) + tuple(
+                per_second(func, threads, calls) for threads in CONCURRENCY)
+                + (size,)))
+
+    def lock():
+        with extension.lock('benchmark:%d' % threading.current_thread().ident,
+                            timeout=10):
+            pass
+
+    print(row % (('lock acquire/release',) + tuple(
+        per_second(lock, threads, calls) for threads in CONCURRENCY) + (40,)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--calls', type=int, default=2000,
+                        help='calls per thread and scenario')
+    args = parser.parse_args(argv)
+
+    server = spawn_redis_server()
+    if server is None:
+        print('redis-server not found on the PATH')
+        return 1
+    try:
+        run(server[1], args.calls)
+    finally:
+        server[0].terminate()
+        server[0].wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.serializers
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares dumps/loads time and stored size of the session serializers.
+    Run with ``python -m benchmarks.serializers``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from flask_redis import serializers
+from benchmarks import SESSION_SIZES, measure, session_data
+
+
+class LegacyPickleSerializer(serializers.Serializer):
+    """Protocol 0 pickle as stored by earlier versions, for reference."""
+    tag = b''
+
+    def dumps(self, data):
+        return pickle.dumps(data, 0)
+
+    def loads(self, value):
+        return pickle.loads(value)
+
+
+def run():
+    candidates = [('pickle-0', LegacyPickleSerializer())]
+    candidates.extend(sorted(serializers.serializers.items()))
+
+    print('%-8s %-10s %12s %12s %10s' % ('size', 'serializer', 'dumps (us)',
+                                         'loads (us)', 'bytes'))
+    for size in SESSION_SIZES:
+        data = session_data(size)
+        for name, serializer in candidates:
+            value = serializers.dumps(data, serializer)
+            dumps = measure(lambda: serializers.dumps(data, serializer))
+            loads = measure(lambda: serializers.loads(value))
+            print('%-8s %-10s %12.2f %12.2f %10d' % (size, name, dumps,
+                                                     loads, len(value)))
+
+
+if __name__ == '__main__':
+    run()
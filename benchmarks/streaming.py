@@ -0,0 +1,108 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.streaming
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Compares peak Python memory, as traced by :mod:`tracemalloc`, and time
+    of passing values of 1, 16 and 64 MiB through a worker against a
+    redis-server spawned on a free port: read whole with GET or streamed
+    from a string and from a chunked value, written whole with SET after
+    ``read()`` or from the file with
+    :func:`flask_redis.streaming.write_chunked`. Tracing slows every
+    allocation down, so times are only comparable among each other. Run
+    with ``python -m benchmarks.streaming``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import io
+import os
+import sys
+import tracemalloc
+
+import redis
+
+from flask_redis.instrumentation import timer
+from flask_redis.streaming import iter_value, write_chunked
+from benchmarks import spawn_redis_server
+
+SIZES = (1, 16, 64)
+
+
+def traced(func):
+    """Calls `func` while tracing allocations.
+
+    :returns: tuple of the peak in KiB and the time in ms
+    """
+    tracemalloc.start()
+    try:
+        started = timer()
+        func()
+        elapsed = timer() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak // 1024, elapsed * 1000
+
+
+def run(client, chunk_size):
+    row = '%-8s %-16s %12s %10s'
+    print(row % ('MiB', 'scenario', 'peak (KiB)', 'ms'))
+    for size in SIZES:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '.streaming-%d' % size)
+        with open(path, 'wb') as f:
+            for _ in range(size):
+                f.write(os.urandom(1024 * 1024))
+        try:
+            def set_whole():
+                with open(path, 'rb') as f:
+                    client.set('benchmark:string', f.read())
+
+            def set_chunked():
+                with open(path, 'rb') as f:
+                    write_chunked(client, 'benchmark:chunked', f,
+                                  chunk_size, grace=0)
+
+            def get_whole():
+                client.get('benchmark:string')
+
+            def consume(key):
+                for _ in iter_value(client, key, chunk_size):
+                    pass
+
+            for name, func in (
+                    ('SET whole', set_whole),
+                    ('write chunked', set_chunked),
+                    ('GET whole', get_whole),
+                    ('stream string', lambda: consume('benchmark:string')),
+                    ('stream chunked', lambda: consume('benchmark:chunked'))):
+                peak, ms = traced(func)
+                print(row.replace('s %10s', 'd %10.1f') % (size, name, peak,
+                                                            ms))
+        finally:
+            os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--chunk-size', type=int, default=256 * 1024,
+                        help='bytes per chunk')
+    args = parser.parse_args(argv)
+
+    server = spawn_redis_server()
+    if server is None:
+        print('redis-server not found on the PATH')
+        return 1
+    try:
+        run(redis.StrictRedis(port=server[1]), args.chunk_size)
+    finally:
+        server[0].terminate()
+        server[0].wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
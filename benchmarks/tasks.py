@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+"""
+    benchmarks.tasks
+    ~~~~~~~~~~~~~~~~
+
+    Measures the job queue against a redis-server spawned on a free port:
+    jobs enqueued per second one by one with ``delay``, within a batch and
+    with ``map``, and jobs processed per second by 1 and 4 forked workers
+    fetching 1, 10 and 100 jobs per round trip. Jobs do no work, so the
+    queue itself is measured, unless ``--sleep`` makes them wait as for
+    I/O; more processes than CPUs only pay off for such jobs. Run with
+    ``python -m benchmarks.tasks``.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import argparse
+import sys
+import time
+
+import flask
+
+import flask_redis
+from flask_redis.instrumentation import timer
+from flask_redis.tasks import Worker, run_workers
+from benchmarks import spawn_redis_server
+
+BATCH_SIZES = (1, 10, 100)
+PROCESSES = (1, 4)
+
+
+def create_app(port, sleep=0):
+    app = flask.Flask(__name__)
+    app.config['REDIS_HOST'] = '127.0.0.1'
+    app.config['REDIS_PORT'] = port
+    extension = flask_redis.Redis(app)
+
+    @extension.task(name='noop')
+    def noop(i):
+        if sleep:
+            time.sleep(sleep)
+
+    return app, extension, noop
+
+
+def enqueue(app, extension, noop, count):
+    """Enqueues `count` jobs per scenario.
+
+    :returns: list of tuples of scenario and jobs per second
+    """
+    def one_by_one():
+        for i in range(count):
+            noop.delay(i)
+
+    def batched():
+        with app.test_request_context():
+            with extension.batch():
+                for i in range(count):
+                    noop.delay(i)
+
+    def mapped():
+        noop.map((i,) for i in range(count))
+
+    results = []
+    for name, func in (('delay', one_by_one), ('delay in batch', batched),
+                       ('map', mapped)):
+        started = timer()
+        func()
+        results.append((name, count / (timer() - started)))
+    return results
+
+
+def process(app, extension, noop, count, processes, batch_size):
+    """Enqueues `count` jobs and runs workers until the queue is empty.
+
+    :returns: jobs per second
+    """
+    noop.map((i,) for i in range(count))
+
+    def create_worker():
+        return Worker(extension.tasks, batch_size=batch_size, app=app)
+
+    started = timer()
+    run_workers(create_worker, processes, burst=True)
+    elapsed = timer() - started
+    assert extension.tasks.length() == 0
+    return count / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--jobs', type=int, default=20000,
+                        help='jobs per scenario')
+    parser.add_argument('--sleep', type=float, default=0,
+                        help='seconds each job waits')
+    args = parser.parse_args(argv)
+
+    server = spawn_redis_server()
+    if server is None:
+        print('redis-server not found on the PATH')
+        return 1
+    try:
+        app, extension, noop = create_app(server[1], args.sleep)
+        print('%-24s %12s' % ('enqueue', 'jobs/s'))
+        for name, rate in enqueue(app, extension, noop, args.jobs):
+            print('%-24s %12.0f' % (name, rate))
+        extension.delete(extension.tasks.get_key('queue', 'default'))
+
+        print('')
+        print('%-24s %12s' % ('process', 'jobs/s'))
+        for processes in PROCESSES:
+            for batch_size in BATCH_SIZES:
+                print('%-24s %12.0f' % (
+                    'x%d batch %d' % (processes, batch_size),
+                    process(app, extension, noop, args.jobs, processes,
+                            batch_size)))
+    finally:
+        server[0].terminate()
+        server[0].wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
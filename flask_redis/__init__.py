@@ -9,16 +9,387 @@
     :author: Tobias Werner <mail@tobiaswerner.net>
     :license: BSD, see LICENSE for more details.
 """
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
 import redis
+import redis.sentinel
+
+from .batch import Batch
+from .caching import Cache
+from .instrumentation import (Instrumentation, InstrumentedPipeline,
+                              InstrumentedRedis, RequestStats)
+from .messaging import Dispatcher
+from .ratelimit import RateLimiter
+from .streaming import CHUNK_SIZE
+from .tasks import TaskQueue
+from .resilience import CircuitBreaker, ResilientPipeline, ResilientRedis
+from .tracking import TrackingCache
 
 try:
-    from flask import _app_ctx_stack as connection_stack
+    from flask.globals import _cv_app
 except ImportError:
-    from flask import _request_ctx_stack as connection_stack
+    try:
+        from flask import _app_ctx_stack as connection_stack
+    except ImportError:
+        from flask import _request_ctx_stack as connection_stack
+
+    def _current_context():
+        return connection_stack.top
+else:
+    # looked up on every command, so without a Python level frame
+    _current_context = functools.partial(_cv_app.get, None)
 
 
 __version__ = '0.1-dev'
 
+logger = logging.getLogger('flask_redis')
+
+
+class _IdleTimeoutMixin(object):
+    """Drops pooled connections which have not been used for longer than
+    :attr:`idle_timeout` seconds instead of handing out a socket the server
+    or a firewall in between may already have closed.
+    """
+
+    def __init__(self, idle_timeout=None, **kwargs):
+        self.idle_timeout = idle_timeout
+        super(_IdleTimeoutMixin, self).__init__(**kwargs)
+
+    def get_connection(self, command_name, *keys, **options):
+        connection = super(_IdleTimeoutMixin, self).get_connection(
+            command_name, *keys, **options)
+        released_at = getattr(connection, '_flask_redis_released_at', None)
+        if self.idle_timeout is not None and released_at is not None:
+            if time.time() - released_at > self.idle_timeout:
+                connection.disconnect()
+                connection.connect()
+        return connection
+
+    def release(self, connection):
+        connection._flask_redis_released_at = time.time()
+        super(_IdleTimeoutMixin, self).release(connection)
+
+
+class _CircuitBreakerMixin(object):
+    """Fails fast with :class:`~flask.ext.redis.resilience.CircuitOpenError`
+    instead of handing out a connection while :attr:`breaker` is open. This
+    covers pipelines and every other use of the pool. Once half-open, only
+    the thread running the trial command is handed a connection, as other
+    users of the pool, like pubsub, never report back to :attr:`breaker`.
+    """
+
+    def __init__(self, breaker=None, **kwargs):
+        self.breaker = breaker
+        super(_CircuitBreakerMixin, self).__init__(**kwargs)
+
+    def get_connection(self, command_name, *keys, **options):
+        if self.breaker is not None:
+            self.breaker.check(probe=False)
+        return super(_CircuitBreakerMixin, self).get_connection(
+            command_name, *keys, **options)
+
+
+class ConnectionPool(_CircuitBreakerMixin, _IdleTimeoutMixin,
+                     redis.ConnectionPool):
+    """:class:`redis.ConnectionPool` honouring ``REDIS_IDLE_TIMEOUT`` and
+    ``REDIS_CIRCUIT_BREAKER_THRESHOLD``."""
+
+
+class BlockingConnectionPool(_CircuitBreakerMixin, _IdleTimeoutMixin,
+                             redis.BlockingConnectionPool):
+    """:class:`redis.BlockingConnectionPool` honouring
+    ``REDIS_IDLE_TIMEOUT`` and ``REDIS_CIRCUIT_BREAKER_THRESHOLD``."""
+
+
+class SentinelConnectionPool(_CircuitBreakerMixin, _IdleTimeoutMixin,
+                             redis.sentinel.SentinelConnectionPool):
+    """:class:`redis.sentinel.SentinelConnectionPool` honouring
+    ``REDIS_IDLE_TIMEOUT`` and ``REDIS_CIRCUIT_BREAKER_THRESHOLD``."""
+
+
+class BlockingSentinelConnectionPool(_CircuitBreakerMixin,
+                                     _IdleTimeoutMixin,
+                                     redis.sentinel.SentinelConnectionPool,
+                                     redis.BlockingConnectionPool):
+    """:class:`redis.sentinel.SentinelConnectionPool` blocking like
+    :class:`redis.BlockingConnectionPool` when all connections are in use,
+    for ``REDIS_BLOCKING_POOL``."""
+
+    def disconnect(self, inuse_connections=True):
+        """Disconnects the connections of the pool. The sentinel proxy
+        passes `inuse_connections` as False when the master moved, leaving
+        connections in use to be dropped once they are released.
+        """
+        if inuse_connections:
+            return super(BlockingSentinelConnectionPool, self).disconnect()
+        self._checkpid()
+        for connection in list(self.pool.queue):
+            if connection is not None:
+                connection.disconnect()
+
+
+class _ResilientInstrumentedPipeline(ResilientPipeline,
+                                     InstrumentedPipeline):
+    """Records executions reported to the circuit breaker."""
+
+
+class _ResilientInstrumentedRedis(ResilientRedis, InstrumentedRedis):
+    """Records every attempt of the commands it retries."""
+    pipeline_class = _ResilientInstrumentedPipeline
+    pipeline = InstrumentedRedis.pipeline
+
+
+def _connection_kwargs(config):
+    return dict(
+        db=config['REDIS_DB'],
+        password=config['REDIS_PASSWORD'],
+        socket_timeout=config['REDIS_SOCKET_TIMEOUT'],
+        socket_connect_timeout=config['REDIS_SOCKET_CONNECT_TIMEOUT'],
+        encoding=config['REDIS_CHARSET'],
+        encoding_errors=config['REDIS_ERRORS'],
+        decode_responses=config['REDIS_DECODE_RESPONSES']
+    )
+
+
+def _pool_kwargs(config, kwargs, name):
+    kwargs['idle_timeout'] = config['REDIS_IDLE_TIMEOUT']
+    if config['REDIS_CIRCUIT_BREAKER_THRESHOLD']:
+        kwargs['breaker'] = CircuitBreaker(
+            config['REDIS_CIRCUIT_BREAKER_THRESHOLD'],
+            config['REDIS_CIRCUIT_BREAKER_TIMEOUT'], name=name)
+    if config['REDIS_BLOCKING_POOL']:
+        # a blocking pool needs an upper bound to block on
+        kwargs['max_connections'] = config['REDIS_MAX_CONNECTIONS'] or 50
+        kwargs['timeout'] = config['REDIS_POOL_TIMEOUT']
+    else:
+        kwargs['max_connections'] = config['REDIS_MAX_CONNECTIONS']
+    return kwargs
+
+
+def _create_pool(config, **endpoint):
+    kwargs = _pool_kwargs(
+        config, _connection_kwargs(config),
+        endpoint.get('unix_socket_path') or '%s:%s' % (
+            endpoint.get('host', config['REDIS_HOST']),
+            endpoint.get('port', config['REDIS_PORT'])))
+    if endpoint.get('unix_socket_path'):
+        kwargs['connection_class'] = redis.UnixDomainSocketConnection
+        kwargs['path'] = endpoint.pop('unix_socket_path')
+    else:
+        endpoint.pop('unix_socket_path', None)
+    kwargs.update(endpoint)
+
+    if config['REDIS_BLOCKING_POOL']:
+        return BlockingConnectionPool(**kwargs)
+    return ConnectionPool(**kwargs)
+
+
+def _create_sentinel_pool(config, is_master):
+    service_name = config['REDIS_SENTINEL_MASTER']
+    kwargs = _pool_kwargs(
+        config, _connection_kwargs(config),
+        '%s (%s)' % (service_name, 'master' if is_master else 'replicas'))
+    sentinel = redis.sentinel.Sentinel(
+        config['REDIS_SENTINELS'],
+        sentinel_kwargs=dict(socket_timeout=config['REDIS_SOCKET_TIMEOUT']))
+
+    if config['REDIS_BLOCKING_POOL']:
+        pool_class = BlockingSentinelConnectionPool
+    else:
+        pool_class = SentinelConnectionPool
+    return pool_class(service_name=service_name, sentinel_manager=sentinel,
+                      is_master=is_master, **kwargs)
+
+
+def create_connection_pool(config):
+    """Creates the connection pool described by the ``REDIS_*`` keys of
+    `config`. A pool given as ``REDIS_CONNECTION_POOL`` is returned as is.
+    With ``REDIS_SENTINELS`` set the pool connects to the current master of
+    ``REDIS_SENTINEL_MASTER`` as discovered by the sentinels.
+
+    Pools of redis-py check the process ID on every checkout and reset
+    themselves after a fork, so a pool created before the server forks its
+    workers never hands inherited sockets to a child. :class:`Redis` resets
+    its pools in the child right after the fork already, including a pool
+    given as ``REDIS_CONNECTION_POOL``.
+
+    :param config: :class:`flask.Config`
+    :type config: dict
+    :rtype: redis.ConnectionPool
+    """
+    if config['REDIS_CONNECTION_POOL'] is not None:
+        return config['REDIS_CONNECTION_POOL']
+    if config['REDIS_SENTINELS']:
+        return _create_sentinel_pool(config, is_master=True)
+    return _create_pool(config, host=config['REDIS_HOST'],
+                        port=config['REDIS_PORT'],
+                        unix_socket_path=config['REDIS_UNIX_SOCKET_PATH'])
+
+
+def get_pool_stats(connection_pool):
+    """Counts the connections of `connection_pool`, a pool of redis-py or
+    one derived from it, in this process.
+
+    :returns: dict of the connections ``in_use`` and ``idle``, those
+              ``created`` overall and the ``max`` allowed, `None` when
+              unlimited
+    """
+    if isinstance(connection_pool, redis.BlockingConnectionPool):
+        created = len(connection_pool._connections)
+        # slots of connections not created yet hold None
+        idle = sum(1 for connection in list(connection_pool.pool.queue)
+                   if connection is not None)
+    else:
+        created = connection_pool._created_connections
+        idle = len(connection_pool._available_connections)
+    max_connections = connection_pool.max_connections
+    if max_connections >= 2 ** 31:
+        max_connections = None
+    return dict(in_use=created - idle, idle=idle, created=created,
+                max=max_connections)
+
+
+def prewarm_pool(connection_pool, connections):
+    """Connects up to `connections` connections of `connection_pool` ahead
+    of the first commands and returns them to the pool, so those commands
+    do not pay for connecting. Connections already idle in the pool count
+    towards `connections`, those in use and the size of the pool limit it.
+
+    :returns: int -- number of connections idle in the pool afterwards
+    """
+    stats = get_pool_stats(connection_pool)
+    if stats['max'] is not None:
+        connections = min(connections, stats['max'] - stats['in_use'])
+    held = []
+    try:
+        for _ in range(connections):
+            # redis-py connects a connection when handing it out
+            held.append(connection_pool.get_connection('PING'))
+    finally:
+        for connection in held:
+            connection_pool.release(connection)
+    return len(held)
+
+
+def create_replica_pools(config):
+    """Creates a connection pool per replica listed in ``REDIS_REPLICAS``,
+    either as ``'host:port'`` or as a dict of ``host``, ``port``, ``db``,
+    ``password`` or ``unix_socket_path`` overriding the settings of the
+    primary. With ``REDIS_SENTINELS`` set no pools are created unless
+    ``REDIS_SENTINEL_READ_REPLICAS`` is set, in which case a single pool
+    balancing over the replicas discovered by the sentinels is returned.
+
+    :param config: :class:`flask.Config`
+    :type config: dict
+    :rtype: list of :class:`redis.ConnectionPool`
+    """
+    if config['REDIS_SENTINELS']:
+        if not config['REDIS_SENTINEL_READ_REPLICAS']:
+            return []
+        return [_create_sentinel_pool(config, is_master=False)]
+
+    return [_create_pool(config, **_parse_endpoint(replica))
+            for replica in config['REDIS_REPLICAS']]
+
+
+def create_cluster(config):
+    """Creates a :class:`redis.cluster.RedisCluster` discovering the cluster
+    from the nodes listed in ``REDIS_CLUSTER_NODES``, given like the entries
+    of ``REDIS_REPLICAS``. Requires redis-py 4.1 or later.
+
+    :param config: :class:`flask.Config`
+    :type config: dict
+    :rtype: redis.cluster.RedisCluster
+    """
+    from redis.cluster import ClusterNode, RedisCluster
+
+    kwargs = _connection_kwargs(config)
+    # clusters only have database 0
+    del kwargs['db']
+    if config['REDIS_MAX_CONNECTIONS'] is not None:
+        kwargs['max_connections'] = config['REDIS_MAX_CONNECTIONS']
+    nodes = []
+    for node in config['REDIS_CLUSTER_NODES']:
+        node = _parse_endpoint(node)
+        nodes.append(ClusterNode(node['host'], node.get('port', 6379)))
+    return RedisCluster(startup_nodes=nodes, **kwargs)
+
+
+#: Settings selecting the server, which binds do not inherit from the
+#: application.
+_ENDPOINT_DEFAULTS = dict(
+    REDIS_HOST='localhost', REDIS_PORT=6379, REDIS_DB=0, REDIS_PASSWORD=None,
+    REDIS_UNIX_SOCKET_PATH=None, REDIS_CONNECTION_POOL=None,
+    REDIS_SENTINELS=[], REDIS_SENTINEL_MASTER='mymaster',
+    REDIS_CLUSTER_NODES=[])
+
+
+def bind_config(config, bind):
+    """Returns the ``REDIS_*`` settings of an entry of ``REDIS_BINDS``,
+    either ``'host:port'`` or a dict of settings named with or without the
+    ``REDIS_`` prefix, e.g. ``{'host': 'cache.local', 'db': 1}``. Settings
+    of the server default to those of a fresh application, settings of the
+    pool such as timeouts or REDIS_MAX_CONNECTIONS to those of `config`.
+
+    :param config: :class:`flask.Config`
+    :type config: dict
+    :rtype: dict
+    """
+    settings = dict((key, value) for key, value in config.items()
+                    if key.startswith('REDIS_'))
+    settings.update(_ENDPOINT_DEFAULTS)
+    for key, value in _parse_endpoint(bind).items():
+        key = key.upper()
+        if not key.startswith('REDIS_'):
+            key = 'REDIS_' + key
+        settings[key] = value
+    return settings
+
+
+def _parse_endpoint(endpoint):
+    if isinstance(endpoint, dict):
+        return dict(endpoint)
+    host, port = endpoint.rsplit(':', 1)
+    return dict(host=host, port=int(port))
+
+
+#: Commands which never modify data and are therefore sent to a replica
+#: when replicas are configured.
+READ_ONLY_COMMANDS = frozenset([
+    'bitcount', 'bitpos', 'dbsize', 'dump', 'exists', 'geodist', 'geohash',
+    'geopos', 'get', 'getbit', 'getrange', 'hexists', 'hget', 'hgetall',
+    'hkeys', 'hlen', 'hmget', 'hscan', 'hscan_iter', 'hstrlen', 'hvals',
+    'keys', 'lindex', 'llen', 'lrange', 'mget', 'pfcount', 'pttl',
+    'randomkey', 'scan', 'scan_iter', 'scard', 'sdiff', 'sinter',
+    'sismember', 'smembers', 'srandmember', 'sscan', 'sscan_iter', 'strlen',
+    'sunion', 'ttl', 'type', 'xlen', 'xrange', 'xrevrange', 'zcard',
+    'zcount', 'zlexcount', 'zrange', 'zrangebylex', 'zrangebyscore',
+    'zrank', 'zrevrange', 'zrevrangebylex', 'zrevrangebyscore', 'zrevrank',
+    'zscan', 'zscan_iter', 'zscore'
+])
+
+
+def _after_fork(extension_ref):
+    extension = extension_ref()
+    if extension is not None:
+        extension._after_fork()
+
+
+class _DirectRedis(object):
+    """Proxy of :class:`Redis` which never buffers commands into batches."""
+
+    def __init__(self, extension):
+        self._extension = extension
+
+    def __getattr__(self, item):
+        return getattr(self._extension._connection, item)
+
 
 class Redis(object):
     """This is the main extension class. Pass your :class:`flask.Flask`
@@ -38,6 +409,50 @@ class Redis(object):
         :rtype: None
         """
         self.app = app
+        self._shared_client = None
+        self._routed = False
+        self.connection_pool = None
+        #: :class:`redis.cluster.RedisCluster` in cluster mode, created on
+        #: first use.
+        self.cluster = None
+        self._cluster_config = None
+        self.replica_pools = []
+        #: Connection pools of the binds listed in REDIS_BINDS by name.
+        self.bind_pools = {}
+        self._bind_clusters = {}
+        self._bind_clients = {}
+        self._bind_lock = threading.Lock()
+        self.read_your_writes = True
+        self.retries = 0
+        self.retry_backoff = 0.05
+        self.auto_pipeline = False
+        #: :class:`~flask.ext.redis.tracking.TrackingCache` when REDIS_CACHE
+        #: is enabled.
+        self.cache = None
+        #: Proxy executing commands immediately, even within a batch.
+        self.direct = _DirectRedis(self)
+        #: :class:`~flask.ext.redis.caching.Cache` behind :meth:`cached` and
+        #: :meth:`memoize`.
+        self.caching = Cache(self.direct)
+        #: :class:`~flask.ext.redis.ratelimit.RateLimiter` behind
+        #: :meth:`rate_limit`.
+        self.rate_limiter = RateLimiter(self.direct)
+        #: :class:`~flask.ext.redis.messaging.Dispatcher` running the
+        #: handlers of :meth:`subscribe` and :meth:`consume`.
+        self.dispatcher = Dispatcher(self)
+        #: :class:`~flask.ext.redis.tasks.TaskQueue` behind :meth:`task`.
+        self.tasks = TaskQueue(self)
+        #: :class:`~flask.ext.redis.instrumentation.Instrumentation` when
+        #: REDIS_INSTRUMENTATION is enabled.
+        self.instrumentation = None
+        #: Connections opened per pool by :meth:`prewarm` by default.
+        self.pool_prewarm = 0
+        self._bind_prewarm = {}
+        self._aio = None
+        if hasattr(os, 'register_at_fork'):
+            # referenced weakly, as hooks cannot be unregistered
+            os.register_at_fork(after_in_child=functools.partial(
+                _after_fork, weakref.ref(self)))
         if app is not None:
             self.init_app(app)
 
@@ -57,9 +472,107 @@ class Redis(object):
         listening on 127.0.0.1:6379 using DB index 0 when not specified
         differently.
 
+        The connection pool is created once here and shared by all
+        application contexts, which only borrow connections from it for the
+        duration of a command. Its size is limited by REDIS_MAX_CONNECTIONS;
+        with REDIS_BLOCKING_POOL set to True a context waits up to
+        REDIS_POOL_TIMEOUT seconds for a free connection instead of failing.
+        Connections idle for longer than REDIS_IDLE_TIMEOUT seconds are
+        re-established before use. REDIS_POOL_PREWARM connections of each
+        pool are opened at start and again in each process forked off,
+        e.g. by a preforking server, see :meth:`prewarm`.
+
+        When Redis becomes unavailable, REDIS_CIRCUIT_BREAKER_THRESHOLD
+        consecutive connection failures make every pool fail fast for
+        REDIS_CIRCUIT_BREAKER_TIMEOUT seconds, and idempotent commands are
+        retried up to REDIS_RETRIES times with a jittered backoff starting at
+        REDIS_RETRY_BACKOFF seconds, see :mod:`flask.ext.redis.resilience`.
+        REDIS_SOCKET_CONNECT_TIMEOUT limits the time spent connecting
+        separately from REDIS_SOCKET_TIMEOUT.
+
+        Read-only commands are sent to one of the replicas listed in
+        REDIS_REPLICAS, picked per application context, while all other
+        commands and sessions use the primary. REDIS_SENTINELS, a list of
+        (host, port) pairs, makes the extension discover the primary of the
+        REDIS_SENTINEL_MASTER service instead; its replicas only serve reads
+        with REDIS_SENTINEL_READ_REPLICAS set, as they may lag behind. Unless
+        REDIS_READ_YOUR_WRITES is set to False, reads following a write in
+        the same context are sent to the primary.
+
+        REDIS_CLUSTER_NODES switches to Redis Cluster: the extension proxies
+        a single :class:`redis.cluster.RedisCluster` discovering the cluster
+        from the listed nodes, and session keys carry the session ID as hash
+        tag so all keys of a session share a slot. Replicas and the tracking
+        cache are not available in this mode.
+
+        REDIS_BINDS maps names to further servers, e.g. to isolate the load
+        of sessions, caches and queues::
+
+            REDIS_BINDS = {'cache': {'host': 'cache.local', 'db': 1},
+                           'sessions': 'sessions.local:6379'}
+
+        Each bind gets its own pool created here, see :func:`bind_config`
+        for its settings, and is reached through :meth:`bind`.
+
+        With REDIS_AUTO_PIPELINE set to True the commands a view issues are
+        buffered as by :meth:`batch` and return
+        :class:`~flask.ext.redis.batch.LazyResult` objects. The batch is
+        flushed on first access to a result and at the latest after the
+        view returned.
+
+        REDIS_CACHE enables :attr:`cache`, an in-process cache of up to
+        REDIS_CACHE_MAX_SIZE replies of hot keys which is invalidated by the
+        server, see :mod:`flask.ext.redis.tracking`. REDIS_CACHE_TTL limits
+        the age of cached replies.
+
+        REDIS_INSTRUMENTATION records name, keys, payload bytes and latency
+        of every command in :attr:`instrumentation` and passes them on to the
+        sinks listed in REDIS_INSTRUMENTATION_SINKS, see
+        :mod:`flask.ext.redis.instrumentation`. The aggregates are served in
+        the Prometheus text format at the URL rule REDIS_METRICS_ENDPOINT if
+        set. REDIS_STATS_HEADER, enabled in debug mode by default, adds the
+        commands a request sent up to the end of the view as X-Redis-Stats
+        response header. Commands sent in cluster mode are not recorded.
+
+        Responses and results cached by :meth:`cached` and :meth:`memoize`
+        are stored below REDIS_CACHING_PREFIX, the counters of
+        :meth:`rate_limit` below REDIS_RATELIMIT_PREFIX. REDIS_CACHING_BIND
+        names the bind storing them.
+
+        Handlers registered with :meth:`subscribe` and :meth:`consume` run
+        in background threads started by the first request of each process,
+        unless REDIS_DISPATCHER_AUTOSTART is set to False, see
+        :mod:`flask.ext.redis.messaging`.
+
+        Jobs of :meth:`task` are stored below REDIS_TASK_PREFIX, serialized
+        with REDIS_TASK_SERIALIZER, in the bind named by REDIS_TASK_BIND if
+        set, and run by ``flask redis-worker``, see
+        :mod:`flask.ext.redis.tasks`.
+
         Additionally applies server-side sessions when REDIS_SESSION is set
-        to True in the configuration. See :mod:`flask.ext.redis.session`
-        for more info.
+        to True in the configuration. Unmodified sessions only get their
+        expiration time refreshed, which can be turned off with
+        REDIS_SESSION_REFRESH_EACH_REQUEST or throttled to once every
+        REDIS_SESSION_REFRESH_INTERVAL seconds. REDIS_SESSION_SERIALIZER
+        names the serializer used to store sessions. Serialized sessions of at
+        least REDIS_SESSION_COMPRESSION_THRESHOLD bytes are compressed with
+        REDIS_SESSION_COMPRESSION ('zlib', 'lz4' or 'zstd') at
+        REDIS_SESSION_COMPRESSION_LEVEL when set. With REDIS_SESSION_STORAGE
+        set to 'hash' each session is stored as a hash and only changed keys
+        are written; REDIS_SESSION_LAZY additionally defers fetching each
+        value until it is accessed. Session IDs are generated from
+        REDIS_SESSION_SID_BYTES random bytes when a new session is saved with
+        data for the first time. REDIS_SESSION_USER_KEY names the session
+        key holding the user ID by which sessions are indexed, which lets
+        ``flask redis-sessions purge --user`` log a user out everywhere.
+        REDIS_SESSION_BIND names the bind storing sessions. While Redis is
+        unavailable, REDIS_SESSION_FALLBACK set to 'empty' serves empty
+        sessions which are not saved, 'cookie' keeps sessions in a signed
+        cookie until Redis is back, instead of failing the request.
+        REDIS_SESSION_LOCAL_CACHE keeps up to that many decompressed sessions
+        per process, validated by a version stamp fetched instead of the
+        session, for string storage only. See
+        :mod:`flask.ext.redis.session` for more info.
 
         :param app: :class:`flask.Flask`
         :type app: flask.Flask
@@ -69,17 +582,173 @@ class Redis(object):
         app.config.setdefault('REDIS_DB', 0)
         app.config.setdefault('REDIS_PASSWORD', None)
         app.config.setdefault('REDIS_SOCKET_TIMEOUT', None)
+        app.config.setdefault('REDIS_SOCKET_CONNECT_TIMEOUT', None)
         app.config.setdefault('REDIS_CONNECTION_POOL', None)
         app.config.setdefault('REDIS_CHARSET', 'utf-8')
         app.config.setdefault('REDIS_ERRORS', 'strict')
         app.config.setdefault('REDIS_DECODE_RESPONSES', False)
         app.config.setdefault('REDIS_UNIX_SOCKET_PATH', None)
+        app.config.setdefault('REDIS_MAX_CONNECTIONS', None)
+        app.config.setdefault('REDIS_BLOCKING_POOL', False)
+        app.config.setdefault('REDIS_POOL_TIMEOUT', 20)
+        app.config.setdefault('REDIS_IDLE_TIMEOUT', None)
+        app.config.setdefault('REDIS_POOL_PREWARM', 0)
+        app.config.setdefault('REDIS_CIRCUIT_BREAKER_THRESHOLD', None)
+        app.config.setdefault('REDIS_CIRCUIT_BREAKER_TIMEOUT', 30)
+        app.config.setdefault('REDIS_RETRIES', 0)
+        app.config.setdefault('REDIS_RETRY_BACKOFF', 0.05)
+        app.config.setdefault('REDIS_REPLICAS', [])
+        app.config.setdefault('REDIS_SENTINELS', [])
+        app.config.setdefault('REDIS_SENTINEL_MASTER', 'mymaster')
+        app.config.setdefault('REDIS_SENTINEL_READ_REPLICAS', False)
+        app.config.setdefault('REDIS_READ_YOUR_WRITES', True)
+        app.config.setdefault('REDIS_CLUSTER_NODES', [])
+        app.config.setdefault('REDIS_BINDS', {})
+        app.config.setdefault('REDIS_AUTO_PIPELINE', False)
+        app.config.setdefault('REDIS_CACHE', False)
+        app.config.setdefault('REDIS_CACHE_MAX_SIZE', 1024)
+        app.config.setdefault('REDIS_CACHE_TTL', None)
+        app.config.setdefault('REDIS_CACHING_PREFIX', 'cache:')
+        app.config.setdefault('REDIS_CACHING_BIND', None)
+        app.config.setdefault('REDIS_RATELIMIT_PREFIX', 'ratelimit:')
+        app.config.setdefault('REDIS_DISPATCHER_AUTOSTART', True)
+        app.config.setdefault('REDIS_TASK_PREFIX', 'tasks:')
+        app.config.setdefault('REDIS_TASK_SERIALIZER', 'pickle')
+        app.config.setdefault('REDIS_TASK_BIND', None)
+        app.config.setdefault('REDIS_INSTRUMENTATION', False)
+        app.config.setdefault('REDIS_INSTRUMENTATION_SINKS', [])
+        app.config.setdefault('REDIS_METRICS_ENDPOINT', None)
+        app.config.setdefault('REDIS_STATS_HEADER', None)
 
         app.config.setdefault('REDIS_SESSION', False)
+        app.config.setdefault('REDIS_SESSION_REFRESH_EACH_REQUEST', True)
+        app.config.setdefault('REDIS_SESSION_REFRESH_INTERVAL', None)
+        app.config.setdefault('REDIS_SESSION_SERIALIZER', 'pickle')
+        app.config.setdefault('REDIS_SESSION_COMPRESSION', None)
+        app.config.setdefault('REDIS_SESSION_COMPRESSION_LEVEL', None)
+        app.config.setdefault('REDIS_SESSION_COMPRESSION_THRESHOLD', 1024)
+        app.config.setdefault('REDIS_SESSION_STORAGE', 'string')
+        app.config.setdefault('REDIS_SESSION_LAZY', False)
+        app.config.setdefault('REDIS_SESSION_SID_BYTES', 24)
+        app.config.setdefault('REDIS_SESSION_USER_KEY', None)
+        app.config.setdefault('REDIS_SESSION_BIND', None)
+        app.config.setdefault('REDIS_SESSION_FALLBACK', None)
+        app.config.setdefault('REDIS_SESSION_LOCAL_CACHE', 0)
+
+        if self.app is None:
+            self.app = app
+        if app.config['REDIS_CLUSTER_NODES']:
+            if app.config['REDIS_CACHE'] or app.config['REDIS_REPLICAS']:
+                raise ValueError('REDIS_CACHE and REDIS_REPLICAS are not '
+                                 'supported with REDIS_CLUSTER_NODES')
+            self._cluster_config = app.config
+        else:
+            self.connection_pool = create_connection_pool(app.config)
+            self.replica_pools = create_replica_pools(app.config)
+        self._shared_client = None
+        self.bind_pools = {}
+        self._bind_clusters = {}
+        self._bind_prewarm = {}
+        for name, bind in app.config['REDIS_BINDS'].items():
+            config = bind_config(app.config, bind)
+            if config['REDIS_CLUSTER_NODES']:
+                self._bind_clusters[name] = config
+            else:
+                self.bind_pools[name] = create_connection_pool(config)
+                self._bind_prewarm[name] = config['REDIS_POOL_PREWARM']
+        self.pool_prewarm = app.config['REDIS_POOL_PREWARM']
+        self.read_your_writes = app.config['REDIS_READ_YOUR_WRITES']
+        self.retries = app.config['REDIS_RETRIES']
+        self.retry_backoff = app.config['REDIS_RETRY_BACKOFF']
+        self.auto_pipeline = app.config['REDIS_AUTO_PIPELINE']
+        if app.config['REDIS_INSTRUMENTATION']:
+            self.instrumentation = Instrumentation(
+                app.config['REDIS_INSTRUMENTATION_SINKS'])
+            stats_header = app.config['REDIS_STATS_HEADER']
+            if stats_header is None:
+                stats_header = app.debug
+            app.before_request(self._start_request_stats)
+            if stats_header:
+                # registered first so it runs after the batch is flushed
+                app.after_request(self._add_stats_header)
+            if app.config['REDIS_METRICS_ENDPOINT']:
+                app.add_url_rule(app.config['REDIS_METRICS_ENDPOINT'],
+                                 'redis_metrics', self._metrics)
+        # created up front, as clients of binds are shared by all threads
+        self._bind_clients = self._create_bind_clients()
+        self.caching.prefix = app.config['REDIS_CACHING_PREFIX']
+        caching_bind = app.config['REDIS_CACHING_BIND']
+        self.caching.redis = self.direct if caching_bind is None else \
+            self.bind(caching_bind)
+        self.rate_limiter.prefix = app.config['REDIS_RATELIMIT_PREFIX']
+        self.tasks.prefix = app.config['REDIS_TASK_PREFIX']
+        self.tasks.serializer = app.config['REDIS_TASK_SERIALIZER']
+        task_bind = app.config['REDIS_TASK_BIND']
+        if task_bind is None:
+            self.tasks.redis = self
+            self.tasks.connection_pool = self.connection_pool
+        else:
+            self.tasks.redis = self.bind(task_bind)
+            self.tasks.connection_pool = self.bind_pools.get(task_bind)
+        self._routed = bool(self.replica_pools) or \
+            self.instrumentation is not None
+        if self.auto_pipeline:
+            app.before_request(self._start_batch)
+            app.after_request(self._flush_batch)
+        if app.config['REDIS_DISPATCHER_AUTOSTART']:
+            app.before_request(self.dispatcher.ensure_started)
+        if app.config['REDIS_CACHE']:
+            self.cache = TrackingCache(self.connection_pool,
+                                       app.config['REDIS_CACHE_MAX_SIZE'],
+                                       app.config['REDIS_CACHE_TTL'])
 
         if app.config.get('REDIS_SESSION'):
-            from session import RedisSessionInterface
-            app.session_interface = RedisSessionInterface(self)
+            from .compression import get_compressor
+            from .session import (LocalSessionCache, RedisSessionInterface,
+                                  RedisHashSessionInterface)
+            session_bind = app.config['REDIS_SESSION_BIND']
+            if session_bind is None:
+                client = self.direct
+                hash_tags = self._cluster_config is not None
+            else:
+                client = self.bind(session_bind)
+                hash_tags = session_bind in self._bind_clusters
+            kwargs = dict(
+                serializer=app.config['REDIS_SESSION_SERIALIZER'],
+                compressor=get_compressor(
+                    app.config['REDIS_SESSION_COMPRESSION'],
+                    app.config['REDIS_SESSION_COMPRESSION_LEVEL']),
+                compression_threshold=app.config[
+                    'REDIS_SESSION_COMPRESSION_THRESHOLD'],
+                hash_tags=hash_tags,
+                sid_bytes=app.config['REDIS_SESSION_SID_BYTES'],
+                user_key=app.config['REDIS_SESSION_USER_KEY'],
+                fallback=app.config['REDIS_SESSION_FALLBACK']
+            )
+            local_cache = app.config['REDIS_SESSION_LOCAL_CACHE']
+            if app.config['REDIS_SESSION_STORAGE'] == 'hash':
+                if local_cache:
+                    raise ValueError('REDIS_SESSION_LOCAL_CACHE is not '
+                                     'supported with hash storage')
+                app.session_interface = RedisHashSessionInterface(
+                    client, lazy=app.config['REDIS_SESSION_LAZY'], **kwargs)
+            else:
+                if local_cache:
+                    kwargs['local_cache'] = LocalSessionCache(local_cache)
+                app.session_interface = RedisSessionInterface(client,
+                                                              **kwargs)
+            if hasattr(app, 'cli'):
+                from .cli import sessions
+                app.cli.add_command(sessions)
+
+        if self.pool_prewarm or any(self._bind_prewarm.values()):
+            self._prewarm_quietly()
+
+        if hasattr(app, 'extensions'):
+            app.extensions['redis'] = self
+        if hasattr(app, 'cli'):
+            from .cli import worker
+            app.cli.add_command(worker)
 
         if hasattr(app, 'teardown_appcontext'):
             app.teardown_appcontext(self._teardown)
@@ -87,52 +756,570 @@ class Redis(object):
             app.teardown_request(self._teardown)
 
     def _teardown(self, exception):
-        """Closes redis connection on application teardown.
+        """Drops the redis instance of the application context. Its
+        connections already went back to the shared pool and stay open for
+        the next context. Commands still buffered in a batch are sent.
 
         :param exception:
         :return:
         """
-        context = connection_stack.top
+        context = _current_context()
         if context is not None:
-            if hasattr(context, 'redis'):
-                context.redis.connection_pool.disconnect()
+            batch = getattr(context, 'redis_batch', None)
+            if batch is not None:
+                del context.redis_batch
+                batch.flush(raise_on_error=False)
+            stats = getattr(context, 'redis_stats', None)
+            if stats is not None and stats.round_trips:
+                self.instrumentation.record_request(stats)
+            for name in ('redis', 'redis_replica', 'redis_wrote',
+                         'redis_stats'):
+                if hasattr(context, name):
+                    delattr(context, name)
+
+    def _start_request_stats(self):
+        # sessions are opened before the URL is matched
+        from flask import request
+        self._request_stats.endpoint = request.endpoint
+
+    def _add_stats_header(self, response):
+        stats = getattr(_current_context(), 'redis_stats', None)
+        if stats is not None:
+            response.headers['X-Redis-Stats'] = stats.header_value()
+        return response
+
+    def _metrics(self):
+        from flask import current_app
+        text = self.instrumentation.render_prometheus()
+        cache = getattr(current_app.session_interface, 'local_cache', None)
+        if cache is not None:
+            stats = cache.stats()
+            lines = ['# TYPE flask_redis_session_cache_lookups_total counter']
+            for result in ('hits', 'misses', 'stale'):
+                lines.append('flask_redis_session_cache_lookups_total'
+                             '{result="%s"} %d' % (result, stats[result]))
+            lines.append('# TYPE flask_redis_session_cache_size gauge')
+            lines.append('flask_redis_session_cache_size %d' % stats['size'])
+            text += '\n'.join(lines) + '\n'
+        pools = self.pool_stats()
+        if pools:
+            lines = ['# TYPE flask_redis_pool_connections gauge']
+            for name, stats in sorted(pools.items()):
+                for state in ('in_use', 'idle'):
+                    lines.append('flask_redis_pool_connections'
+                                 '{pool="%s",state="%s"} %d'
+                                 % (name, state, stats[state]))
+            lines.append('# TYPE flask_redis_pool_max_connections gauge')
+            for name, stats in sorted(pools.items()):
+                if stats['max'] is not None:
+                    lines.append('flask_redis_pool_max_connections'
+                                 '{pool="%s"} %d' % (name, stats['max']))
+            text += '\n'.join(lines) + '\n'
+        return current_app.response_class(
+            text, mimetype='text/plain; version=0.0.4')
+
+    def _start_batch(self):
+        context = _current_context()
+        context.redis_batch = Batch(self._connection)
+
+    def _flush_batch(self, response):
+        context = _current_context()
+        batch = getattr(context, 'redis_batch', None)
+        if batch is not None:
+            del context.redis_batch
+            batch.flush()
+        return response
+
+    def batch(self):
+        """Returns a :class:`~flask.ext.redis.batch.Batch` buffering
+        commands into a pipeline. Within a ``with`` block the commands issued
+        on `self` are buffered as well::
+
+            with redis.batch():
+                user = redis.hgetall('user:1')
+                visits = redis.incr('visits')
+            return render_template('user.html', user=user.value,
+                                   visits=visits.value)
+
+        :rtype: flask.ext.redis.batch.Batch
+        """
+        context = _current_context()
+        if context is None:
+            return Batch(self._connect())
+        return Batch(self._connection, context)
+
+    @property
+    def connection_pool(self):
+        """The pool shared by all application contexts, see
+        :func:`create_connection_pool`.
+
+        :rtype: redis.ConnectionPool
+        """
+        return self._connection_pool
+
+    @connection_pool.setter
+    def connection_pool(self, connection_pool):
+        self._connection_pool = connection_pool
+        self._shared_client = None
+
+    def _pools(self):
+        """Lists the connection pools of the primary, the replicas and the
+        binds by name, leaving out those of Redis Cluster.
+
+        :returns: list of tuples of the name and the pool
+        """
+        pools = []
+        if self.connection_pool is not None:
+            pools.append(('primary', self.connection_pool))
+        for index, pool in enumerate(self.replica_pools):
+            pools.append(('replica:%d' % index, pool))
+        for name, pool in sorted(self.bind_pools.items()):
+            pools.append(('bind:' + name, pool))
+        return pools
+
+    def pool_stats(self):
+        """Counts the connections of each pool in this process, see
+        :func:`get_pool_stats`. Pools are named ``'primary'``,
+        ``'replica:0'`` and so on, and ``'bind:'`` followed by the name of
+        the bind.
+
+        :rtype: dict
+        """
+        return dict((name, get_pool_stats(pool))
+                    for name, pool in self._pools())
+
+    def prewarm(self, connections=None):
+        """Opens `connections` connections of each pool, REDIS_POOL_PREWARM
+        by default or the setting of the bind, so the first requests served
+        do not wait for connecting. Runs when the application is set up and
+        again in the child after a fork; with a preforking server on Python
+        2, call it from a post-fork hook such as gunicorn's ``post_fork``.
+
+        :param connections: int -- connections per pool
+        :returns: int -- number of connections idle in the pools
+        """
+        count = 0
+        for name, pool in self._pools():
+            if connections is not None:
+                wanted = connections
+            elif name.startswith('bind:'):
+                wanted = self._bind_prewarm.get(name[5:], 0)
+            else:
+                wanted = self.pool_prewarm
+            if wanted:
+                count += prewarm_pool(pool, wanted)
+        return count
+
+    def _prewarm_quietly(self):
+        try:
+            self.prewarm()
+        except redis.RedisError:
+            logger.warning('Pre-warming the Redis connection pools failed',
+                           exc_info=True)
+
+    def _after_fork(self):
+        """Drops the connections and clients inherited from the parent in
+        the child after a fork, so no socket is shared by two processes,
+        and pre-warms the pools again in the background.
+
+        redis-py pools notice a new process on their next use as well, but
+        only once the lock guarding them is free, which a thread of the
+        parent may have held at the time of the fork. Connections are not
+        closed, which would shut them down for the parent too.
+        """
+        for name, pool in self._pools():
+            reset = getattr(pool, 'reset', None)
+            if reset is not None:
+                reset()
+        self._shared_client = None
+        # the nodes of clusters are discovered anew
+        self.cluster = None
+        self._bind_clients = self._create_bind_clients()
+        if self.pool_prewarm or any(self._bind_prewarm.values()):
+            thread = threading.Thread(target=self._prewarm_quietly,
+                                      name='flask-redis-prewarm')
+            thread.daemon = True
+            thread.start()
 
     def _connect(self):
+        """Returns the client shared by all application contexts and code
+        running outside of them, created on first use. Clients hold no state
+        of their own besides their pool, so sharing one is safe.
+
+        :raises RuntimeError: when :meth:`init_app` was not called yet
+        :rtype: redis.StrictRedis
         """
+        client = self._shared_client
+        if client is None:
+            if self.connection_pool is None and \
+                    self._cluster_config is None:
+                raise RuntimeError('flask.ext.redis.Redis is not initialised, '
+                                   'call init_app() first')
+            if self._cluster_config is not None:
+                if self.cluster is None:
+                    # connects to the cluster nodes, so deferred until needed
+                    self.cluster = create_cluster(self._cluster_config)
+                client = self.cluster
+            else:
+                client = self._create_client(self.connection_pool)
+            self._shared_client = client
+        return client
+
+    def bind(self, name):
+        """Returns the client of the bind `name` listed in REDIS_BINDS,
+        shared by all threads::
+
+            redis.bind('cache').get('greeting')
 
+        Clients of binds are created by :meth:`init_app`, except those of
+        cluster binds, which connect to the cluster and are therefore
+        created on first use.
+
+        Commands of binds are neither buffered into batches nor routed to
+        replicas. With instrumentation enabled they are recorded, but not
+        counted into the stats of the request.
+
+        :param name: str
         :rtype: redis.StrictRedis
         """
-        return redis.StrictRedis(
-            host=self.app.config['REDIS_HOST'],
-            port=self.app.config['REDIS_PORT'],
-            db=self.app.config['REDIS_DB'],
-            password=self.app.config['REDIS_PASSWORD'],
-            socket_timeout=self.app.config['REDIS_SOCKET_TIMEOUT'],
-            connection_pool=self.app.config['REDIS_CONNECTION_POOL'],
-            charset=self.app.config['REDIS_CHARSET'],
-            errors=self.app.config['REDIS_ERRORS'],
-            decode_responses=self.app.config['REDIS_DECODE_RESPONSES'],
-            unix_socket_path=self.app.config['REDIS_UNIX_SOCKET_PATH']
-        )
+        client = self._bind_clients.get(name)
+        if client is None:
+            if name not in self._bind_clusters:
+                raise KeyError('No Redis bind named %r in REDIS_BINDS'
+                               % (name,))
+            with self._bind_lock:
+                client = self._bind_clients.get(name)
+                if client is None:
+                    client = create_cluster(self._bind_clusters[name])
+                    self._bind_clients[name] = client
+        return client
+
+    def _create_bind_clients(self):
+        """Creates the clients of the binds with a connection pool.
+
+        :returns: dict of clients by the name of their bind
+        """
+        return dict((name, self._create_client(pool))
+                    for name, pool in self.bind_pools.items())
+
+    def _create_client(self, connection_pool, request_stats=None):
+        """Creates a client of `connection_pool`, recording its commands
+        when instrumentation is enabled and reporting failures to the
+        circuit breaker of the pool or retrying idempotent commands when
+        configured.
+
+        :rtype: redis.StrictRedis
+        """
+        kwargs = dict(connection_pool=connection_pool)
+        resilient = self.retries or \
+            getattr(connection_pool, 'breaker', None) is not None
+        if resilient:
+            kwargs.update(retries=self.retries,
+                          retry_backoff=self.retry_backoff)
+        if self.instrumentation is None:
+            if resilient:
+                return ResilientRedis(**kwargs)
+            return redis.StrictRedis(**kwargs)
+        kwargs.update(instrumentation=self.instrumentation,
+                      request_stats=request_stats)
+        if resilient:
+            return _ResilientInstrumentedRedis(**kwargs)
+        return InstrumentedRedis(**kwargs)
+
+    @property
+    def _request_stats(self):
+        """The stats of the application context, created on first use.
+
+        :rtype: flask.ext.redis.instrumentation.RequestStats
+        """
+        context = _current_context()
+        if context is None:
+            return None
+        stats = getattr(context, 'redis_stats', None)
+        if stats is None:
+            from flask import has_request_context, request
+            endpoint = None
+            if has_request_context():
+                endpoint = request.endpoint
+            stats = context.redis_stats = RequestStats(endpoint)
+        return stats
+
+    def cached(self, timeout=300, key_func=None, vary_on=(), tags=(),
+               **options):
+        """Decorator caching view responses, see
+        :meth:`flask.ext.redis.caching.Cache.cached`::
+
+            @app.route('/')
+            @redis.cached(timeout=60, vary_on=['Accept-Language'])
+            def index():
+                ...
+        """
+        return self.caching.cached(timeout, key_func=key_func,
+                                   vary_on=vary_on, tags=tags, **options)
+
+    def memoize(self, timeout=300, tags=(), **options):
+        """Decorator caching function results, see
+        :meth:`flask.ext.redis.caching.Cache.memoize`.
+        """
+        return self.caching.memoize(timeout, tags=tags, **options)
+
+    def invalidate_tags(self, *tags):
+        """Deletes all responses and results cached with any of `tags`."""
+        self.caching.invalidate_tags(*tags)
+
+    def lock(self, name, timeout=None, sleep=0.1, blocking_timeout=None,
+             **kwargs):
+        """Distributed lock on the primary, which is never buffered into a
+        batch::
+
+            with redis.lock('report:%d' % report_id, timeout=60):
+                ...
+
+        Acquired with SET NX PX and released or extended by Lua scripts
+        invoked with EVALSHA, so only the owner of a lock can release it.
+        Takes the arguments of :meth:`redis.StrictRedis.lock`.
+
+        :param timeout: seconds after which the lock expires, `None` keeps
+                        it until released
+        :param sleep: seconds between attempts to acquire the lock
+        :param blocking_timeout: seconds to wait at most for the lock
+        :rtype: redis.lock.Lock
+        """
+        return self.direct.lock(name, timeout=timeout, sleep=sleep,
+                                blocking_timeout=blocking_timeout, **kwargs)
+
+    def rate_limit(self, rate, key=None, algorithm='sliding-window', cost=1,
+                   burst=None, methods=None):
+        """Decorator limiting the rate of requests to a view, see
+        :meth:`flask.ext.redis.ratelimit.RateLimiter.limit`::
+
+            @app.route('/api/search')
+            @redis.rate_limit('100/minute', key=lambda: g.user.id)
+            def search():
+                ...
+        """
+        return self.rate_limiter.limit(rate, key=key, algorithm=algorithm,
+                                       cost=cost, burst=burst,
+                                       methods=methods)
+
+    def subscribe(self, channel, pattern=False):
+        """Decorator registering a handler of the messages published to
+        `channel`, see :meth:`flask.ext.redis.messaging.Dispatcher.subscribe`::
+
+            @redis.subscribe('notifications')
+            def notify(message):
+                ...
+
+        :param channel: str
+        :param pattern: bool -- whether `channel` is a glob-style pattern
+        """
+        return self.dispatcher.subscribe(channel, pattern)
+
+    def consume(self, stream, group, **options):
+        """Decorator registering a handler of the entries of `stream`, read
+        as member of the consumer group `group`, see
+        :class:`flask.ext.redis.messaging.StreamConsumer` for the options::
+
+            @redis.consume('orders', group='billing', batch_size=50)
+            def bill(message_id, fields):
+                ...
+
+        :param stream: str
+        :param group: str
+        """
+        return self.dispatcher.consume(stream, group, **options)
+
+    def task(self, name=None, queue='default', retries=0, retry_delay=10):
+        """Decorator turning a function into a
+        :class:`~flask.ext.redis.tasks.Task` whose calls can be deferred to
+        ``flask redis-worker``::
+
+            @redis.task(queue='mail', retries=3)
+            def send_welcome_mail(user_id):
+                ...
+
+            send_welcome_mail.delay(user.id)
+            send_welcome_mail.apply_async((user.id,), countdown=3600)
+
+        :param name: str -- name of the task, defaults to module and name of
+                     the function
+        :param queue: str -- queue the jobs are pushed to
+        :param retries: int -- repetitions of failed jobs
+        :param retry_delay: seconds before the first repetition, doubled for
+                            each further one
+        """
+        return self.tasks.task(name=name, queue=queue, retries=retries,
+                               retry_delay=retry_delay)
+
+    def send_value(self, key, mimetype='application/octet-stream',
+                   chunk_size=CHUNK_SIZE, prefetch=4, **kwargs):
+        """Returns a response streaming the string or chunked value `key`
+        in chunks, see :mod:`flask.ext.redis.streaming`. Aborts with 404
+        if there is no value::
+
+            return redis.send_value('export:%d' % export_id,
+                                    mimetype='text/csv')
+
+        :param chunk_size: int -- bytes per GETRANGE of string values
+        :param prefetch: int -- chunks fetched per round trip
+        :param kwargs: passed on to the response class
+        :rtype: flask.Response
+        """
+        from flask import abort, current_app
+        from .streaming import open_value
+
+        opened = open_value(self.direct, key, chunk_size, prefetch)
+        if opened is None:
+            abort(404)
+        size, chunks = opened
+        response = current_app.response_class(
+            chunks, mimetype=mimetype, direct_passthrough=True, **kwargs)
+        response.content_length = size
+        return response
+
+    def iter_value(self, key, chunk_size=CHUNK_SIZE, prefetch=4):
+        """Yields the string or chunked value `key` in chunks, see
+        :func:`flask.ext.redis.streaming.iter_value`.
+        """
+        from .streaming import iter_value
+        return iter_value(self.direct, key, chunk_size, prefetch)
+
+    def write_chunked(self, key, fileobj, chunk_size=CHUNK_SIZE, ttl=None,
+                      **kwargs):
+        """Stores the contents of the file-like `fileobj` in chunks,
+        replacing the value of `key` once complete, see
+        :func:`flask.ext.redis.streaming.write_chunked`::
+
+            redis.write_chunked('export:%d' % export_id, request.stream,
+                                ttl=86400)
+
+        :param chunk_size: int -- bytes per chunk
+        :param ttl: seconds the value expires after, `None` to keep it
+        :returns: int -- size of the value
+        """
+        from .streaming import write_chunked
+        return write_chunked(self.direct, key, fileobj, chunk_size,
+                             ttl=ttl, **kwargs)
+
+    @property
+    def aio(self):
+        """asyncio counterpart of this proxy for use in ``async def`` views,
+        see :mod:`flask.ext.redis.aio`::
+
+            user, visits = await asyncio.gather(
+                redis.aio.hgetall('user:1'), redis.aio.incr('visits'))
+
+        :rtype: flask.ext.redis.aio.AsyncRedis
+        """
+        if self._aio is None:
+            from .aio import AsyncRedis
+            self._aio = AsyncRedis(self)
+        return self._aio
+
+    @property
+    def _batch(self):
+        """The batch installed on the application context, if any.
+
+        :rtype: flask.ext.redis.batch.Batch
+        """
+        context = _current_context()
+        if context is not None:
+            return getattr(context, 'redis_batch', None)
+
+    @property
+    def _replica(self):
+        """Picks a replica for the application context on first use.
+        Returns `None` without replicas or when reads have to go to the
+        primary to see the writes of the context.
+
+        :rtype: redis.StrictRedis
+        """
+        context = _current_context()
+        if context is None:
+            return None
+        if self.read_your_writes and getattr(context, 'redis_wrote', False):
+            return None
+        if not hasattr(context, 'redis_replica'):
+            pool = random.choice(self.replica_pools)
+            context.redis_replica = self._create_client(
+                pool, self._request_stats)
+        return context.redis_replica
 
     @property
     def _connection(self):
-        """Calls :meth:`connect` to create a redis instance and stores it
-        to the application context on first use.
+        """The client of the application context: the shared client of
+        :meth:`_connect`, or with instrumentation enabled a client recording
+        into the stats of the context, stored to it on first use. Clusters
+        are not instrumented, so there it is always the shared client.
 
         :rtype: redis.StrictRedis
         """
-        context = connection_stack.top
-        if context is not None:
-            if not hasattr(context, 'redis'):
-                context.redis = self._connect()
-            return context.redis
+        if self.instrumentation is not None and \
+                self._cluster_config is None:
+            context = _current_context()
+            if context is not None:
+                client = getattr(context, 'redis', None)
+                if client is None:
+                    client = context.redis = self._create_client(
+                        self.connection_pool, self._request_stats)
+                return client
+        return self._connect()
+
+    def _route(self, item, context):
+        """Picks the client of the application context `context` to send
+        the command `item` to.
+
+        :rtype: redis.StrictRedis
+        """
+        if self.replica_pools:
+            if item in READ_ONLY_COMMANDS:
+                replica = self._replica
+                if replica is not None:
+                    return replica
+            elif self.read_your_writes:
+                context.redis_wrote = True
+        return self._connection
+
+    def _delegate(self, item):
+        """Creates the method delegating the command `item`. Within a batch
+        commands are buffered, otherwise they are routed by :meth:`_route`
+        when replicas or instrumentation need the application context, or
+        sent by the shared client right away.
+        """
+        def command(*args, **kwargs):
+            context = _current_context()
+            if context is not None:
+                batch = getattr(context, 'redis_batch', None)
+                if batch is not None:
+                    return getattr(batch, item)(*args, **kwargs)
+                if self._routed:
+                    return getattr(self._route(item, context), item)(
+                        *args, **kwargs)
+            client = self._shared_client
+            if client is None:
+                client = self._connect()
+            return getattr(client, item)(*args, **kwargs)
+
+        command.__name__ = item
+        command.__doc__ = getattr(redis.StrictRedis, item, command).__doc__
+        return command
 
     def __getattr__(self, item):
         """Proxy method for redis instance. Allows us to use `self` as
-        replacement for :class:`redis.StrictRedis`
+        replacement for :class:`redis.StrictRedis`, also outside of
+        application contexts. Within a batch commands are buffered, see
+        :meth:`batch`.
+
+        Commands are resolved once: the delegating method created by
+        :meth:`_delegate` is stored on `self`, so later lookups find it
+        without calling this method again.
 
         :type item:
         :rtype:
         """
-        return getattr(self._connection, item)
+        if item.startswith('_'):
+            raise AttributeError(item)
+        if not callable(getattr(self._connect(), item)):
+            return getattr(self._connection, item)
+        command = self.__dict__[item] = self._delegate(item)
+        return command
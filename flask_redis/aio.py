@@ -0,0 +1,227 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.aio
+    ~~~~~~~~~~~~~~~~~~~
+
+    asyncio support based on :mod:`redis.asyncio`, available as
+    :attr:`flask.ext.redis.Redis.aio`::
+
+        @app.route('/dashboard')
+        async def dashboard():
+            user, visits = await asyncio.gather(
+                redis.aio.hgetall('user:1'), redis.aio.incr('visits'))
+
+    Connections of :mod:`redis.asyncio` belong to the event loop they were
+    opened in, so every loop gets its own client and pool configured like
+    the synchronous pool of the extension. Flask runs each async view in a
+    loop of its own, whose pool is disconnected and dropped as the loop
+    shuts down; servers keeping one loop per process reuse the pool across
+    requests.
+
+    Requires Python 3 and redis-py 4.2 or later. Redis Cluster is not
+    supported.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import asyncio
+
+import redis
+import redis.asyncio
+import redis.asyncio.sentinel
+import redis.sentinel
+
+from . import serializers
+from .session import RedisSession, RedisSessionInterface, _float
+
+
+def create_async_connection_pool(pool):
+    """Creates a :class:`redis.asyncio.ConnectionPool` connecting like the
+    synchronous `pool`. For a pool of a Sentinel service an asynchronous
+    Sentinel pool following the same service is created.
+
+    :param pool: :class:`redis.ConnectionPool`
+    :rtype: redis.asyncio.ConnectionPool
+    """
+    kwargs = dict(pool.connection_kwargs)
+    if isinstance(pool, redis.sentinel.SentinelConnectionPool):
+        # refers to the synchronous pool
+        del kwargs['connection_pool']
+        manager = pool.sentinel_manager
+        sentinels = [(sentinel.connection_pool.connection_kwargs['host'],
+                      sentinel.connection_pool.connection_kwargs['port'])
+                     for sentinel in manager.sentinels]
+        return redis.asyncio.sentinel.SentinelConnectionPool(
+            pool.service_name, redis.asyncio.sentinel.Sentinel(
+                sentinels, min_other_sentinels=manager.min_other_sentinels,
+                sentinel_kwargs=manager.sentinel_kwargs),
+            is_master=pool.is_master, check_connection=pool.check_connection,
+            ssl=issubclass(pool.connection_class, redis.SSLConnection),
+            max_connections=pool.max_connections, **kwargs)
+
+    if issubclass(pool.connection_class, redis.UnixDomainSocketConnection):
+        kwargs['connection_class'] = redis.asyncio.UnixDomainSocketConnection
+    elif issubclass(pool.connection_class, redis.SSLConnection):
+        kwargs['connection_class'] = redis.asyncio.SSLConnection
+
+    if isinstance(pool, redis.BlockingConnectionPool):
+        return redis.asyncio.BlockingConnectionPool(
+            max_connections=pool.max_connections, timeout=pool.timeout,
+            **kwargs)
+    return redis.asyncio.ConnectionPool(max_connections=pool.max_connections,
+                                        **kwargs)
+
+
+class AsyncRedis(object):
+    """Proxy of the :class:`redis.asyncio.StrictRedis` of the running event
+    loop. Commands return coroutines.
+    """
+
+    def __init__(self, extension):
+        """
+
+        :param extension: :class:`flask.ext.redis.Redis`
+        """
+        self.extension = extension
+        # by loop, holding the client and the generator closing it
+        self._clients = {}
+
+    @property
+    def client(self):
+        """The client of the running event loop, created on first use.
+
+        The client is disconnected and dropped when the loop shuts down its
+        asynchronous generators, as :func:`asyncio.run` and Flask do before
+        closing a loop. Clients of loops closed otherwise are dropped on the
+        next use of another loop.
+
+        :rtype: redis.asyncio.StrictRedis
+        """
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            if self.extension.connection_pool is None:
+                raise RuntimeError('redis.aio requires a connection pool and '
+                                   'is not supported with '
+                                   'REDIS_CLUSTER_NODES')
+            for other in [other for other in self._clients
+                          if other.is_closed()]:
+                del self._clients[other]
+            pool = create_async_connection_pool(
+                self.extension.connection_pool)
+            client = redis.asyncio.StrictRedis(connection_pool=pool)
+            closer = self._close_with_loop(loop, client)
+            # runs up to its yield, registering it with the loop
+            try:
+                closer.asend(None).send(None)
+            except StopIteration:
+                pass
+            entry = self._clients[loop] = (client, closer)
+        return entry[0]
+
+    async def _close_with_loop(self, loop, client):
+        try:
+            yield
+        finally:
+            if self._clients.get(loop, (None,))[0] is client:
+                del self._clients[loop]
+            await client.connection_pool.disconnect()
+
+    async def disconnect(self):
+        """Closes the connections of the running event loop's pool, e.g.
+        before a loop is shut down without :func:`asyncio.run`.
+        """
+        entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].connection_pool.disconnect()
+
+    def __getattr__(self, item):
+        # an AttributeError raised within the client property must not make
+        # it look up the client again
+        if item == 'client' or item.startswith('_'):
+            raise AttributeError(item)
+        return getattr(self.client, item)
+
+
+class AsyncRedisSessionInterface(RedisSessionInterface):
+    """Variant of :class:`~flask.ext.redis.session.RedisSessionInterface`
+    with coroutine :meth:`open_session` and :meth:`save_session`, as
+    expected by asyncio frameworks sharing Flask's session interface such as
+    Quart. Pass an :class:`AsyncRedis` or
+    :class:`redis.asyncio.StrictRedis` as `redis`. Storage is compatible with
+    the synchronous interface, including the version stamps of a
+    `local_cache`.
+    """
+
+    async def open_session(self, app, request):
+        """Coroutine version of
+        :meth:`RedisSessionInterface.open_session`.
+
+        :returns: RedisSession
+        """
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            if self.local_cache is None:
+                data, refreshed_at = await self._fetch(app, sid)
+            else:
+                data, refreshed_at = await self._fetch_cached(app, sid)
+            if data is not None:
+                return self._opened(RedisSession(data, sid=sid,
+                                                 refreshed_at=refreshed_at))
+        return RedisSession(new=True)
+
+    async def _fetch(self, app, sid):
+        key = self.get_redis_key(sid)
+        refreshed_at = None
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            val, refreshed_at = await self.redis.mget(
+                key, self.get_redis_key(sid, 'refreshed'))
+        else:
+            val = await self.redis.get(key)
+        if val is None:
+            return None, None
+        return self.load_value(val), _float(refreshed_at)
+
+    async def _fetch_cached(self, app, sid):
+        keys = self._version_keys(app, sid)
+        if self.local_cache.lookup(sid):
+            if len(keys) > 1:
+                version, refreshed_at = await self.redis.mget(keys)
+            else:
+                version, refreshed_at = await self.redis.get(keys[0]), None
+            data = self.local_cache.get(sid, version)
+            if data is not None:
+                return serializers.loads(data), _float(refreshed_at)
+        return self._cache_fetched(
+            sid, await self.redis.mget([self.get_redis_key(sid)] + keys))
+
+    async def save_session(self, app, session, response):
+        """Coroutine version of
+        :meth:`RedisSessionInterface.save_session`.
+
+        :returns: None
+        """
+        if not session:
+            if not session.new:
+                await self.redis.delete(*self._deleted_keys(app, session))
+                if session.indexed_user is not None:
+                    await self.redis.srem(
+                        self.get_user_index_key(session.indexed_user),
+                        session.sid)
+                    session.indexed_user = None
+            if session.modified:
+                response.delete_cookie(app.session_cookie_name,
+                                       domain=self.get_cookie_domain(app))
+            return
+
+        if not session.modified:
+            if not self.should_refresh_session(app, session):
+                return
+        pipe = self.redis.pipeline(transaction=False)
+        saved = self._queue_save(app, session, pipe)
+        await pipe.execute()
+        self._saved(session, *saved)
+
+        if session.modified or session.permanent:
+            self._set_cookie(app, session, response)
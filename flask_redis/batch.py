@@ -0,0 +1,159 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.batch
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Batching of commands into pipelines. Commands issued on a :class:`Batch`
+    are buffered and return a :class:`LazyResult` each. All buffered
+    commands are sent in a single round trip once a result is accessed or
+    the batch is flushed.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+
+#: Attributes of :class:`redis.StrictRedis` which are not single commands
+#: and therefore never buffered. Accessing them flushes the batch.
+UNBATCHED = frozenset([
+    'pipeline', 'transaction', 'pubsub', 'monitor', 'lock',
+    'register_script', 'scan_iter', 'sscan_iter', 'hscan_iter', 'zscan_iter',
+    'set_response_callback', 'get_connection_kwargs', 'close',
+    'connection_pool', 'response_callbacks'
+])
+
+_pending = object()
+
+
+class LazyResult(object):
+    """Result of a buffered command, available as :attr:`value`."""
+    __slots__ = ('batch', '_value', '_error')
+
+    def __init__(self, batch):
+        self.batch = batch
+        self._value = _pending
+        self._error = None
+
+    @property
+    def ready(self):
+        """Whether the command was sent already.
+
+        :rtype: bool
+        """
+        return self._value is not _pending or self._error is not None
+
+    @property
+    def value(self):
+        """Reply of the command. Flushes the batch when the command was not
+        sent yet and raises the error the command failed with, if any.
+        """
+        if not self.ready:
+            self.batch.flush()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def __repr__(self):
+        if not self.ready:
+            return '<LazyResult pending>'
+        if self._error is not None:
+            return '<LazyResult error=%r>' % self._error
+        return '<LazyResult %r>' % self._value
+
+
+class Batch(object):
+    """Buffers the commands issued on it into a non-transactional pipeline
+    of `client`. Used as a context manager the batch is installed on the
+    application context so :class:`~flask.ext.redis.Redis` buffers commands
+    into it, and flushed on exit::
+
+        with redis.batch():
+            a = redis.get('a')
+            b = redis.get('b')
+        print(a.value, b.value)
+    """
+
+    def __init__(self, client, context=None):
+        """
+
+        :param client: :class:`redis.StrictRedis`
+        :param context: application context to install the batch on when
+                        entered as a context manager
+        """
+        self.client = client
+        self.context = context
+        self._pipeline = None
+        self._results = []
+        self._previous = None
+
+    def __getattr__(self, item):
+        if item.startswith('_'):
+            return getattr(self.client, item)
+        if item in UNBATCHED:
+            # sends buffered commands first, so they keep their order;
+            # their errors are raised by their results
+            self.flush(raise_on_error=False)
+            return getattr(self.client, item)
+        if self._pipeline is None:
+            self._pipeline = self.client.pipeline(transaction=False)
+        method = getattr(self._pipeline, item)
+        if not callable(method):
+            return getattr(self.client, item)
+
+        def command(*args, **kwargs):
+            method(*args, **kwargs)
+            result = LazyResult(self)
+            self._results.append(result)
+            return result
+        return command
+
+    def flush(self, raise_on_error=True):
+        """Sends all buffered commands in one round trip and resolves their
+        results.
+
+        :param raise_on_error: bool -- raise the first error of a command
+                               after resolving all results
+        :returns: list of :class:`LazyResult`
+        """
+        results, self._results = self._results, []
+        if not results:
+            return results
+        try:
+            values = self._pipeline.execute(raise_on_error=False)
+        except Exception as e:
+            for result in results:
+                result._error = e
+            if raise_on_error:
+                raise
+            return results
+
+        error = None
+        for result, value in zip(results, values):
+            if isinstance(value, Exception):
+                result._error = value
+                if error is None:
+                    error = value
+            else:
+                result._value = value
+        if error is not None and raise_on_error:
+            raise error
+        return results
+
+    def __enter__(self):
+        if self.context is not None:
+            previous = getattr(self.context, 'redis_batch', None)
+            if previous is not None:
+                # keep commands in order
+                previous.flush()
+            self._previous = previous
+            self.context.redis_batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.context is not None:
+            if self._previous is None:
+                del self.context.redis_batch
+            else:
+                self.context.redis_batch = self._previous
+            self._previous = None
+        self.flush(raise_on_error=exc_type is None)
@@ -0,0 +1,282 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.caching
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Caching of view responses and function results, available through
+    :meth:`flask.ext.redis.Redis.cached` and
+    :meth:`flask.ext.redis.Redis.memoize`::
+
+        @app.route('/reports/<int:year>')
+        @redis.cached(timeout=600, tags=['reports'])
+        def report(year):
+            ...
+
+        @redis.memoize(timeout=60)
+        def exchange_rate(currency):
+            ...
+
+        redis.invalidate_tags('reports')
+
+    Stampedes are avoided in two ways. Entries are recomputed early with a
+    probability rising as their expiration approaches, weighted by how long
+    the last computation took ("XFetch"), so usually a single caller
+    recomputes while the others are still served from the cache. Once an
+    entry did expire only the caller acquiring a lock recomputes it; the
+    others are served the stale entry, kept for `stale_ttl` more seconds,
+    or wait for the new one when there is none.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import functools
+import hashlib
+import math
+import random
+import time
+import uuid
+
+import redis
+from flask import current_app, request
+
+from . import serializers
+from .scripting import Scripts, queue_script, reload_scripts
+
+#: Deletes a lock only when it still holds our token.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+#: Adds a key to a tag set, only ever extending the time the set lives so
+#: it outlives each of its keys.
+ADD_TO_TAG_SCRIPT = """
+redis.call('sadd', KEYS[1], ARGV[1])
+if redis.call('ttl', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('expire', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+class _Uncacheable(Exception):
+    """Raised by computations whose result must not be stored."""
+
+    def __init__(self, value):
+        Exception.__init__(self)
+        self.value = value
+
+
+class Cache(object):
+    """Stores computed values along with the time they took to compute and
+    the time they expire.
+    """
+    #: Seconds to sleep between polls while waiting for another caller to
+    #: compute a value.
+    poll_interval = 0.05
+
+    def __init__(self, redis, prefix='cache:'):
+        """
+
+        :param redis: :class:`redis.StrictRedis`
+        :param prefix: str
+        """
+        self.redis = redis
+        self.prefix = prefix
+        self.serializer = serializers.get_serializer('pickle')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.recompute_time = 0.0
+        self._scripts = Scripts()
+
+    def _add_to_tags(self, pipe, key, tags, ttl):
+        for tag in tags:
+            script = self._scripts.get(self.redis, ADD_TO_TAG_SCRIPT)
+            queue_script(pipe, script, [self.prefix + 'tag:' + tag],
+                         [key, ttl])
+
+    def _load(self, key):
+        value = self.redis.get(key)
+        if value is not None:
+            return serializers.loads(value)
+
+    def _compute(self, key, compute, timeout, stale_ttl, tags):
+        started = time.time()
+        try:
+            value = compute()
+        except _Uncacheable as e:
+            return e.value
+        finished = time.time()
+        self.misses += 1
+        self.recompute_time += finished - started
+
+        entry = (value, finished - started, finished + timeout)
+        ttl = int(math.ceil(timeout + stale_ttl))
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, serializers.dumps(entry, self.serializer), ex=ttl)
+        self._add_to_tags(pipe, key, tags, ttl)
+        replies = pipe.execute(raise_on_error=False)
+        for reply in replies:
+            if isinstance(reply, Exception) and \
+                    not isinstance(reply, redis.exceptions.NoScriptError):
+                raise reply
+        if reload_scripts(self.redis, replies, ADD_TO_TAG_SCRIPT):
+            self._add_to_tags(pipe, key, tags, ttl)
+            pipe.execute()
+        return value
+
+    def get_or_compute(self, key, compute, timeout=300, stale_ttl=None,
+                       tags=(), beta=1.0, lock_timeout=10):
+        """Returns the value cached as `key` or stores the result of calling
+        `compute`.
+
+        :param key: str
+        :param compute: callable without arguments
+        :param timeout: float -- seconds the value is fresh
+        :param stale_ttl: float -- seconds an expired value is kept to be
+                          served while it is recomputed, defaults to
+                          `timeout`
+        :param tags: names of tags to invalidate the value by
+        :param beta: float -- weight of early recomputation, larger values
+                     recompute earlier, 0 disables it
+        :param lock_timeout: float -- seconds a recomputation may take
+                             before other callers compute as well
+        """
+        if stale_ttl is None:
+            stale_ttl = timeout
+        entry = self._load(key)
+        now = time.time()
+        if entry is not None:
+            value, delta, expires = entry
+            # 1 - random() is never 0
+            early = -delta * beta * math.log(1.0 - random.random())
+            if now + early < expires:
+                self.hits += 1
+                return value
+
+        lock = key + ':lock'
+        token = uuid.uuid4().hex
+        if self.redis.set(lock, token, nx=True,
+                          px=int(lock_timeout * 1000)):
+            try:
+                return self._compute(key, compute, timeout, stale_ttl, tags)
+            finally:
+                release = self._scripts.get(self.redis, RELEASE_LOCK_SCRIPT)
+                release(keys=[lock], args=[token])
+
+        if entry is not None:
+            self.stale_hits += 1
+            return entry[0]
+
+        deadline = now + lock_timeout
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self._load(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+        return self._compute(key, compute, timeout, stale_ttl, tags)
+
+    def invalidate_tags(self, *tags):
+        """Deletes all values stored with any of `tags`."""
+        tag_keys = [self.prefix + 'tag:' + tag for tag in tags]
+        pipe = self.redis.pipeline(transaction=False)
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        keys = set()
+        for members in pipe.execute():
+            keys.update(members)
+        # sets of several tags may live in different cluster slots
+        for key in list(keys) + tag_keys:
+            pipe.delete(key)
+        pipe.execute()
+
+    def stats(self):
+        """Returns the number of hits, stale hits and misses, the ratio of
+        hits and stale hits to all lookups and the average time it took to
+        compute a value in seconds.
+
+        :rtype: dict
+        """
+        served = self.hits + self.stale_hits
+        hit_ratio = average_recompute_time = 0.0
+        if served + self.misses:
+            hit_ratio = float(served) / (served + self.misses)
+        if self.misses:
+            average_recompute_time = self.recompute_time / self.misses
+        return dict(hits=self.hits, stale_hits=self.stale_hits,
+                    misses=self.misses, hit_ratio=hit_ratio,
+                    average_recompute_time=average_recompute_time)
+
+    def cached(self, timeout=300, key_func=None, vary_on=(), tags=(),
+               **options):
+        """Decorator caching the responses of a view for GET and HEAD
+        requests. Only responses with status 200 are cached, without their
+        cookies.
+
+        :param timeout: float -- seconds a response is fresh
+        :param key_func: callable returning the cache key of the current
+                         request, defaults to its path and query string
+        :param vary_on: names of request headers whose values become part of
+                        the key, e.g. ``['Accept-Language']``
+        :param tags: names of tags to invalidate the responses by
+        :param options: passed to :meth:`get_or_compute`
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return view(*args, **kwargs)
+
+                key = key_func() if key_func else request.full_path
+                for header in vary_on:
+                    key += '\n' + request.headers.get(header, '')
+                key = self.prefix + 'view:' + view.__name__ + ':' + \
+                    hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+                def compute():
+                    response = current_app.make_response(
+                        view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        raise _Uncacheable(response)
+                    headers = [(name, value) for name, value
+                               in response.headers.items()
+                               if name.lower() != 'set-cookie']
+                    return response.status_code, headers, \
+                        response.get_data()
+
+                rv = self.get_or_compute(key, compute, timeout, tags=tags,
+                                         **options)
+                if not isinstance(rv, tuple):
+                    return rv
+                status, headers, body = rv
+                return current_app.response_class(body, status=status,
+                                                  headers=headers)
+            return wrapper
+        return decorator
+
+    def memoize(self, timeout=300, tags=(), **options):
+        """Decorator caching the results of a function by its arguments,
+        which are identified by their :func:`repr`.
+
+        :param timeout: float -- seconds a result is fresh
+        :param tags: names of tags to invalidate the results by
+        :param options: passed to :meth:`get_or_compute`
+        """
+        def decorator(func):
+            name = func.__module__ + '.' + func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                arguments = repr((args, sorted(kwargs.items())))
+                key = self.prefix + 'memoize:' + name + ':' + \
+                    hashlib.sha1(arguments.encode('utf-8')).hexdigest()
+                return self.get_or_compute(
+                    key, lambda: func(*args, **kwargs), timeout, tags=tags,
+                    **options)
+            return wrapper
+        return decorator
@@ -0,0 +1,164 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.cli
+    ~~~~~~~~~~~~~~~~~~~
+
+    ``flask redis-sessions`` commands administrating the sessions stored by
+    :class:`~flask.ext.redis.session.RedisSessionInterface`, registered when
+    REDIS_SESSION is enabled::
+
+        $ flask redis-sessions stats
+        $ flask redis-sessions list --user 4711
+        $ flask redis-sessions purge --idle 2592000 --dry-run
+        $ flask redis-sessions purge --user 4711
+
+    Sessions are visited with SCAN in batches of ``--batch-size`` keys, and
+    each batch is inspected or deleted in a single pipeline, so the server
+    is never blocked by a full keyspace command such as KEYS.
+
+    ``flask redis-worker`` runs the jobs of the tasks registered with
+    :meth:`~flask.ext.redis.Redis.task`, see :mod:`flask.ext.redis.tasks`::
+
+        $ flask redis-worker --processes 4 --queue mail --queue default
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from .session import RedisSessionInterface
+from .tasks import Worker, run_workers
+
+sessions = AppGroup('redis-sessions',
+                    help='Administrate the sessions stored in Redis.')
+
+batch_size_option = click.option(
+    '--batch-size', default=1000, show_default=True,
+    help='Keys fetched per SCAN call and commands per pipeline.')
+
+
+def _interface():
+    interface = current_app.session_interface
+    if not isinstance(interface, RedisSessionInterface):
+        raise click.ClickException('The application does not store its '
+                                   'sessions in Redis.')
+    return interface
+
+
+def _user_batches(interface, user_id, batch_size):
+    if interface.user_key is None:
+        raise click.ClickException('Sessions are not indexed by user, set '
+                                   'REDIS_SESSION_USER_KEY.')
+    sids = interface.get_user_sessions(user_id)
+    for i in range(0, len(sids), batch_size):
+        yield sids[i:i + batch_size]
+
+
+@sessions.command('stats')
+@batch_size_option
+def stats(batch_size):
+    """Counts the stored sessions and the memory they use."""
+    interface = _interface()
+    count = size = 0
+    for sids in interface.scan_sessions(batch_size):
+        for session in interface.inspect_sessions(sids):
+            count += 1
+            size += session['bytes']
+    click.echo('%d sessions, %d bytes' % (count, size))
+    if count:
+        click.echo('%d bytes per session on average' % (size // count))
+
+
+@sessions.command('list')
+@click.option('--user', help='List only the sessions of this user ID.')
+@batch_size_option
+def list_sessions(user, batch_size):
+    """Lists session IDs with their time to live, idle time and size."""
+    interface = _interface()
+    if user is None:
+        batches = interface.scan_sessions(batch_size)
+    else:
+        batches = _user_batches(interface, user, batch_size)
+    for sids in batches:
+        for session in interface.inspect_sessions(sids):
+            click.echo('%(sid)s ttl=%(ttl)s idle=%(idle)s bytes=%(bytes)d'
+                       % session)
+
+
+@sessions.command('purge')
+@click.option('--user', help='Delete the sessions of this user ID, logging '
+                             'the user out everywhere.')
+@click.option('--idle', type=int,
+              help='Delete sessions not accessed for this many seconds.')
+@click.option('--unreadable', is_flag=True,
+              help='Delete sessions whose data can no longer be loaded, '
+                   'e.g. after a release.')
+@click.option('--all', 'purge_all', is_flag=True,
+              help='Delete all sessions.')
+@click.option('--dry-run', is_flag=True,
+              help='Only report what would be deleted.')
+@batch_size_option
+def purge(user, idle, unreadable, purge_all, dry_run, batch_size):
+    """Deletes the sessions matching all given criteria."""
+    if not (user or idle is not None or unreadable or purge_all):
+        raise click.UsageError('Give --user, --idle, --unreadable or --all.')
+    interface = _interface()
+    if user is None:
+        batches = interface.scan_sessions(batch_size)
+    else:
+        batches = _user_batches(interface, user, batch_size)
+
+    count = size = 0
+    for sids in batches:
+        if unreadable:
+            sids = interface.find_unreadable_sessions(sids)
+        inspected = interface.inspect_sessions(sids) if sids else []
+        if idle is not None:
+            inspected = [session for session in inspected
+                         if session['idle'] is not None and
+                         session['idle'] >= idle]
+        sids = [session['sid'] for session in inspected]
+        if dry_run:
+            count += len(sids)
+        else:
+            count += interface.delete_sessions(sids)
+        size += sum(session['bytes'] for session in inspected)
+
+    click.echo('%s %d sessions, %d bytes' % (
+        'Would delete' if dry_run else 'Deleted', count, size))
+
+
+@click.command('redis-worker')
+@click.option('--processes', '-p', default=1, show_default=True,
+              help='Worker processes to fork.')
+@click.option('--queue', '-q', 'queues', multiple=True,
+              help='Queue to work on, repeated in order of precedence. '
+                   'Defaults to the queue "default".')
+@click.option('--batch-size', default=10, show_default=True,
+              help='Jobs fetched per round trip.')
+@click.option('--heartbeat', default=60, show_default=True,
+              help='Seconds after which the jobs of a worker not heard from '
+                   'are recovered. Jobs must not run longer.')
+@click.option('--burst', is_flag=True,
+              help='Exit once the queues are empty.')
+@with_appcontext
+def worker(processes, queues, batch_size, heartbeat, burst):
+    """Runs the jobs of the tasks deferred with Redis."""
+    app = current_app._get_current_object()
+    tasks = app.extensions['redis'].tasks
+    if tasks.connection_pool is None:
+        raise click.ClickException('Workers are not supported in cluster '
+                                   'mode.')
+
+    def create_worker():
+        return Worker(tasks, queues or ('default',), batch_size=batch_size,
+                      heartbeat=heartbeat, app=app)
+
+    click.echo('Starting %d workers on %s' % (
+        processes, ', '.join(queues or ('default',))))
+    errors = run_workers(create_worker, processes, burst)
+    if errors:
+        raise click.ClickException('%d workers failed' % errors)
@@ -0,0 +1,167 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.compression
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Optional compression of serialized values. A compressed value is
+    prefixed with the one-byte tag of its compressor, values without such a
+    tag are returned unchanged by :func:`decompress`. Tags do not overlap
+    with those of :mod:`flask.ext.redis.serializers`.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import abc
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _require(module, package):
+    if module is None:
+        raise RuntimeError('The %s package is required to compress and '
+                           'decompress values with it' % package)
+
+
+class Compressor(abc.ABC):
+    """Base class of compressors. Subclasses set a unique :attr:`tag` and
+    implement :meth:`compress` and :meth:`decompress`.
+    """
+    #: One byte marking values compressed by this compressor.
+    tag = None
+
+    def __init__(self, level=None):
+        """
+
+        :param level: int -- compression level, `None` for the default of
+                      the algorithm
+        """
+        self.level = level
+
+    @abc.abstractmethod
+    def compress(self, data):
+        """
+
+        :param data: bytes
+        :returns: bytes
+        """
+
+    @classmethod
+    @abc.abstractmethod
+    def decompress(cls, data):
+        """
+
+        :param data: bytes
+        :returns: bytes
+        """
+
+
+class ZlibCompressor(Compressor):
+    """:mod:`zlib`, always available."""
+    tag = b'\x10'
+
+    def compress(self, data):
+        if self.level is None:
+            return zlib.compress(data)
+        return zlib.compress(data, self.level)
+
+    @classmethod
+    def decompress(cls, data):
+        return zlib.decompress(data)
+
+
+class LZ4Compressor(Compressor):
+    """LZ4 frames, requires :mod:`lz4`. Much faster than zlib at a lower
+    ratio.
+    """
+    tag = b'\x11'
+
+    def compress(self, data):
+        _require(lz4, 'lz4')
+        return lz4.frame.compress(data, compression_level=self.level or 0)
+
+    @classmethod
+    def decompress(cls, data):
+        _require(lz4, 'lz4')
+        return lz4.frame.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    """Zstandard, requires :mod:`zstandard`."""
+    tag = b'\x12'
+
+    def compress(self, data):
+        _require(zstandard, 'zstandard')
+        level = 3 if self.level is None else self.level
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    @classmethod
+    def decompress(cls, data):
+        _require(zstandard, 'zstandard')
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+#: Compressor classes by name, see :func:`get_compressor`.
+compressors = {'zlib': ZlibCompressor}
+if lz4 is not None:
+    compressors['lz4'] = LZ4Compressor
+if zstandard is not None:
+    compressors['zstd'] = ZstdCompressor
+
+_compressors_by_tag = dict((cls.tag, cls) for cls in (
+    ZlibCompressor, LZ4Compressor, ZstdCompressor))
+
+
+def get_compressor(compressor, level=None):
+    """Returns an instance of the compressor named `compressor`. Instances
+    of :class:`Compressor` and `None` are returned as is.
+
+    :param compressor: str or :class:`Compressor`
+    :param level: int
+    :rtype: Compressor
+    """
+    if compressor is None or isinstance(compressor, Compressor):
+        return compressor
+    try:
+        return compressors[compressor](level)
+    except KeyError:
+        raise ValueError('Unknown or unavailable compressor %r' % compressor)
+
+
+def compress(value, compressor, threshold=0):
+    """Compresses `value` with `compressor` when it is at least `threshold`
+    bytes long and compression actually makes it smaller.
+
+    :param value: bytes
+    :param compressor: :class:`Compressor` or `None`
+    :param threshold: int
+    :returns: bytes
+    """
+    if compressor is None or len(value) < threshold:
+        return value
+    compressed = compressor.tag + compressor.compress(value)
+    if len(compressed) < len(value):
+        return compressed
+    return value
+
+
+def decompress(value):
+    """Decompresses `value` when it is tagged by a compressor. Raises
+    :class:`RuntimeError` when the library of that compressor is missing.
+
+    :param value: bytes
+    :returns: bytes
+    """
+    compressor = _compressors_by_tag.get(value[:1])
+    if compressor is None:
+        return value
+    return compressor.decompress(value[1:])
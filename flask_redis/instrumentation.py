@@ -0,0 +1,402 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.instrumentation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Records the commands sent to Redis when ``REDIS_INSTRUMENTATION`` is
+    enabled: their name, number of keys, payload bytes and latency. Every
+    round trip is recorded once, so a pipeline counts as a single
+    ``PIPELINE`` command covering all commands it sent.
+
+    Aggregates are kept by :class:`Instrumentation` -- latency histograms
+    per command, the slowest round trips and round trips per endpoint -- and
+    every round trip and finished request is passed on to the configured
+    sinks, e.g.::
+
+        app.config['REDIS_INSTRUMENTATION'] = True
+        app.config['REDIS_INSTRUMENTATION_SINKS'] = [
+            'logging', StatsdSink('statsd.local', 8125)]
+        app.config['REDIS_METRICS_ENDPOINT'] = '/metrics'
+
+    Disabled, the extension hands out plain :class:`redis.StrictRedis`
+    instances and commands take no detour at all.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import heapq
+import itertools
+import logging
+import socket
+import threading
+import time
+
+import redis
+import redis.client
+
+timer = getattr(time, 'perf_counter', time.time)
+
+#: Upper bounds of the latency histogram buckets in seconds.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+#: Commands whose arguments all are keys, other commands have one key.
+_ALL_KEYS = frozenset(['DEL', 'EXISTS', 'MGET', 'SDIFF', 'SINTER', 'SUNION',
+                       'TOUCH', 'UNLINK', 'WATCH', 'PFCOUNT'])
+_NO_KEYS = frozenset(['PING', 'INFO', 'DBSIZE', 'FLUSHDB', 'FLUSHALL',
+                      'SCAN', 'RANDOMKEY', 'MULTI', 'EXEC', 'CLIENT',
+                      'SCRIPT', 'CONFIG', 'TIME', 'PUBLISH', 'KEYS'])
+
+
+def count_keys(args):
+    """Returns the number of keys the command `args` operates on.
+
+    :rtype: int
+    """
+    command = str(args[0]).upper()
+    if command in _NO_KEYS:
+        return 0
+    if command in _ALL_KEYS:
+        return len(args) - 1
+    if command in ('MSET', 'MSETNX'):
+        return (len(args) - 1) // 2
+    if command in ('EVAL', 'EVALSHA') and len(args) > 2:
+        return int(args[2])
+    return 1 if len(args) > 1 else 0
+
+
+def payload_size(value):
+    """Returns the number of bytes of the strings in `value`, the arguments
+    or the reply of a command.
+
+    :rtype: int
+    """
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, type(u'')):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (list, tuple, set)):
+        return sum(payload_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v)
+                   for k, v in value.items())
+    if isinstance(value, (int, float)):
+        return len(repr(value))
+    return 0
+
+
+class RequestStats(object):
+    """Commands sent within one application context."""
+    __slots__ = ('endpoint', 'commands', 'round_trips', 'keys', 'bytes',
+                 'duration')
+
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint
+        self.commands = 0
+        self.round_trips = 0
+        self.keys = 0
+        self.bytes = 0
+        self.duration = 0.0
+
+    def add(self, commands, keys, nbytes, duration):
+        self.commands += commands
+        self.round_trips += 1
+        self.keys += keys
+        self.bytes += nbytes
+        self.duration += duration
+
+    def header_value(self):
+        """Returns the stats as value of the ``X-Redis-Stats`` header.
+
+        :rtype: str
+        """
+        return 'commands=%d; round-trips=%d; keys=%d; bytes=%d; ' \
+               'time=%.3fms' % (self.commands, self.round_trips, self.keys,
+                                self.bytes, self.duration * 1000)
+
+
+class Sink(object):
+    """Receives every recorded round trip and request. Subclasses override
+    either method.
+    """
+
+    def command(self, name, keys, nbytes, duration, endpoint):
+        """Called after each round trip.
+
+        :param name: str -- command name or ``PIPELINE``
+        :param keys: int
+        :param nbytes: int -- bytes sent and received
+        :param duration: float -- seconds
+        :param endpoint: str -- endpoint of the request, if any
+        """
+
+    def request(self, stats):
+        """Called when an application context that sent commands ends.
+
+        :param stats: :class:`RequestStats`
+        """
+
+
+class LoggingSink(Sink):
+    """Logs a summary of every request and round trips slower than
+    `slow_threshold` seconds.
+    """
+
+    def __init__(self, logger='flask_redis', level=logging.DEBUG,
+                 slow_threshold=0.01):
+        if not isinstance(logger, logging.Logger):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.level = level
+        self.slow_threshold = slow_threshold
+
+    def command(self, name, keys, nbytes, duration, endpoint):
+        if duration >= self.slow_threshold:
+            self.logger.warning('Slow Redis command %s (%d keys, %d bytes) '
+                                'took %.3fms in %s', name, keys, nbytes,
+                                duration * 1000, endpoint)
+
+    def request(self, stats):
+        self.logger.log(self.level, 'Redis stats of %s: %s', stats.endpoint,
+                        stats.header_value())
+
+
+class StatsdSink(Sink):
+    """Sends timings and counters in StatsD format over UDP. Packets which
+    cannot be sent are dropped.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='flask_redis'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def _send(self, *metrics):
+        data = '\n'.join('%s.%s' % (self.prefix, metric)
+                         for metric in metrics)
+        try:
+            self.socket.sendto(data.encode('utf-8'), self.address)
+        except (socket.error, OSError):
+            pass
+
+    def command(self, name, keys, nbytes, duration, endpoint):
+        self._send('command.%s:%.3f|ms' % (name.lower(), duration * 1000),
+                   'bytes:%d|c' % nbytes)
+
+    def request(self, stats):
+        endpoint = (stats.endpoint or 'none').replace('.', '_')
+        self._send('request.%s.round_trips:%d|h' % (endpoint,
+                                                    stats.round_trips),
+                   'request.%s.commands:%d|h' % (endpoint, stats.commands))
+
+
+#: Sinks configurable by name.
+sinks = {
+    'logging': LoggingSink,
+    'statsd': StatsdSink,
+}
+
+
+def get_sink(sink):
+    """Returns `sink`, or a default instance of the sink registered as
+    `sink` when given a name.
+
+    :rtype: Sink
+    """
+    if isinstance(sink, str):
+        try:
+            return sinks[sink]()
+        except KeyError:
+            raise ValueError('Unknown instrumentation sink %r' % sink)
+    return sink
+
+
+class Instrumentation(object):
+    """Aggregates recorded commands and forwards them to `sinks`."""
+
+    def __init__(self, sinks=(), slow_log_size=10, buckets=DEFAULT_BUCKETS):
+        """
+
+        :param sinks: list of :class:`Sink` or registered names
+        :param slow_log_size: int -- number of slowest round trips kept
+        :param buckets: upper bounds of the latency histogram buckets
+        """
+        self.sinks = [get_sink(sink) for sink in sinks]
+        self.slow_log_size = slow_log_size
+        self.buckets = tuple(buckets)
+        #: command name -> [count per bucket..., count, sum of durations]
+        self.histograms = {}
+        #: endpoint -> [requests, round trips, commands]
+        self.endpoints = {}
+        self._slow = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def record_command(self, name, commands, keys, nbytes, duration, stats):
+        """Records a round trip of `commands` commands.
+
+        :param stats: :class:`RequestStats` of the context, if any
+        """
+        endpoint = None
+        if stats is not None:
+            stats.add(commands, keys, nbytes, duration)
+            endpoint = stats.endpoint
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = \
+                    [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += 1
+            histogram[-1] += duration
+
+            # the sequence number keeps entries of equal duration comparable
+            entry = (duration, next(self._sequence), name, keys, nbytes,
+                     endpoint)
+            if len(self._slow) < self.slow_log_size:
+                heapq.heappush(self._slow, entry)
+            elif self._slow and duration > self._slow[0][0]:
+                heapq.heapreplace(self._slow, entry)
+        for sink in self.sinks:
+            sink.command(name, keys, nbytes, duration, endpoint)
+
+    def record_request(self, stats):
+        """Records the end of the context `stats` were collected in.
+
+        :param stats: :class:`RequestStats`
+        """
+        if stats.endpoint is not None:
+            with self._lock:
+                totals = self.endpoints.setdefault(stats.endpoint, [0, 0, 0])
+                totals[0] += 1
+                totals[1] += stats.round_trips
+                totals[2] += stats.commands
+        for sink in self.sinks:
+            sink.request(stats)
+
+    def slowest(self):
+        """Returns the slowest round trips recorded, slowest first, as
+        tuples of duration, command name, keys, bytes and endpoint.
+
+        :rtype: list
+        """
+        with self._lock:
+            slow = sorted(self._slow, reverse=True)
+        return [entry[:1] + entry[2:] for entry in slow]
+
+    def stats(self):
+        """Returns count and average latency per command and average round
+        trips and commands per request of each endpoint.
+
+        :rtype: dict
+        """
+        with self._lock:
+            commands = dict(
+                (name, dict(count=h[-2], average=h[-1] / h[-2]))
+                for name, h in self.histograms.items())
+            endpoints = dict(
+                (endpoint, dict(requests=t[0],
+                                round_trips=float(t[1]) / t[0],
+                                commands=float(t[2]) / t[0]))
+                for endpoint, t in self.endpoints.items())
+        return dict(commands=commands, endpoints=endpoints)
+
+    def render_prometheus(self):
+        """Renders the aggregates in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        lines = ['# TYPE flask_redis_command_duration_seconds histogram']
+        with self._lock:
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count
+                    lines.append('flask_redis_command_duration_seconds_bucket'
+                                 '{command="%s",le="%r"} %d'
+                                 % (name, bound, cumulative))
+                lines.append('flask_redis_command_duration_seconds_bucket'
+                             '{command="%s",le="+Inf"} %d'
+                             % (name, histogram[-2]))
+                lines.append('flask_redis_command_duration_seconds_count'
+                             '{command="%s"} %d' % (name, histogram[-2]))
+                lines.append('flask_redis_command_duration_seconds_sum'
+                             '{command="%s"} %r' % (name, histogram[-1]))
+
+            lines.append('# TYPE flask_redis_requests_total counter')
+            lines.append('# TYPE flask_redis_round_trips_total counter')
+            for endpoint in sorted(self.endpoints):
+                requests, round_trips, _ = self.endpoints[endpoint]
+                lines.append('flask_redis_requests_total{endpoint="%s"} %d'
+                             % (endpoint, requests))
+                lines.append('flask_redis_round_trips_total{endpoint="%s"} '
+                             '%d' % (endpoint, round_trips))
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """Pipeline recording each execution as one round trip."""
+    instrumentation = None
+    request_stats = None
+
+    def execute(self, raise_on_error=True):
+        stack = self.command_stack
+        if not stack:
+            return super(InstrumentedPipeline, self).execute(raise_on_error)
+        keys = nbytes = 0
+        for args, _ in stack:
+            keys += count_keys(args)
+            nbytes += payload_size(args)
+        commands = len(stack)
+        started = timer()
+        try:
+            response = super(InstrumentedPipeline, self).execute(
+                raise_on_error)
+        finally:
+            duration = timer() - started
+        self.instrumentation.record_command(
+            'PIPELINE', commands, keys, nbytes + payload_size(response),
+            duration, self.request_stats)
+        return response
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """:class:`redis.StrictRedis` recording every command it sends."""
+    pipeline_class = InstrumentedPipeline
+
+    def __init__(self, instrumentation, request_stats=None, **kwargs):
+        """
+
+        :param instrumentation: :class:`Instrumentation`
+        :param request_stats: :class:`RequestStats` of the context, if any
+        """
+        super(InstrumentedRedis, self).__init__(**kwargs)
+        self.instrumentation = instrumentation
+        self.request_stats = request_stats
+
+    def execute_command(self, *args, **options):
+        started = timer()
+        try:
+            response = super(InstrumentedRedis, self).execute_command(
+                *args, **options)
+        finally:
+            duration = timer() - started
+        self.instrumentation.record_command(
+            str(args[0]).upper(), 1, count_keys(args),
+            payload_size(args) + payload_size(response), duration,
+            self.request_stats)
+        return response
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = self.pipeline_class(self.connection_pool,
+                                   self.response_callbacks, transaction,
+                                   shard_hint)
+        pipe.instrumentation = self.instrumentation
+        pipe.request_stats = self.request_stats
+        return pipe
@@ -0,0 +1,422 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.messaging
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Pub/Sub and Redis Streams consumers run in the background of each
+    process instead of blocking a request worker::
+
+        @redis.subscribe('notifications')
+        def notify(message):
+            current_app.logger.info('Got %r', message['data'])
+
+        @redis.consume('orders', group='billing')
+        def bill(message_id, fields):
+            ...
+
+    Handlers are run by the :class:`Dispatcher` of the extension: one
+    daemon thread listens to all channels and patterns, another one per
+    stream reads it as member of a consumer group. Messages available at
+    once are dispatched in batches of up to `batch_size` inside a single
+    application context. Stream entries whose handler returned are
+    acknowledged with one XACK per batch, pipelined with the XREADGROUP
+    fetching the next one; entries whose handler raised stay pending and
+    are delivered again when the consumer restarts, or claimed by another
+    consumer of the group after `claim_after` milliseconds.
+
+    The threads are started by the first request of each process unless
+    REDIS_DISPATCHER_AUTOSTART is set to False, so a server forking its
+    workers starts them in every worker, or explicitly by
+    :meth:`Dispatcher.start`. They use connections of their own, without
+    socket timeout while waiting, and reconnect after connection errors.
+    Cluster mode is not supported.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import logging
+import os
+import socket
+import threading
+
+import redis
+import redis.sentinel
+
+logger = logging.getLogger('flask_redis')
+
+
+def dedicated_pool(connection_pool, **kwargs):
+    """Creates a pool of its own with the connection settings of
+    `connection_pool`, overridden by `kwargs`. For a pool of a Sentinel
+    service the new pool follows the same service, so it keeps up with
+    failovers.
+
+    :param connection_pool: :class:`redis.ConnectionPool`
+    :rtype: redis.ConnectionPool
+    """
+    settings = dict(connection_pool.connection_kwargs)
+    # connections of Sentinel pools locate the server through the pool
+    # they were created by
+    settings.pop('connection_pool', None)
+    settings['connection_class'] = connection_pool.connection_class
+    settings.update(kwargs)
+    if isinstance(connection_pool, redis.sentinel.SentinelConnectionPool):
+        return redis.sentinel.SentinelConnectionPool(
+            connection_pool.service_name, connection_pool.sentinel_manager,
+            is_master=connection_pool.is_master,
+            check_connection=connection_pool.check_connection, **settings)
+    return redis.ConnectionPool(**settings)
+
+
+def dedicated_client(connection_pool, socket_timeout=None):
+    """Creates a client with a pool of its own for blocking commands, with
+    the connection settings of `connection_pool` but `socket_timeout`.
+
+    :rtype: redis.StrictRedis
+    """
+    return redis.StrictRedis(connection_pool=dedicated_pool(
+        connection_pool, socket_timeout=socket_timeout))
+
+
+def _channel(name):
+    if isinstance(name, bytes):
+        return name
+    return name.encode('utf-8')
+
+
+class StreamConsumer(object):
+    """Member `consumer` of the consumer group `group` of `stream`,
+    passing entries to `handler`.
+    """
+
+    def __init__(self, stream, group, handler, consumer=None, batch_size=100,
+                 block=1000, start_id='$', claim_after=None):
+        """
+
+        :param stream: str -- name of the stream
+        :param group: str -- name of the consumer group, created along with
+                      the stream if missing
+        :param handler: callable taking the ID and the fields of an entry
+        :param consumer: str -- name of the consumer, defaults to host name
+                         and process ID
+        :param batch_size: int -- entries fetched per XREADGROUP
+        :param block: milliseconds to wait for new entries per XREADGROUP
+        :param start_id: ID after which a group created here starts
+                         reading, ``'$'`` for new entries only, ``'0'`` for
+                         the whole stream
+        :param claim_after: milliseconds after which entries pending with
+                            other consumers are claimed, `None` to leave
+                            them
+        """
+        self.stream = stream
+        self.group = group
+        self.handler = handler
+        self._consumer = consumer
+        self.batch_size = batch_size
+        self.block = block
+        self.start_id = start_id
+        self.claim_after = claim_after
+        #: ID after which entries pending with this consumer are fetched
+        #: again, `None` once they have all been delivered.
+        self.pending_id = '0'
+        self.acks = []
+
+    @property
+    def consumer(self):
+        """Name of the consumer, by default host name and ID of the current
+        process, so every forked worker is a consumer of its own.
+        """
+        if self._consumer is None:
+            return '%s-%d' % (socket.gethostname(), os.getpid())
+        return self._consumer
+
+    def reset(self):
+        """Forgets the entries handled but not acknowledged yet, so they
+        are fetched again along with the others pending.
+        """
+        self.pending_id = '0'
+        self.acks = []
+
+    def create_group(self, client):
+        """Creates the consumer group unless it exists."""
+        try:
+            client.xgroup_create(self.stream, self.group, self.start_id,
+                                 mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read(self, client):
+        """Acknowledges the entries handled before and fetches the next
+        batch, first the entries still pending with this consumer, then new
+        ones. Blocks for up to :attr:`block` milliseconds.
+
+        :returns: list of tuples of ID and fields
+        """
+        pipe = client.pipeline(transaction=False)
+        if self.acks:
+            pipe.xack(self.stream, self.group, *self.acks)
+        if self.pending_id is None:
+            pipe.xreadgroup(self.group, self.consumer, {self.stream: '>'},
+                            count=self.batch_size, block=self.block)
+        else:
+            pipe.xreadgroup(self.group, self.consumer,
+                            {self.stream: self.pending_id},
+                            count=self.batch_size)
+        reply = pipe.execute()[-1]
+        self.acks = []
+
+        entries = [entry for entry in reply[0][1] if entry[0] is not None] \
+            if reply else []
+        if self.pending_id is not None:
+            if entries:
+                self.pending_id = entries[-1][0]
+            else:
+                self.pending_id = None
+                return self.read(client)
+        elif not entries and self.claim_after is not None:
+            entries = [entry for entry in client.xautoclaim(
+                self.stream, self.group, self.consumer, self.claim_after,
+                count=self.batch_size)[1] if entry[0] is not None]
+        return entries
+
+    def flush(self, client):
+        """Acknowledges the entries handled since the last read."""
+        if self.acks:
+            client.xack(self.stream, self.group, *self.acks)
+            self.acks = []
+
+
+class Dispatcher(object):
+    """Runs the Pub/Sub and stream handlers registered with
+    :meth:`subscribe` and :meth:`consume` in background threads.
+    """
+
+    def __init__(self, extension):
+        """
+
+        :param extension: :class:`flask.ext.redis.Redis` whose application
+                          and connection settings are used
+        """
+        self.extension = extension
+        #: Maximum number of Pub/Sub messages dispatched in one
+        #: application context.
+        self.batch_size = 100
+        self.channels = {}
+        self.patterns = {}
+        self.consumers = []
+
+        self.received = 0
+        self.handled = 0
+        self.failed = 0
+
+        self._pid = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def subscribe(self, channel, pattern=False):
+        """Decorator registering a handler of the messages published to
+        `channel`. It is passed the message as returned by
+        :meth:`redis.client.PubSub.get_message`.
+
+        :param channel: str
+        :param pattern: bool -- whether `channel` is a glob-style pattern
+        """
+        def decorator(handler):
+            handlers = self.patterns if pattern else self.channels
+            with self._lock:
+                handlers.setdefault(_channel(channel), []).append(handler)
+                if self.running and not self._listening:
+                    self._spawn(self._listen, 'flask-redis-pubsub')
+            return handler
+        return decorator
+
+    def consume(self, stream, group, **options):
+        """Decorator registering a handler of the entries of `stream`,
+        read as member of the consumer group `group`. It is passed the ID and
+        the fields of each entry. Takes the options of
+        :class:`StreamConsumer`.
+        """
+        def decorator(handler):
+            consumer = StreamConsumer(stream, group, handler, **options)
+            with self._lock:
+                self.consumers.append(consumer)
+                if self.running:
+                    self._spawn(self._consume, 'flask-redis-stream',
+                                consumer)
+            return handler
+        return decorator
+
+    @property
+    def running(self):
+        """Whether the threads run in this process."""
+        return self._pid == os.getpid()
+
+    @property
+    def _listening(self):
+        return any(thread.name == 'flask-redis-pubsub'
+                   for thread in self._threads)
+
+    def ensure_started(self):
+        """Starts the threads unless they run in this process already."""
+        if self._pid != os.getpid() and (
+                self.channels or self.patterns or self.consumers):
+            self.start()
+
+    def start(self):
+        """Starts a thread listening to the subscribed channels and one per
+        stream consumer.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self.extension.connection_pool is None:
+                raise RuntimeError('Pub/Sub and stream consumers are not '
+                                   'supported in cluster mode')
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._threads = []
+            if self.channels or self.patterns:
+                self._spawn(self._listen, 'flask-redis-pubsub')
+            for consumer in self.consumers:
+                consumer.reset()
+                self._spawn(self._consume, 'flask-redis-stream', consumer)
+
+    def stop(self, timeout=None):
+        """Stops the threads after the batches being handled, waiting up to
+        `timeout` seconds for them.
+        """
+        with self._lock:
+            self._pid = None
+            self._stopped.set()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _spawn(self, target, name, *args):
+        thread = threading.Thread(target=target, name=name,
+                                  args=(self._pid,) + args)
+        thread.daemon = True
+        self._threads.append(thread)
+        thread.start()
+
+    def _listen(self, pid):
+        client = dedicated_client(self.extension.connection_pool)
+        while self._pid == pid:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                channels, patterns = set(), set()
+                while self._pid == pid:
+                    self._sync(pubsub, channels, patterns)
+                    messages = self._receive(pubsub)
+                    if messages:
+                        self.dispatch_messages(messages)
+            except (redis.RedisError, OSError):
+                logger.warning('Pub/Sub connection lost, reconnecting',
+                               exc_info=True)
+            finally:
+                pubsub.close()
+            self._stopped.wait(1)
+
+    def _sync(self, pubsub, channels, patterns):
+        """Subscribes to the channels and patterns registered since."""
+        new = set(self.channels) - channels
+        if new:
+            pubsub.subscribe(*new)
+            channels.update(new)
+        new = set(self.patterns) - patterns
+        if new:
+            pubsub.psubscribe(*new)
+            patterns.update(new)
+
+    def _receive(self, pubsub):
+        """Waits up to a second for a message and returns it along with the
+        messages received meanwhile.
+
+        :rtype: list
+        """
+        message = pubsub.get_message(timeout=1.0)
+        if message is None:
+            return []
+        messages = [message]
+        while len(messages) < self.batch_size:
+            message = pubsub.get_message()
+            if message is None:
+                break
+            messages.append(message)
+        return messages
+
+    def dispatch_messages(self, messages):
+        """Passes Pub/Sub `messages` to their handlers within an
+        application context.
+        """
+        self.received += len(messages)
+        with self.extension.app.app_context():
+            for message in messages:
+                if message.get('pattern') is not None:
+                    handlers = self.patterns.get(
+                        _channel(message['pattern']), ())
+                else:
+                    handlers = self.channels.get(
+                        _channel(message['channel']), ())
+                for handler in handlers:
+                    self._call(handler, message)
+
+    def _consume(self, pid, consumer):
+        client = dedicated_client(self.extension.connection_pool,
+                                  consumer.block / 1000.0 + 10)
+        created = False
+        while self._pid == pid:
+            try:
+                if not created:
+                    consumer.create_group(client)
+                    created = True
+                entries = consumer.read(client)
+                if entries:
+                    self.dispatch_entries(consumer, entries)
+            except (redis.RedisError, OSError):
+                logger.warning('Reading stream %s failed, reconnecting',
+                               consumer.stream, exc_info=True)
+                consumer.reset()
+                # the stream may have been deleted along with the group
+                created = False
+                self._stopped.wait(1)
+        try:
+            consumer.flush(client)
+        except (redis.RedisError, OSError):
+            pass
+
+    def dispatch_entries(self, consumer, entries):
+        """Passes stream `entries` to the handler of `consumer` within an
+        application context, queueing the IDs of those handled for
+        acknowledgement. Entries deleted while pending are acknowledged
+        without being passed on.
+        """
+        self.received += len(entries)
+        with self.extension.app.app_context():
+            for entry_id, fields in entries:
+                if fields is None or self._call(consumer.handler, entry_id,
+                                                fields):
+                    consumer.acks.append(entry_id)
+
+    def _call(self, handler, *args):
+        try:
+            handler(*args)
+        except Exception:
+            self.failed += 1
+            logger.exception('Handler %s failed', getattr(
+                handler, '__name__', handler))
+            return False
+        self.handled += 1
+        return True
+
+    def stats(self):
+        """Returns the number of messages and entries received, handled and
+        failed in this process.
+
+        :rtype: dict
+        """
+        return dict(received=self.received, handled=self.handled,
+                    failed=self.failed)
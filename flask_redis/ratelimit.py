@@ -0,0 +1,247 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.ratelimit
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Rate limiting available through :meth:`flask.ext.redis.Redis.rate_limit`::
+
+        @app.route('/api/search')
+        @redis.rate_limit('100/minute', key=lambda: g.user.id)
+        def search():
+            ...
+
+    Every check is a single Lua script run atomically by the server, so
+    concurrent requests never race between reading and updating a counter.
+    Scripts are sent once and then invoked by their SHA1 digest with
+    EVALSHA; a server which does not know them (yet), e.g. after a restart
+    or a failover, answers NOSCRIPT and gets them loaded again. Time is taken
+    from the server, so application servers with skewed clocks share the
+    same windows.
+
+    Two algorithms are available:
+
+    ``sliding-window``
+        Counts hits in fixed windows and weights the count of the previous
+        window by how much of it still overlaps the sliding window, which
+        approximates a true sliding window in constant memory per key.
+    ``token-bucket``
+        Refills a bucket of up to `burst` tokens at the rate limit, each hit
+        taking one. Allows short bursts while enforcing the average rate.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import functools
+import math
+import re
+
+from flask import after_this_request, current_app, request
+
+from .scripting import Scripts
+
+#: Preamble of scripts reading the server time before writing, which needs
+#: effects replication on Redis < 5.
+_TIME = """
+if redis.replicate_commands then
+    pcall(redis.replicate_commands)
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+"""
+
+#: KEYS: counter hash. ARGV: limit, window (ms), cost.
+#: Returns allowed (0/1), remaining hits, milliseconds until retry.
+SLIDING_WINDOW_SCRIPT = _TIME + """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local current = math.floor(now / window)
+local counts = redis.call('HMGET', KEYS[1], current, current - 1)
+local count = tonumber(counts[1]) or 0
+local previous = tonumber(counts[2]) or 0
+local elapsed = now % window
+local weighted = previous * (window - elapsed) / window + count
+
+if weighted + cost > limit then
+    local wait = window - elapsed
+    if previous > 0 and count + cost <= limit then
+        -- until enough of the previous window slid out
+        local needed = (weighted + cost - limit) * window / previous
+        wait = math.min(wait, math.ceil(needed))
+    end
+    return {0, math.max(0, math.floor(limit - weighted)), wait}
+end
+
+redis.call('HINCRBY', KEYS[1], current, cost)
+redis.call('HDEL', KEYS[1], current - 2)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {1, math.floor(limit - weighted - cost), 0}
+"""
+
+#: KEYS: bucket hash. ARGV: limit, window (ms), cost, burst.
+#: Returns allowed (0/1), remaining tokens, milliseconds until retry.
+TOKEN_BUCKET_SCRIPT = _TIME + """
+local rate = tonumber(ARGV[1]) / tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate))
+return {allowed, math.floor(tokens), wait}
+"""
+
+SCRIPTS = {
+    'sliding-window': SLIDING_WINDOW_SCRIPT,
+    'token-bucket': TOKEN_BUCKET_SCRIPT,
+}
+
+_PERIODS = {
+    's': 1, 'sec': 1, 'second': 1,
+    'm': 60, 'min': 60, 'minute': 60,
+    'h': 3600, 'hour': 3600,
+    'd': 86400, 'day': 86400,
+}
+
+_RATE = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*([a-z]+?)s?\s*$')
+
+
+def parse_rate(rate):
+    """Parses rates like ``'100/minute'``, ``'10 per second'`` or
+    ``'1000/6h'``.
+
+    :returns: tuple of the number of hits and the period in seconds
+    """
+    match = _RATE.match(rate.lower())
+    if match is None or match.group(3) not in _PERIODS:
+        raise ValueError('Invalid rate %r' % rate)
+    limit, multiplier, period = match.groups()
+    return int(limit), int(multiplier or 1) * _PERIODS[period]
+
+
+class RateLimitResult(object):
+    """Outcome of a :meth:`RateLimiter.hit`."""
+    __slots__ = ('allowed', 'limit', 'remaining', 'retry_after')
+
+    def __init__(self, allowed, limit, remaining, retry_after):
+        #: Whether the hit is within the limit.
+        self.allowed = allowed
+        self.limit = limit
+        #: Hits left before the limit is reached.
+        self.remaining = remaining
+        #: Seconds to wait before the next hit is allowed.
+        self.retry_after = retry_after
+
+    def __bool__(self):
+        return self.allowed
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<RateLimitResult allowed=%r remaining=%r retry_after=%r>' % (
+            self.allowed, self.remaining, self.retry_after)
+
+
+class RateLimiter(object):
+    """Counts hits per key with the scripts of :data:`SCRIPTS`."""
+
+    def __init__(self, redis, prefix='ratelimit:'):
+        """
+
+        :param redis: :class:`redis.StrictRedis`
+        :param prefix: str
+        """
+        self.redis = redis
+        self.prefix = prefix
+        self._scripts = Scripts()
+
+    def _script(self, algorithm):
+        try:
+            source = SCRIPTS[algorithm]
+        except KeyError:
+            raise ValueError('Unknown rate limiting algorithm %r'
+                             % algorithm)
+        return self._scripts.get(self.redis, source)
+
+    def load_scripts(self):
+        """Loads all scripts into the script cache of the server ahead of
+        their first use.
+        """
+        for algorithm in SCRIPTS:
+            self.redis.script_load(self._script(algorithm).script)
+
+    def hit(self, key, rate, algorithm='sliding-window', cost=1,
+            burst=None):
+        """Counts `cost` hits of `key` if they are within `rate`.
+
+        :param key: str
+        :param rate: str as understood by :func:`parse_rate` or a tuple of
+                     hits and seconds
+        :param algorithm: ``'sliding-window'`` or ``'token-bucket'``
+        :param cost: int -- hits to count
+        :param burst: int -- size of the token bucket, defaults to the
+                      limit
+        :rtype: RateLimitResult
+        """
+        if not isinstance(rate, tuple):
+            rate = parse_rate(rate)
+        limit, period = rate
+        args = [limit, int(period * 1000), cost]
+        if algorithm == 'token-bucket':
+            args.append(burst or limit)
+        script = self._script(algorithm)
+        allowed, remaining, wait = script(keys=[self.prefix + key],
+                                          args=args, client=self.redis)
+        return RateLimitResult(bool(allowed), limit, remaining,
+                               wait / 1000.0)
+
+    def limit(self, rate, key=None, algorithm='sliding-window', cost=1,
+              burst=None, methods=None):
+        """Decorator limiting the rate of requests to a view per client.
+        Requests over the limit are answered with ``429 Too Many Requests``
+        and a Retry-After header; all responses carry X-RateLimit-Limit and
+        X-RateLimit-Remaining headers.
+
+        :param key: callable returning the client the request is counted
+                    for, defaults to its remote address
+        :param methods: names of the HTTP methods limited, defaults to all
+        :param rate, algorithm, cost, burst: see :meth:`hit`
+        """
+        parsed = parse_rate(rate) if not isinstance(rate, tuple) else rate
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if methods is not None and request.method not in methods:
+                    return view(*args, **kwargs)
+                client = key() if key is not None else request.remote_addr
+                result = self.hit(
+                    '%s:%s' % (request.endpoint, client), parsed,
+                    algorithm=algorithm, cost=cost, burst=burst)
+                headers = {'X-RateLimit-Limit': str(result.limit),
+                           'X-RateLimit-Remaining': str(result.remaining)}
+                if not result:
+                    headers['Retry-After'] = str(
+                        int(math.ceil(result.retry_after)))
+                    return current_app.response_class(
+                        'Too Many Requests', 429, headers=headers)
+
+                @after_this_request
+                def add_headers(response):
+                    for name, value in headers.items():
+                        response.headers.setdefault(name, value)
+                    return response
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,249 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.resilience
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Keeps an unavailable Redis from taking the application down with it.
+
+    Each connection pool created by the extension gets a
+    :class:`CircuitBreaker` when REDIS_CIRCUIT_BREAKER_THRESHOLD is set.
+    After that many consecutive connection errors or timeouts the circuit
+    opens and for REDIS_CIRCUIT_BREAKER_TIMEOUT seconds every command fails
+    immediately with :class:`CircuitOpenError` instead of blocking a worker
+    for REDIS_SOCKET_TIMEOUT. Afterwards a single command is let through
+    as a trial while all others keep failing fast: its success closes the
+    circuit, its failure opens it again. REDIS_SOCKET_CONNECT_TIMEOUT bounds
+    the time a trial waits for an unreachable server. Failed executions of
+    pipelines count like failed commands. Other users of the pool, like
+    pubsub, never report back, so they fail fast until the circuit is
+    closed.
+
+    With REDIS_RETRIES set, idempotent commands failing with a connection
+    error or timeout are repeated up to that many times, sleeping a random
+    time of up to REDIS_RETRY_BACKOFF seconds, doubled per attempt, in
+    between ("full jitter"), so clients do not retry in lockstep. Other
+    commands, pipelines and transactions are never repeated as their effect
+    may already have been applied.
+
+    Sessions can be served in a degraded mode meanwhile, see
+    REDIS_SESSION_FALLBACK and :mod:`flask.ext.redis.session`.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import logging
+import random
+import threading
+import time
+
+import redis
+
+from .instrumentation import timer
+
+logger = logging.getLogger('flask_redis')
+
+#: Commands which can be repeated without changing their effect. Commands
+#: of conditional or relative effect, like ``SET NX`` or INCR, are missing.
+IDEMPOTENT_COMMANDS = frozenset([
+    'BITCOUNT', 'BITPOS', 'DBSIZE', 'DEL', 'DUMP', 'EXISTS', 'EXPIRE',
+    'EXPIREAT', 'GEODIST', 'GEOHASH', 'GEOPOS', 'GET', 'GETBIT', 'GETRANGE',
+    'HDEL', 'HEXISTS', 'HGET', 'HGETALL', 'HKEYS', 'HLEN', 'HMGET', 'HMSET',
+    'HSCAN', 'HSTRLEN', 'HVALS', 'KEYS', 'LINDEX', 'LLEN', 'LRANGE', 'MGET',
+    'MSET', 'PERSIST', 'PEXPIRE', 'PEXPIREAT', 'PFCOUNT', 'PING', 'PSETEX',
+    'PTTL', 'RANDOMKEY', 'SCAN', 'SCARD', 'SDIFF', 'SETEX', 'SINTER',
+    'SISMEMBER', 'SMEMBERS', 'SRANDMEMBER', 'SREM', 'SSCAN', 'STRLEN',
+    'SUNION', 'TTL', 'TYPE', 'UNLINK', 'XLEN', 'XRANGE', 'XREVRANGE',
+    'ZCARD', 'ZCOUNT', 'ZLEXCOUNT', 'ZRANGE', 'ZRANGEBYLEX',
+    'ZRANGEBYSCORE', 'ZRANK', 'ZREM', 'ZREVRANGE', 'ZREVRANGEBYLEX',
+    'ZREVRANGEBYSCORE', 'ZREVRANK', 'ZSCAN', 'ZSCORE'
+])
+
+#: Errors telling that the server could not be reached in time.
+CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """Raised instead of connecting while the circuit is open. Being a
+    :class:`redis.ConnectionError`, it is handled like the errors which
+    opened the circuit.
+    """
+
+
+class CircuitBreaker(object):
+    """Counts consecutive connection failures of a server and opens the
+    circuit once they reach `failure_threshold`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, name=None):
+        """
+
+        :param failure_threshold: int -- consecutive failures opening the
+                                  circuit
+        :param reset_timeout: seconds the circuit stays open before a trial
+                              command is let through
+        :param name: str -- server named in errors and log messages
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        #: Consecutive failures so far.
+        self.failures = 0
+        self.opened_at = None
+        self._probe_at = None
+        self._prober = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """``'closed'``, ``'open'`` or ``'half-open'`` once a trial command
+        may be let through.
+        """
+        opened_at = self.opened_at
+        if opened_at is None:
+            return 'closed'
+        if timer() - opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def check(self, probe=True):
+        """Raises :class:`CircuitOpenError` while the circuit is open and,
+        once half-open, unless the caller runs the trial command. A trial
+        never reported back is given up after `reset_timeout` seconds.
+
+        :param probe: bool -- whether the caller may run the trial, which
+                      requires reporting its outcome to :meth:`success` or
+                      :meth:`failure`; otherwise only the thread which
+                      claimed the pending trial is let through, to connect
+                      for it
+        """
+        opened_at = self.opened_at
+        if opened_at is None:
+            return
+        now = timer()
+        if now - opened_at < self.reset_timeout:
+            raise CircuitOpenError(
+                'Circuit of %s open after %d failures, retrying in %.1fs'
+                % (self.name or 'Redis', self.failures,
+                   self.reset_timeout - (now - opened_at)))
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self._probe_at is not None and \
+                    now - self._probe_at < self.reset_timeout:
+                if not probe and self._prober is threading.current_thread():
+                    return
+            elif probe:
+                self._probe_at = now
+                self._prober = threading.current_thread()
+                return
+        raise CircuitOpenError(
+            'Circuit of %s half-open, waiting for a trial command'
+            % (self.name or 'Redis'))
+
+    def success(self):
+        """Closes the circuit after a successful command."""
+        if self.failures:
+            with self._lock:
+                if self.opened_at is not None:
+                    logger.warning('Circuit of %s closed',
+                                   self.name or 'Redis')
+                self.failures = 0
+                self.opened_at = None
+                self._probe_at = None
+                self._prober = None
+
+    def failure(self):
+        """Counts a failed command, opening the circuit at the threshold or
+        reopening it after a failed trial.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning('Circuit of %s opened after %d failures',
+                                   self.name or 'Redis', self.failures)
+                self.opened_at = timer()
+                self._probe_at = None
+                self._prober = None
+
+
+class ResilientPipeline(redis.client.Pipeline):
+    """Pipeline reporting failed and successful executions to the
+    :class:`CircuitBreaker` of its pool. Executions are never repeated.
+    """
+
+    def execute(self, raise_on_error=True):
+        breaker = getattr(self.connection_pool, 'breaker', None)
+        if breaker is None or not self.command_stack:
+            return super(ResilientPipeline, self).execute(raise_on_error)
+        breaker.check()
+        try:
+            response = super(ResilientPipeline, self).execute(
+                raise_on_error)
+        except CircuitOpenError:
+            raise
+        except CONNECTION_ERRORS:
+            breaker.failure()
+            raise
+        except redis.ResponseError:
+            # the server replied
+            breaker.success()
+            raise
+        breaker.success()
+        return response
+
+
+class ResilientRedis(redis.StrictRedis):
+    """:class:`redis.StrictRedis` reporting connection failures to the
+    :class:`CircuitBreaker` of its pool and retrying idempotent commands.
+    """
+    pipeline_class = ResilientPipeline
+
+    def __init__(self, retries=0, retry_backoff=0.05, **kwargs):
+        """
+
+        :param retries: int -- repetitions of failed idempotent commands
+        :param retry_backoff: seconds the first repetition is delayed by at
+                              most
+        """
+        super(ResilientRedis, self).__init__(**kwargs)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+    def execute_command(self, *args, **options):
+        breaker = getattr(self.connection_pool, 'breaker', None)
+        retries = 0
+        if self.retries and str(args[0]).upper() in IDEMPOTENT_COMMANDS:
+            retries = self.retries
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check()
+            try:
+                response = super(ResilientRedis, self).execute_command(
+                    *args, **options)
+            except CircuitOpenError:
+                raise
+            except CONNECTION_ERRORS:
+                if breaker is not None:
+                    breaker.failure()
+                if attempt >= retries:
+                    raise
+                backoff = self.retry_backoff * 2 ** attempt
+                time.sleep(random.uniform(0, backoff))
+                attempt += 1
+            except redis.ResponseError:
+                # the server replied
+                if breaker is not None:
+                    breaker.success()
+                raise
+            else:
+                if breaker is not None:
+                    breaker.success()
+                return response
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return self.pipeline_class(self.connection_pool,
+                                   self.response_callbacks, transaction,
+                                   shard_hint)
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.scripting
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Lua scripts run through pipelines. Scripts are queued by their digest
+    with :func:`queue_script`; when the server lost its script cache, e.g.
+    by a restart, those calls fail with NOSCRIPT and :func:`reload_scripts`
+    loads the scripts again.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import redis
+
+
+class Scripts(object):
+    """Scripts registered on first use, by source."""
+
+    def __init__(self):
+        self._scripts = {}
+
+    def get(self, client, source):
+        """Returns the script of `source`, registered with `client` on
+        first use.
+
+        :param client: :class:`redis.StrictRedis`
+        :param source: str
+        :rtype: redis.commands.core.Script
+        """
+        script = self._scripts.get(source)
+        if script is None:
+            # digests the script locally, no round trip
+            script = self._scripts[source] = client.register_script(source)
+        return script
+
+
+def queue_script(pipe, script, keys=(), args=()):
+    """Queues a call of `script` into `pipe`.
+
+    :param pipe: :class:`redis.client.Pipeline`
+    :param script: :class:`redis.commands.core.Script`
+    """
+    # by digest, as scripts run through a pipeline cost a SCRIPT EXISTS
+    # round trip each
+    return pipe.evalsha(script.sha, len(keys), *(list(keys) + list(args)))
+
+
+def reload_scripts(client, replies, *sources):
+    """Loads the scripts `sources` into the script cache of the server again
+    when one of `replies` of a pipeline is a
+    :class:`redis.exceptions.NoScriptError`.
+
+    :param client: :class:`redis.StrictRedis`
+    :param replies: list of replies of :meth:`redis.client.Pipeline.execute`
+                    with `raise_on_error` disabled
+    :returns: bool -- whether the scripts were loaded
+    """
+    if not any(isinstance(reply, redis.exceptions.NoScriptError)
+               for reply in replies):
+        return False
+    for source in sources:
+        client.script_load(source)
+    return True
@@ -0,0 +1,159 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.serializers
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Serializers for values stored by the extension. Every value is prefixed
+    with the one-byte tag of the serializer which produced it, so the
+    serializer can be switched without invalidating stored data. Untagged
+    values are loaded with :mod:`pickle` as written by earlier versions.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import abc
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from flask.sessions import session_json_serializer
+
+from .compression import _compressors_by_tag
+
+
+class Serializer(abc.ABC):
+    """Base class of serializers. Subclasses set a unique :attr:`tag` and
+    implement :meth:`dumps` and :meth:`loads`.
+    """
+    #: One byte identifying the format of stored values.
+    tag = None
+
+    @abc.abstractmethod
+    def dumps(self, data):
+        """
+
+        :param data: dict
+        :returns: bytes
+        """
+
+    @abc.abstractmethod
+    def loads(self, value):
+        """
+
+        :param value: bytes
+        :returns: dict
+        """
+
+
+class PickleSerializer(Serializer):
+    """Binary :mod:`pickle` using the highest available protocol."""
+    tag = b'\x01'
+
+    def dumps(self, data):
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, value):
+        return pickle.loads(value)
+
+
+class JSONSerializer(Serializer):
+    """Flask's tagged JSON, which also round-trips tuples, bytes,
+    :class:`datetime.datetime` and :class:`flask.Markup` values.
+    """
+    tag = b'\x02'
+
+    def dumps(self, data):
+        return session_json_serializer.dumps(data).encode('utf-8')
+
+    def loads(self, value):
+        return session_json_serializer.loads(value.decode('utf-8'))
+
+
+class MsgpackSerializer(Serializer):
+    """`MessagePack <http://msgpack.org/>`_, requires :mod:`msgpack`.
+    Tuples are loaded as lists.
+    """
+    tag = b'\x03'
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, value):
+        return msgpack.unpackb(value, raw=False)
+
+
+#: Serializers by name, see :func:`register_serializer`.
+serializers = {}
+_serializers_by_tag = {}
+
+
+def register_serializer(name, serializer):
+    """Makes `serializer` available by `name`, e.g. for the
+    REDIS_SESSION_SERIALIZER configuration. Tags of the compressors of
+    :mod:`flask.ext.redis.compression` cannot be used.
+
+    :param name: str
+    :param serializer: :class:`Serializer`
+    """
+    if len(serializer.tag or b'') != 1:
+        raise ValueError('Serializer tag must be a single byte')
+    if serializer.tag in _compressors_by_tag:
+        raise ValueError('Serializer tag %r is reserved for compression' %
+                         serializer.tag)
+    existing = _serializers_by_tag.get(serializer.tag)
+    if existing is not None and existing is not serializers.get(name):
+        raise ValueError('Serializer tag %r is already in use' %
+                         serializer.tag)
+    serializers[name] = serializer
+    _serializers_by_tag[serializer.tag] = serializer
+
+
+def get_serializer(serializer):
+    """Returns the registered serializer named `serializer`. Instances of
+    :class:`Serializer` are returned as is.
+
+    :param serializer: str or :class:`Serializer`
+    :rtype: Serializer
+    """
+    if isinstance(serializer, Serializer):
+        return serializer
+    try:
+        return serializers[serializer]
+    except KeyError:
+        raise ValueError('Unknown serializer %r' % serializer)
+
+
+def dumps(data, serializer):
+    """Serializes `data` and prefixes the tag of `serializer`.
+
+    :param data: dict
+    :param serializer: :class:`Serializer`
+    :returns: bytes
+    """
+    return serializer.tag + serializer.dumps(data)
+
+
+def loads(value):
+    """Deserializes `value` with the serializer its tag refers to.
+
+    :param value: bytes
+    :returns: dict
+    """
+    serializer = _serializers_by_tag.get(value[:1])
+    if serializer is None:
+        return pickle.loads(value)
+    return serializer.loads(value[1:])
+
+
+register_serializer('pickle', PickleSerializer())
+register_serializer('json', JSONSerializer())
+if msgpack is not None:
+    register_serializer('msgpack', MsgpackSerializer())
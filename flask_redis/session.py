@@ -10,19 +10,99 @@
     :author: Tobias Werner <mail@tobiaswerner.net>
     :license: BSD, see LICENSE for more details.
 """
-import cPickle
-import uuid
-import hashlib
+import base64
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import timedelta
 
+from itsdangerous import BadSignature
 from werkzeug.datastructures import CallbackDict
-from flask.sessions import SessionMixin, SessionInterface
+from flask.sessions import (SecureCookieSessionInterface, SessionMixin,
+                            SessionInterface)
+
+from . import compression, serializers
+from .resilience import CONNECTION_ERRORS
+
+try:
+    from secrets import token_urlsafe
+except ImportError:
+    def token_urlsafe(nbytes):
+        token = base64.urlsafe_b64encode(os.urandom(nbytes)).rstrip(b'=')
+        return token.decode('ascii')
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if not isinstance(value, type(u'')):
+        return str(value)
+    return value
+
+
+def _float(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def _degradable_open(open_session):
+    """Makes `open_session` fall back to
+    :meth:`RedisSessionInterface.open_degraded_session` while Redis is
+    unavailable.
+    """
+    @functools.wraps(open_session)
+    def wrapper(self, app, request):
+        if self.fallback is None:
+            return open_session(self, app, request)
+        try:
+            session = open_session(self, app, request)
+            if self.fallback == 'cookie' and \
+                    self.get_fallback_cookie_name(app) in request.cookies:
+                session = self._restore_fallback(app, request, session)
+            return session
+        except CONNECTION_ERRORS as error:
+            app.logger.warning('Redis unavailable, serving a degraded '
+                               'session: %s', error)
+            return self.open_degraded_session(app, request)
+    return wrapper
+
+
+def _degradable_save(save_session):
+    """Makes `save_session` save degraded sessions and sessions it cannot
+    save to Redis with :meth:`RedisSessionInterface.save_degraded_session`.
+    """
+    @functools.wraps(save_session)
+    def wrapper(self, app, session, response):
+        if self.fallback is None:
+            return save_session(self, app, session, response)
+        if not session.degraded:
+            try:
+                save_session(self, app, session, response)
+                if session.restored:
+                    response.delete_cookie(
+                        self.get_fallback_cookie_name(app),
+                        domain=self.get_cookie_domain(app))
+                return
+            except CONNECTION_ERRORS as error:
+                app.logger.warning('Redis unavailable, session not saved: '
+                                   '%s', error)
+        return self.save_degraded_session(app, session, response)
+    return wrapper
 
 
 class RedisSession(CallbackDict, SessionMixin):
     """Session data mapping"""
+    #: ID of the user whose index listed the session when it was loaded.
+    indexed_user = None
+    #: Whether the session was opened while Redis was unavailable.
+    degraded = False
+    #: Whether a fallback cookie was found with Redis available again.
+    restored = False
 
-    def __init__(self, initial=None, sid=None, new=False):
+    def __init__(self, initial=None, sid=None, new=False, refreshed_at=None):
         def on_update(obj):
             obj.modified = True
 
@@ -30,29 +110,227 @@ class RedisSession(CallbackDict, SessionMixin):
         self.sid = sid
         self.new = new
         self.modified = False
+        self.refreshed_at = refreshed_at
+
+
+class LocalSessionCache(object):
+    """Size-bounded LRU of the serialized data of sessions used by this
+    process, keyed by session ID. Each entry carries the version stamp the
+    session had when it was cached, so it is only used while the stamp
+    stored in Redis is unchanged, see :class:`RedisSessionInterface`.
+
+    Data is kept uncompressed but serialized, and deserialized for each
+    request, so no two requests share the nested values of a session.
+    """
+
+    def __init__(self, max_size=1024):
+        """
+
+        :param max_size: int -- maximum number of cached sessions
+        """
+        self.max_size = max_size
+        self.hits = 0
+        #: Lookups of sessions not cached.
+        self.misses = 0
+        #: Lookups of sessions changed by another process since cached.
+        self.stale = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, sid):
+        return sid in self._entries
+
+    def lookup(self, sid):
+        """Tells whether session `sid` is cached, counting a miss if not.
+
+        :rtype: bool
+        """
+        if sid in self._entries:
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, sid, version):
+        """Returns the cached serialized data of session `sid` if it still
+        has the version stamp `version`, dropping it otherwise.
+
+        :rtype: bytes
+        """
+        version = _text(version) if version is not None else None
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != version:
+                self.stale += 1
+                return None
+            # re-insert as most recently used
+            self._entries[sid] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, sid, version, data):
+        """Caches the serialized `data` of session `sid` having the version
+        stamp `version`.
+
+        :param data: bytes
+        """
+        with self._lock:
+            self._entries.pop(sid, None)
+            self._entries[sid] = (_text(version), data)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, sid):
+        """Drops session `sid` from the cache."""
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def stats(self):
+        """Returns the number of hits, misses, stale entries, evictions and
+        cached sessions and the ratio of lookups which were hits.
+
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses + self.stale
+        return dict(hits=self.hits, misses=self.misses, stale=self.stale,
+                    evictions=self.evictions, size=len(self._entries),
+                    hit_ratio=float(self.hits) / lookups if lookups else 0.0)
 
 
 class RedisSessionInterface(SessionInterface):
-    """Session interface for providing redis-based session."""
-    __serializer = cPickle
+    """Session interface for providing redis-based session.
+
+    New sessions get no ID until they are saved with data for the first
+    time, so requests which never write to the session, e.g. of crawlers,
+    cost neither an ID nor a key or a cookie.
+
+    With `user_key` set the IDs of the sessions of each user, as stored in
+    the session under `user_key`, are kept in a set, so all sessions of a
+    user can be found and deleted without scanning, see
+    :meth:`get_user_sessions` and :meth:`delete_user_sessions`.
+
+    With a `fallback` requests are served while Redis is unavailable instead
+    of failing: ``'empty'`` opens empty sessions and drops changes,
+    ``'cookie'`` keeps sessions in a signed cookie named like the session
+    cookie with suffix ``_fallback`` meanwhile, see
+    :meth:`open_degraded_session`. The cookie holding the session ID is left
+    alone, so users get their stored sessions back when Redis returns. Users
+    without a stored session get the data of their fallback cookie stored
+    instead.
+    Sessions of :class:`~flask.ext.redis.aio.AsyncRedisSessionInterface`
+    are never degraded.
+    """
     __session_class = RedisSession
+    #: Suffix of the key holding the data of a session.
+    key_suffix = 'data'
 
-    def __init__(self, redis, prefix='session:'):
+    def __init__(self, redis, prefix='session:', serializer='pickle',
+                 compressor=None, compression_threshold=1024,
+                 hash_tags=False, sid_bytes=24, user_key=None,
+                 fallback=None, local_cache=None):
         """
 
         :param redis: :class:`redis.StrictRedis`
         :param prefix: str
+        :param serializer: name of a serializer registered in
+                           :mod:`flask.ext.redis.serializers` or an instance
+                           of :class:`~flask.ext.redis.serializers.Serializer`
+                           used to store sessions. Sessions stored with other
+                           serializers remain readable.
+        :param compressor: name of a compressor from
+                           :mod:`flask.ext.redis.compression` or an instance
+                           of :class:`~flask.ext.redis.compression.Compressor`
+                           applied to serialized sessions, `None` to store
+                           them uncompressed.
+        :param compression_threshold: int -- serialized sessions smaller than
+                                      this many bytes are never compressed
+        :param hash_tags: bool -- wrap the session ID in keys into braces,
+                          making Redis Cluster store all keys of a session
+                          in the same slot
+        :param sid_bytes: int -- random bytes of entropy per session ID, at
+                          least 16
+        :param user_key: str -- session key holding the ID of the user,
+                         `None` to keep no index of the sessions per user
+        :param fallback: ``'empty'`` or ``'cookie'`` to degrade sessions
+                         while Redis is unavailable, `None` to fail
+        :param local_cache: :class:`LocalSessionCache` of this process,
+                            `None` to fetch sessions in full every time
         """
+        if sid_bytes < 16:
+            raise ValueError('Session IDs need at least 16 random bytes')
+        if fallback not in (None, 'empty', 'cookie'):
+            raise ValueError('Unknown session fallback %r' % (fallback,))
         self.redis = redis
         self.prefix = prefix
+        self.serializer = serializers.get_serializer(serializer)
+        self.compressor = compression.get_compressor(compressor)
+        self.compression_threshold = compression_threshold
+        self.hash_tags = hash_tags
+        self.sid_bytes = sid_bytes
+        self.user_key = user_key
+        self.fallback = fallback
+        self.local_cache = local_cache
+        self._cookie_interface = SecureCookieSessionInterface()
+
+    def generate_sid(self):
+        """Generates a session ID of :attr:`sid_bytes` random bytes from
+        the operating system's CSPRNG, encoded URL-safe base64.
+
+        :returns: str
+        """
+        return token_urlsafe(self.sid_bytes)
+
+    def dump_value(self, value):
+        """Serializes and, when large enough, compresses `value`.
+
+        :returns: bytes
+        """
+        return compression.compress(
+            serializers.dumps(value, self.serializer),
+            self.compressor, self.compression_threshold)
 
     @staticmethod
-    def generate_sid():
-        """Generates a session ID.
+    def load_value(value):
+        """Reverses :meth:`dump_value`.
 
+        :param value: bytes
+        """
+        return serializers.loads(compression.decompress(value))
+
+    def get_redis_key(self, sid, suffix='data'):
+        """Returns the name of the redis key holding `suffix` of the session
+        identified by `sid`, e.g. ``session:<sid>:data`` or
+        ``session:{<sid>}:data`` with :attr:`hash_tags` set.
+
+        :param sid: str
+        :param suffix: str
         :returns: str
         """
-        return hashlib.sha1(str(uuid.uuid4()) + str(uuid.uuid1())).hexdigest()
+        if self.hash_tags:
+            return self.prefix + '{' + sid + '}:' + suffix
+        return self.prefix + sid + ':' + suffix
+
+    def get_session_keys(self, sid):
+        """Returns the names of all keys of the session identified by `sid`.
+
+        :returns: list of str
+        """
+        keys = [self.get_redis_key(sid), self.get_redis_key(sid, 'refreshed')]
+        if self.local_cache is not None:
+            keys.append(self.get_redis_key(sid, 'version'))
+        return keys
+
+    def get_user_index_key(self, user_id):
+        """Returns the name of the set indexing the sessions of the user
+        identified by `user_id`.
+
+        :returns: str
+        """
+        return self.prefix + 'user:' + _text(user_id)
 
     @staticmethod
     def get_redis_expiration_time(app, session):
@@ -68,11 +346,18 @@ class RedisSessionInterface(SessionInterface):
             return app.permanent_session_lifetime
         return timedelta(days=1)
 
+    @_degradable_open
     def open_session(self, app, request):
         """Creates an instance of :class:`RedisSession` with corresponding
-        data from the redis instance or a new and empty instance when no data
-        exists. Also creates a new instance with generated ID on spoofed IDs
-        preventing session fixation.
+        data from the redis instance or a new and empty instance without ID
+        when no data exists. Spoofed IDs are dropped as well, preventing
+        session fixation; a new ID is generated once the session is saved.
+
+        The data is fetched with a single GET, a nil reply meaning the ID is
+        unknown. This saves the EXISTS round trip and closes the window in
+        which the key could expire between both commands. When
+        REDIS_SESSION_REFRESH_INTERVAL is set the time of the last expiration
+        refresh is fetched along with the data using MGET.
 
         :param app: :class:`flask.Flask`
         :type app: flask.Flask
@@ -81,18 +366,105 @@ class RedisSessionInterface(SessionInterface):
         :returns: RedisSession -- instance of :attr:`__session_class`
         """
         sid = request.cookies.get(app.session_cookie_name)
-        if not sid or not self.redis.exists(self.prefix + sid + ':data'):
-            sid = self.generate_sid()
-            return self.__session_class(sid=sid, new=True)
+        if sid:
+            if self.local_cache is None:
+                data, refreshed_at = self._fetch(app, sid)
+            else:
+                data, refreshed_at = self._fetch_cached(app, sid)
+            if data is not None:
+                return self._opened(self.__session_class(
+                    data, sid=sid, refreshed_at=refreshed_at))
+        return self.__session_class(new=True)
+
+    def _fetch(self, app, sid):
+        """Fetches the data of session `sid` and the time of its last
+        expiration refresh.
+
+        :returns: tuple of dict and float, `None` if unknown
+        """
+        key = self.get_redis_key(sid)
+        refreshed_at = None
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            val, refreshed_at = self.redis.mget(
+                key, self.get_redis_key(sid, 'refreshed'))
+        else:
+            val = self.redis.get(key)
+        if val is None:
+            return None, None
+        return self.load_value(val), _float(refreshed_at)
+
+    def _fetch_cached(self, app, sid):
+        """Like :meth:`_fetch`, but takes the data from :attr:`local_cache`
+        if its version stamp is current, fetching only the stamp along with
+        the time of the last refresh. Otherwise the data is fetched with its
+        stamp and cached.
+        """
+        keys = self._version_keys(app, sid)
+        if self.local_cache.lookup(sid):
+            if len(keys) > 1:
+                version, refreshed_at = self.redis.mget(keys)
+            else:
+                version, refreshed_at = self.redis.get(keys[0]), None
+            data = self.local_cache.get(sid, version)
+            if data is not None:
+                return serializers.loads(data), _float(refreshed_at)
+        return self._cache_fetched(
+            sid, self.redis.mget([self.get_redis_key(sid)] + keys))
+
+    def _version_keys(self, app, sid):
+        """Returns the keys of the version stamp of session `sid` and, with
+        REDIS_SESSION_REFRESH_INTERVAL set, of the time of its last refresh.
+
+        :returns: list of str
+        """
+        keys = [self.get_redis_key(sid, 'version')]
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            keys.append(self.get_redis_key(sid, 'refreshed'))
+        return keys
+
+    def _cache_fetched(self, sid, replies):
+        """Caches the data of session `sid` fetched along with the keys of
+        :meth:`_version_keys`.
 
-        val = self.redis.get(self.prefix + sid + ':data')
-        data = self.__serializer.loads(val)
-        return self.__session_class(data, sid=sid)
+        :returns: tuple of dict and float, `None` if unknown
+        """
+        if replies[0] is None:
+            self.local_cache.discard(sid)
+            return None, None
+        data = compression.decompress(replies[0])
+        if replies[1] is not None:
+            self.local_cache.put(sid, replies[1], data)
+        return (serializers.loads(data),
+                _float(replies[2] if len(replies) > 2 else None))
+
+    def should_refresh_session(self, app, session):
+        """Tells whether the expiration time of an unmodified session is due
+        to be refreshed. Controlled by REDIS_SESSION_REFRESH_EACH_REQUEST and
+        throttled to once every REDIS_SESSION_REFRESH_INTERVAL seconds.
 
+        :param app: :class:`flask.Flask`
+        :type app: flask.Flask
+        :param session: :class:`RedisSession`
+        :type session: RedisSession
+        :returns: bool
+        """
+        if not app.config['REDIS_SESSION_REFRESH_EACH_REQUEST']:
+            return False
+        interval = app.config['REDIS_SESSION_REFRESH_INTERVAL']
+        if not interval or session.refreshed_at is None:
+            return True
+        return time.time() - session.refreshed_at >= interval
+
+    @_degradable_save
     def save_session(self, app, session, response):
         """Saves session dict to redis and updating expiration time.
         Additionally deletes cookie when dict was emptied.
 
+        Unmodified sessions are not serialized again, only their expiration
+        time is refreshed with EXPIRE when :meth:`should_refresh_session`
+        agrees. The cookie is sent when the session was modified or when the
+        refreshed session is permanent, its expiration date moving along.
+
         :param app: :class:`flask.Flask`
         :type app: flask.Flask
         :param session: :class:`RedisSession`
@@ -101,19 +473,620 @@ class RedisSessionInterface(SessionInterface):
         :type response: flask.Response
         :returns: None
         """
-        domain = self.get_cookie_domain(app)
         if not session:
-            self.redis.delete(self.prefix + session.sid + ':data')
+            if not session.new:
+                self.redis.delete(*self._deleted_keys(app, session))
+                self._unindex(session)
             if session.modified:
                 response.delete_cookie(app.session_cookie_name,
-                                       domain=domain)
+                                       domain=self.get_cookie_domain(app))
             return
+
+        if not session.modified:
+            if not self.should_refresh_session(app, session):
+                return
+        pipe = self.redis.pipeline(transaction=False)
+        saved = self._queue_save(app, session, pipe)
+        pipe.execute()
+        self._saved(session, *saved)
+
+        if session.modified or session.permanent:
+            self._set_cookie(app, session, response)
+
+    def _deleted_keys(self, app, session):
+        """Returns the keys to delete along with the emptied `session`,
+        dropping it from :attr:`local_cache`.
+
+        :returns: list of str
+        """
+        keys = [self.get_redis_key(session.sid)]
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            keys.append(self.get_redis_key(session.sid, 'refreshed'))
+        if self.local_cache is not None:
+            keys.append(self.get_redis_key(session.sid, 'version'))
+            self.local_cache.discard(session.sid)
+        return keys
+
+    def _queue_save(self, app, session, pipe):
+        """Adds the commands storing `session` or refreshing its expiration
+        time to `pipe`, generating its ID if needed.
+
+        :returns: tuple of the new version stamp and the serialized data,
+                  `None` each unless they are to be cached
+        """
         redis_exp = self.get_redis_expiration_time(app, session)
-        cookie_exp = self.get_expiration_time(app, session)
-        key = self.prefix + session.sid + ':data'
         seconds = int(redis_exp.total_seconds())
-        value = self.__serializer.dumps(dict(session))
-        self.redis.setex(key, seconds, value)
+        key = self.get_redis_key(self._ensure_sid(session))
+        version = data = None
+        if session.modified:
+            data = serializers.dumps(dict(session), self.serializer)
+            pipe.setex(key, seconds, compression.compress(
+                data, self.compressor, self.compression_threshold))
+        else:
+            pipe.expire(key, seconds)
+        if self.local_cache is not None:
+            version_key = self.get_redis_key(session.sid, 'version')
+            if session.modified:
+                version = token_urlsafe(8)
+                pipe.setex(version_key, seconds, version)
+            else:
+                pipe.expire(version_key, seconds)
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            pipe.setex(self.get_redis_key(session.sid, 'refreshed'), seconds,
+                       repr(time.time()))
+        self._index(app, pipe, session)
+        return version, data
+
+    def _saved(self, session, version, data):
+        """Caches the data of `session` once the commands of
+        :meth:`_queue_save` were executed.
+        """
+        if version is not None:
+            self.local_cache.put(session.sid, version, data)
+
+    def _opened(self, session):
+        """Remembers the user `session` is indexed for.
+
+        :returns: `session`
+        """
+        if self.user_key is not None:
+            session.indexed_user = session.get(self.user_key)
+        return session
+
+    def _index(self, app, pipe, session):
+        """Adds the commands updating the user index of `session` to `pipe`.
+        Indexes live as long as the longest-living session might.
+        """
+        if self.user_key is None:
+            return
+        user = session.get(self.user_key)
+        if session.indexed_user is not None and session.indexed_user != user:
+            pipe.srem(self.get_user_index_key(session.indexed_user),
+                      session.sid)
+        if user is not None:
+            index = self.get_user_index_key(user)
+            lifetime = max(timedelta(days=1), app.permanent_session_lifetime)
+            pipe.sadd(index, session.sid)
+            pipe.expire(index, int(lifetime.total_seconds()))
+        session.indexed_user = user
+
+    def _unindex(self, session):
+        """Removes the deleted `session` from its user's index."""
+        if session.indexed_user is not None:
+            self.redis.srem(self.get_user_index_key(session.indexed_user),
+                            session.sid)
+            session.indexed_user = None
+
+    def get_user_sessions(self, user_id):
+        """Returns the IDs of the stored sessions of the user identified by
+        `user_id`. Sessions which expired meanwhile are dropped from the
+        index.
+
+        :returns: list of str
+        """
+        index = self.get_user_index_key(user_id)
+        sids = [_text(sid) for sid in self.redis.smembers(index)]
+        if not sids:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for sid in sids:
+            pipe.exists(self.get_redis_key(sid, self.key_suffix))
+        live = []
+        expired = []
+        for sid, exists in zip(sids, pipe.execute()):
+            (live if exists else expired).append(sid)
+        if expired:
+            self.redis.srem(index, *expired)
+        return live
+
+    def delete_user_sessions(self, user_id):
+        """Deletes all sessions of the user identified by `user_id`, e.g. to
+        log the user out everywhere.
+
+        :returns: int -- number of sessions deleted
+        """
+        index = self.get_user_index_key(user_id)
+        sids = [_text(sid) for sid in self.redis.smembers(index)]
+        deleted = self.delete_sessions(sids)
+        self.redis.delete(index)
+        return deleted
+
+    def delete_sessions(self, sids):
+        """Deletes the sessions identified by `sids` in a single pipeline.
+        The user indexes listing them drop them once they are read.
+
+        :returns: int -- number of sessions deleted
+        """
+        if not sids:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for sid in sids:
+            pipe.delete(*self.get_session_keys(sid))
+        return sum(1 for deleted in pipe.execute() if deleted)
+
+    def scan_sessions(self, batch_size=1000):
+        """Iterates over the IDs of all stored sessions in lists of up to
+        `batch_size` using SCAN, which never blocks the server like KEYS.
+        As guaranteed by SCAN every session present during the whole
+        iteration is returned, though possibly more than once.
+
+        :returns: iterator of lists of str
+        """
+        pattern = self.get_redis_key('*', self.key_suffix)
+        head = len(self.prefix) + (1 if self.hash_tags else 0)
+        tail = len(self.key_suffix) + (2 if self.hash_tags else 1)
+        batch = []
+        for key in self.redis.scan_iter(match=pattern, count=batch_size):
+            batch.append(_text(key)[head:-tail])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def inspect_sessions(self, sids):
+        """Returns the seconds to live, the seconds since the last access
+        and the memory used in bytes of the sessions identified by `sids`,
+        fetched in a single pipeline. Values unknown to the server are
+        `None`, e.g. the idle time with an LFU eviction policy.
+
+        :returns: list of dict
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for sid in sids:
+            key = self.get_redis_key(sid, self.key_suffix)
+            pipe.ttl(key)
+            pipe.object('idletime', key)
+            for key in self.get_session_keys(sid):
+                pipe.memory_usage(key)
+        replies = iter(pipe.execute(raise_on_error=False))
+        sessions = []
+        for sid in sids:
+            ttl, idle = next(replies), next(replies)
+            size = 0
+            for _ in self.get_session_keys(sid):
+                usage = next(replies)
+                if isinstance(usage, int):
+                    size += usage
+            sessions.append(dict(
+                sid=sid, ttl=ttl if isinstance(ttl, int) else None,
+                idle=idle if isinstance(idle, int) else None, bytes=size))
+        return sessions
+
+    def find_unreadable_sessions(self, sids):
+        """Returns the IDs of the sessions among `sids` whose data can no
+        longer be loaded, e.g. after a release removed a pickled class.
+
+        :returns: list of str
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for sid in sids:
+            pipe.get(self.get_redis_key(sid))
+        unreadable = []
+        for sid, value in zip(sids, pipe.execute()):
+            if value is not None and not self._loads(value):
+                unreadable.append(sid)
+        return unreadable
+
+    def _loads(self, value):
+        try:
+            self.load_value(value)
+        except Exception:
+            return False
+        return True
+
+    def _ensure_sid(self, session):
+        """Generates the ID of a session saved for the first time.
+
+        :returns: str
+        """
+        if session.sid is None:
+            session.sid = self.generate_sid()
+        return session.sid
+
+    def get_fallback_cookie_name(self, app):
+        """Name of the cookie keeping degraded sessions with the
+        ``'cookie'`` fallback.
+        """
+        return app.session_cookie_name + '_fallback'
+
+    def open_degraded_session(self, app, request):
+        """Opens the session of a request while Redis is unavailable: an
+        empty session, or with the ``'cookie'`` fallback the session kept in
+        the fallback cookie. Degraded sessions have no ID.
+
+        :param app: :class:`flask.Flask`
+        :type app: flask.Flask
+        :param request: :class:`flask.Request`
+        :type request: flask.Request
+        :returns: RedisSession
+        """
+        session = RedisSession(new=True)
+        if self.fallback == 'cookie':
+            session = RedisSession(self._load_fallback_cookie(app, request),
+                                   new=True)
+        session.degraded = True
+        return session
+
+    def _load_fallback_cookie(self, app, request):
+        value = request.cookies.get(self.get_fallback_cookie_name(app))
+        signer = self._cookie_interface.get_signing_serializer(app)
+        if value and signer is not None:
+            max_age = int(app.permanent_session_lifetime.total_seconds())
+            try:
+                return signer.loads(value, max_age=max_age)
+            except BadSignature:
+                pass
+        return {}
+
+    def _restore_fallback(self, app, request, session):
+        """Takes over the data of the fallback cookie into `session` when
+        no session is stored. Redis is pinged first as opening new sessions
+        does not tell whether it is available.
+        """
+        if session.new:
+            self.redis.ping()
+            session.update(self._load_fallback_cookie(app, request))
+        session.restored = True
+        return session
+
+    def save_degraded_session(self, app, session, response):
+        """Saves a degraded session, or a session which could not be saved
+        to Redis, to the fallback cookie with the ``'cookie'`` fallback.
+        Changes are dropped otherwise.
+
+        :param app: :class:`flask.Flask`
+        :type app: flask.Flask
+        :param session: :class:`RedisSession`
+        :type session: RedisSession
+        :param response: :class:`flask.Response`
+        :type response: flask.Response
+        :returns: None
+        """
+        if self.fallback != 'cookie' or not session.modified:
+            return
+        name = self.get_fallback_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        if not session:
+            response.delete_cookie(name, domain=domain)
+            return
+        signer = self._cookie_interface.get_signing_serializer(app)
+        if signer is not None:
+            response.set_cookie(name, signer.dumps(dict(session)),
+                                httponly=True, domain=domain)
+
+    def _set_cookie(self, app, session, response):
+        cookie_exp = self.get_expiration_time(app, session)
         response.set_cookie(app.session_cookie_name, session.sid,
                             expires=cookie_exp, httponly=True,
-                            domain=domain)
\ No newline at end of file
+                            domain=self.get_cookie_domain(app))
+
+
+class RedisHashSession(RedisSession):
+    """Session data mapping remembering the keys set and deleted since it
+    was loaded, see :class:`RedisHashSessionInterface`.
+    """
+
+    def __init__(self, initial=None, sid=None, new=False, refreshed_at=None):
+        RedisSession.__init__(self, initial, sid=sid, new=new,
+                              refreshed_at=refreshed_at)
+        self.changed = set()
+        self.deleted = set()
+        #: Whether :attr:`modified` was set manually, e.g. after a value was
+        #: changed in place, so that all keys are written.
+        self.rewrite = False
+
+        def on_update(obj):
+            # bypasses the setter, changes are tracked by key
+            obj._modified = True
+        self.on_update = on_update
+
+    @property
+    def modified(self):
+        return self._modified
+
+    @modified.setter
+    def modified(self, value):
+        self._modified = value
+        if value:
+            self.rewrite = True
+
+    def _changed(self, key):
+        self.changed.add(key)
+        self.deleted.discard(key)
+
+    def _deleted(self, key):
+        self.deleted.add(key)
+        self.changed.discard(key)
+
+    def __setitem__(self, key, value):
+        RedisSession.__setitem__(self, key, value)
+        self._changed(key)
+
+    def __delitem__(self, key):
+        RedisSession.__delitem__(self, key)
+        self._deleted(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._changed(key)
+        return RedisSession.setdefault(self, key, default)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._deleted(key)
+        return RedisSession.pop(self, key, *default)
+
+    def popitem(self):
+        item = RedisSession.popitem(self)
+        self._deleted(item[0])
+        return item
+
+    def update(self, *args, **kwargs):
+        for key in dict(*args, **kwargs):
+            self._changed(key)
+        RedisSession.update(self, *args, **kwargs)
+
+    def clear(self):
+        for key in list(dict.keys(self)):
+            self._deleted(key)
+        RedisSession.clear(self)
+
+
+_missing = object()
+
+
+class RedisLazyHashSession(RedisHashSession):
+    """:class:`RedisHashSession` knowing only the names of its keys when
+    opened. Each value is fetched by `loader` on first access.
+    """
+
+    def __init__(self, keys=(), sid=None, loader=None, refreshed_at=None):
+        """
+
+        :param keys: names of the stored keys
+        :param sid: str
+        :param loader: callable returning the values of the given list of
+                       keys in a single round trip
+        :param refreshed_at: float
+        """
+        RedisHashSession.__init__(self, dict.fromkeys(keys, _missing),
+                                  sid=sid, refreshed_at=refreshed_at)
+        self.loader = loader
+
+    def _load(self, key):
+        value = dict.__getitem__(self, key)
+        if value is _missing:
+            value = self.loader([key])[0]
+            dict.__setitem__(self, key, value)
+        return value
+
+    def load_all(self):
+        """Fetches all values not loaded yet at once."""
+        keys = [key for key, value in dict.items(self) if value is _missing]
+        if keys:
+            for key, value in zip(keys, self.loader(keys)):
+                dict.__setitem__(self, key, value)
+
+    def __getitem__(self, key):
+        return self._load(key)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self._load(key)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self._load(key)
+        return RedisHashSession.setdefault(self, key, default)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._load(key)
+        return RedisHashSession.pop(self, key, *default)
+
+    def popitem(self):
+        self.load_all()
+        return RedisHashSession.popitem(self)
+
+    def __iter__(self):
+        # defeats the shortcut of dict(session) copying the placeholders,
+        # which then looks up keys() and each key instead
+        return iter(dict.keys(self))
+
+    def keys(self):
+        self.load_all()
+        return RedisHashSession.keys(self)
+
+    def items(self):
+        self.load_all()
+        return RedisHashSession.items(self)
+
+    def values(self):
+        self.load_all()
+        return RedisHashSession.values(self)
+
+    def copy(self):
+        self.load_all()
+        return dict(RedisHashSession.items(self))
+
+
+class RedisHashSessionInterface(RedisSessionInterface):
+    """Session interface storing each session as a redis hash with one
+    serialized field per key. Only the keys set or deleted during a request
+    are written, using HSET and HDEL along with EXPIRE in a single pipeline.
+    When a mutable value was changed in place and
+    :attr:`~RedisSession.modified` set manually, all fields are written.
+
+    With `lazy` set, opening a session fetches the names of its keys only
+    and each value is fetched with HMGET on first access, which pays off for
+    sessions with many large values of which a request only reads a few.
+    """
+    #: Hash field holding the time of the last expiration refresh.
+    refreshed_field = '\x00refreshed'
+    key_suffix = 'fields'
+
+    def __init__(self, redis, prefix='session:', serializer='pickle',
+                 compressor=None, compression_threshold=1024,
+                 hash_tags=False, sid_bytes=24, user_key=None, lazy=False,
+                 fallback=None):
+        RedisSessionInterface.__init__(
+            self, redis, prefix=prefix, serializer=serializer,
+            compressor=compressor,
+            compression_threshold=compression_threshold, hash_tags=hash_tags,
+            sid_bytes=sid_bytes, user_key=user_key, fallback=fallback)
+        self.lazy = lazy
+
+    def get_session_keys(self, sid):
+        return [self.get_redis_key(sid, 'fields')]
+
+    def find_unreadable_sessions(self, sids):
+        pipe = self.redis.pipeline(transaction=False)
+        for sid in sids:
+            pipe.hgetall(self.get_redis_key(sid, 'fields'))
+        unreadable = []
+        for sid, fields in zip(sids, pipe.execute()):
+            for field, value in fields.items():
+                if self._decode_field(field) != self.refreshed_field and \
+                        not self._loads(value):
+                    unreadable.append(sid)
+                    break
+        return unreadable
+
+    @staticmethod
+    def _decode_field(field):
+        if isinstance(field, bytes):
+            return field.decode('utf-8')
+        return field
+
+    @_degradable_open
+    def open_session(self, app, request):
+        """Creates an instance of :class:`RedisHashSession` from the hash of
+        the session, fetched with a single HGETALL, or of
+        :class:`RedisLazyHashSession` when :attr:`lazy` is set. Unknown IDs
+        are dropped as in :meth:`RedisSessionInterface.open_session`.
+
+        :param app: :class:`flask.Flask`
+        :type app: flask.Flask
+        :param request: :class:`flask.Request`
+        :type request: flask.Request
+        :returns: RedisHashSession
+        """
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            key = self.get_redis_key(sid, 'fields')
+            if self.lazy:
+                session = self._open_lazy_session(app, sid, key)
+            else:
+                session = self._open_session(sid, key)
+            if session is not None:
+                return self._opened(session)
+        return RedisHashSession(new=True)
+
+    def _open_session(self, sid, key):
+        fields = self.redis.hgetall(key)
+        if not fields:
+            return None
+        data = {}
+        refreshed_at = None
+        for field, value in fields.items():
+            field = self._decode_field(field)
+            if field == self.refreshed_field:
+                refreshed_at = float(value)
+            else:
+                data[field] = self.load_value(value)
+        return RedisHashSession(data, sid=sid, refreshed_at=refreshed_at)
+
+    def _open_lazy_session(self, app, sid, key):
+        refreshed_at = None
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hkeys(key)
+            pipe.hget(key, self.refreshed_field)
+            fields, refreshed_at = pipe.execute()
+        else:
+            fields = self.redis.hkeys(key)
+        if not fields:
+            return None
+        if refreshed_at is not None:
+            refreshed_at = float(refreshed_at)
+
+        def loader(keys):
+            values = self.redis.hmget(key, keys)
+            return [None if value is None else self.load_value(value)
+                    for value in values]
+
+        keys = [self._decode_field(field) for field in fields]
+        return RedisLazyHashSession(
+            [k for k in keys if k != self.refreshed_field], sid=sid,
+            loader=loader, refreshed_at=refreshed_at)
+
+    @_degradable_save
+    def save_session(self, app, session, response):
+        """Writes the keys of `session` set or deleted during the request
+        and refreshes the expiration time of its hash in a single pipeline.
+        Unmodified sessions are handled as by
+        :meth:`RedisSessionInterface.save_session`.
+
+        :param app: :class:`flask.Flask`
+        :type app: flask.Flask
+        :param session: :class:`RedisHashSession`
+        :type session: RedisHashSession
+        :param response: :class:`flask.Response`
+        :type response: flask.Response
+        :returns: None
+        """
+        if not session:
+            if not session.new:
+                self.redis.delete(self.get_redis_key(session.sid, 'fields'))
+                self._unindex(session)
+            if session.modified:
+                response.delete_cookie(app.session_cookie_name,
+                                       domain=self.get_cookie_domain(app))
+            return
+
+        if not session.modified:
+            if not self.should_refresh_session(app, session):
+                return
+        redis_exp = self.get_redis_expiration_time(app, session)
+        key = self.get_redis_key(self._ensure_sid(session), 'fields')
+
+        pipe = self.redis.pipeline(transaction=False)
+        if session.modified:
+            if (session.changed or session.deleted) and not session.rewrite:
+                items = [(field, session[field]) for field in session.changed]
+            else:
+                items = session.items()
+            for field, value in items:
+                pipe.hset(key, field, self.dump_value(value))
+            if session.deleted:
+                pipe.hdel(key, *session.deleted)
+        if app.config['REDIS_SESSION_REFRESH_INTERVAL']:
+            pipe.hset(key, self.refreshed_field, repr(time.time()))
+        pipe.expire(key, int(redis_exp.total_seconds()))
+        self._index(app, pipe, session)
+        pipe.execute()
+
+        if session.modified or session.permanent:
+            self._set_cookie(app, session, response)
@@ -0,0 +1,221 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.streaming
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Large values such as exports or rendered fragments passed through in
+    chunks, so the memory a worker needs does not grow with their size::
+
+        @app.route('/exports/<name>')
+        def export(name):
+            return redis.send_value('export:' + name, mimetype='text/csv')
+
+        @app.route('/exports/<name>', methods=['PUT'])
+        def upload(name):
+            redis.write_chunked('export:' + name, request.stream)
+            return '', 204
+
+    Plain string values are read with GETRANGE, `prefetch` ranges of
+    `chunk_size` bytes per round trip. A value rewritten while being read
+    would be sent half old and half new, so values which change are better
+    written by :func:`write_chunked`: it stores each chunk as a key of its
+    own and a hash naming the current version, switched in a transaction
+    once all chunks are written. Readers keep reading the version they
+    started with, whose chunks are kept for `grace` seconds after being
+    replaced.
+
+    Uploads are read with ``readinto`` into `prefetch` reused buffers whose
+    :class:`memoryview` slices are sent as they are, without copying them
+    into bytes objects first.
+
+    :func:`write_chunked` and :func:`delete_chunked` switch versions with
+    WATCH and MULTI across the chunk keys, which do not share a slot, so
+    they do not work in cluster mode; reading does.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import uuid
+
+import redis
+
+from .session import _text
+
+#: Bytes per chunk read or written by default.
+CHUNK_SIZE = 256 * 1024
+
+
+def get_chunk_key(key, version, index):
+    """Returns the key of chunk `index` of the `version` of `key`."""
+    return '%s:chunk:%s:%d' % (key, version, index)
+
+
+def _read_manifest(pipe, key):
+    """Returns the version and number of chunks of the chunked value `key`
+    watched by `pipe`, `None` for both when it is a string or missing.
+    """
+    if _text(pipe.type(key)) != 'hash':
+        return None, None
+    return pipe.hmget(key, 'version', 'chunks')
+
+
+def open_value(client, key, chunk_size=CHUNK_SIZE, prefetch=4):
+    """Looks up the string or chunked value `key` in one round trip.
+
+    :param client: :class:`redis.StrictRedis`
+    :param chunk_size: int -- bytes per GETRANGE of string values
+    :param prefetch: int -- chunks fetched per round trip
+    :returns: tuple of the size and an iterator of the chunks of the value,
+              `None` if there is no value
+    """
+    pipe = client.pipeline(transaction=False)
+    pipe.exists(key)
+    pipe.strlen(key)
+    pipe.hmget(key, 'version', 'chunks', 'size')
+    exists, length, manifest = pipe.execute(raise_on_error=False)
+    if not exists:
+        return None
+    if not isinstance(length, Exception):
+        return length, _iter_range(client, key, length, chunk_size,
+                                   prefetch)
+    if isinstance(manifest, Exception) or manifest[0] is None:
+        raise redis.DataError('%r is neither a string nor a chunked value'
+                              % (key,))
+    version, chunks, size = manifest
+    return int(size), _iter_chunks(client, key, _text(version), int(chunks),
+                                   prefetch)
+
+
+def _iter_range(client, key, length, chunk_size, prefetch):
+    step = chunk_size * prefetch
+    for start in range(0, length, step):
+        pipe = client.pipeline(transaction=False)
+        for offset in range(start, min(start + step, length), chunk_size):
+            pipe.getrange(key, offset, min(offset + chunk_size, length) - 1)
+        for chunk in pipe.execute():
+            if not chunk:
+                raise redis.DataError('%r was shortened while being read'
+                                      % (key,))
+            yield chunk
+
+
+def _iter_chunks(client, key, version, chunks, prefetch):
+    for start in range(0, chunks, prefetch):
+        pipe = client.pipeline(transaction=False)
+        for index in range(start, min(start + prefetch, chunks)):
+            pipe.get(get_chunk_key(key, version, index))
+        for chunk in pipe.execute():
+            if chunk is None:
+                raise redis.DataError('Chunks of %r expired while being read'
+                                      % (key,))
+            yield chunk
+
+
+def iter_value(client, key, chunk_size=CHUNK_SIZE, prefetch=4):
+    """Yields the string or chunked value `key` in chunks, nothing if there
+    is no value.
+
+    :param client: :class:`redis.StrictRedis`
+    """
+    opened = open_value(client, key, chunk_size, prefetch)
+    if opened is not None:
+        for chunk in opened[1]:
+            yield chunk
+
+
+def _readinto(fileobj, buf):
+    """Fills `buf` from `fileobj` as far as it goes.
+
+    :returns: int -- number of bytes read, less than the size of `buf` only
+              at the end of `fileobj`
+    """
+    view = memoryview(buf)
+    filled = 0
+    readinto = getattr(fileobj, 'readinto', None)
+    while filled < len(buf):
+        if readinto is not None:
+            count = readinto(view[filled:])
+        else:
+            data = fileobj.read(len(buf) - filled)
+            count = len(data)
+            view[filled:filled + count] = data
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def write_chunked(client, key, fileobj, chunk_size=CHUNK_SIZE, prefetch=4,
+                  ttl=None, grace=60, upload_timeout=3600):
+    """Stores the contents of the file-like `fileobj` as chunked value
+    `key`, replacing the value before once complete.
+
+    :param client: :class:`redis.StrictRedis`
+    :param chunk_size: int -- bytes per chunk
+    :param prefetch: int -- chunks written per round trip, which is the
+                     number of buffers held in memory
+    :param ttl: seconds the value expires after, `None` to keep it
+    :param grace: seconds the chunks of a replaced value are kept for
+                  readers still reading them
+    :param upload_timeout: seconds the chunks of an incomplete upload are
+                           kept
+    :returns: int -- size of the value
+    """
+    version = uuid.uuid4().hex[:16]
+    buffers = [bytearray(chunk_size) for _ in range(prefetch)]
+    pipe = client.pipeline(transaction=False)
+    chunks = size = 0
+    while True:
+        buf = buffers[chunks % prefetch]
+        count = _readinto(fileobj, buf)
+        if count:
+            # kept until the upload completes, should it fail
+            pipe.setex(get_chunk_key(key, version, chunks), upload_timeout,
+                       memoryview(buf)[:count])
+            chunks += 1
+            size += count
+        if count < chunk_size or not chunks % prefetch:
+            # the buffers are reused once written
+            pipe.execute()
+        if count < chunk_size:
+            break
+
+    def switch(pipe):
+        old_version, old_chunks = _read_manifest(pipe, key)
+        pipe.multi()
+        for index in range(chunks):
+            chunk_key = get_chunk_key(key, version, index)
+            if ttl is None:
+                pipe.persist(chunk_key)
+            else:
+                pipe.expire(chunk_key, ttl)
+        if old_version is not None:
+            for index in range(int(old_chunks)):
+                pipe.expire(get_chunk_key(key, _text(old_version), index),
+                            grace)
+        pipe.delete(key)
+        pipe.hset(key, mapping=dict(version=version, chunks=chunks,
+                                    size=size, chunk_size=chunk_size))
+        if ttl is not None:
+            pipe.expire(key, ttl)
+
+    client.transaction(switch, key)
+    return size
+
+
+def delete_chunked(client, key, grace=60):
+    """Deletes the chunked value `key`, keeping its chunks for `grace`
+    seconds for readers still reading them.
+
+    :param client: :class:`redis.StrictRedis`
+    """
+    def delete(pipe):
+        version, chunks = _read_manifest(pipe, key)
+        pipe.multi()
+        if version is not None:
+            for index in range(int(chunks)):
+                pipe.expire(get_chunk_key(key, _text(version), index), grace)
+        pipe.delete(key)
+
+    client.transaction(delete, key)
@@ -0,0 +1,503 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.tasks
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Lightweight job queue for deferred work like sending emails or warming
+    caches::
+
+        @redis.task(retries=3)
+        def send_welcome_mail(user_id):
+            ...
+
+        send_welcome_mail.delay(user.id)
+
+    Enqueuing a job is a single LPUSH sent through the extension, so within
+    :meth:`~flask.ext.redis.Redis.batch` or with REDIS_AUTO_PIPELINE it
+    shares the round trip of the other commands of the view. Jobs delayed by
+    `countdown` or `eta` wait in a sorted set scored by due time instead.
+
+    Jobs are run by ``flask redis-worker``, forking ``--processes`` worker
+    processes. Each moves jobs from the queue to a processing list of its
+    own with LMOVE (RPOPLPUSH before Redis 6.2), up to ``--batch-size`` per
+    round trip along with moving due delayed jobs over, and blocks with
+    BLMOVE (BRPOPLPUSH) while the queues are empty. A job is removed from
+    the processing list only after it ran, so the jobs of a worker which
+    died are pushed back to their queue by the next worker starting once its
+    heartbeat expired. Failed jobs are retried after `retry_delay` seconds,
+    doubled per attempt, and finally moved to a dead letter list.
+
+    Cluster mode is not supported.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+
+from . import serializers
+from .messaging import dedicated_client
+from .scripting import queue_script, reload_scripts
+
+logger = logging.getLogger('flask_redis')
+
+#: Moves up to ARGV[2] jobs due by ARGV[1] from the sorted set KEYS[1] to
+#: the queue KEYS[2], returning their number.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1],
+                       'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('LPUSH', KEYS[2], unpack(due))
+end
+return #due
+"""
+
+
+class Task(object):
+    """Function whose calls can be deferred to a worker. Calling the task
+    itself runs the function right away.
+    """
+
+    def __init__(self, queue, func, name=None, queue_name='default',
+                 retries=0, retry_delay=10):
+        """
+
+        :param queue: :class:`TaskQueue`
+        :param func: the function to run
+        :param name: str -- name the job refers to the task by, defaults to
+                     module and name of `func`
+        :param queue_name: str -- queue the jobs are pushed to
+        :param retries: int -- repetitions of failed jobs
+        :param retry_delay: seconds before the first repetition
+        """
+        self.queue = queue
+        self.func = func
+        self.name = name or '%s.%s' % (func.__module__, func.__name__)
+        self.queue_name = queue_name
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Enqueues a job calling the task with `args` and `kwargs`.
+
+        :returns: str -- ID of the job
+        """
+        return self.apply_async(args, kwargs)
+
+    def apply_async(self, args=(), kwargs=None, countdown=None, eta=None):
+        """Enqueues a job calling the task with `args` and `kwargs`, run
+        after `countdown` seconds or at the timestamp `eta` if given.
+
+        :returns: str -- ID of the job
+        """
+        job = self.queue.create_job(self.name, args, kwargs)
+        if countdown is not None:
+            eta = time.time() + countdown
+        self.queue.push(self.queue_name, [job], eta)
+        return job['id']
+
+    def map(self, args_list):
+        """Enqueues a job per tuple of arguments in `args_list` with a
+        single LPUSH.
+
+        :returns: list of job IDs
+        """
+        jobs = [self.queue.create_job(self.name, args)
+                for args in args_list]
+        if jobs:
+            self.queue.push(self.queue_name, jobs)
+        return [job['id'] for job in jobs]
+
+
+class TaskQueue(object):
+    """Registry of the tasks and their queues below `prefix`."""
+
+    def __init__(self, redis, prefix='tasks:', serializer='pickle'):
+        """
+
+        :param redis: :class:`redis.StrictRedis` jobs are pushed with
+        :param prefix: str
+        :param serializer: name or :class:`~flask.ext.redis.serializers
+                           .Serializer` of the jobs
+        """
+        self.redis = redis
+        self.prefix = prefix
+        self.serializer = serializer
+        #: :class:`redis.ConnectionPool` whose connection settings the
+        #: workers use by default.
+        self.connection_pool = None
+        #: Registered tasks by name.
+        self.tasks = {}
+
+    @property
+    def serializer(self):
+        """:class:`~flask.ext.redis.serializers.Serializer` of the jobs,
+        settable by name.
+        """
+        return self._serializer
+
+    @serializer.setter
+    def serializer(self, serializer):
+        self._serializer = serializers.get_serializer(serializer)
+
+    def task(self, name=None, queue='default', retries=0, retry_delay=10):
+        """Decorator turning a function into a :class:`Task`."""
+        def decorator(func):
+            task = Task(self, func, name=name, queue_name=queue,
+                        retries=retries, retry_delay=retry_delay)
+            self.tasks[task.name] = task
+            return task
+        return decorator
+
+    def get_key(self, kind, *parts):
+        """Returns the key of the `kind` of list or sorted set, e.g.
+        ``'queue'``, ``'delayed'`` or ``'dead'``, of a queue.
+
+        :rtype: str
+        """
+        return self.prefix + ':'.join((kind,) + parts)
+
+    def create_job(self, task, args=(), kwargs=None):
+        """Returns a job calling the task named `task`.
+
+        :rtype: dict
+        """
+        return dict(id=uuid.uuid4().hex, task=task, args=list(args),
+                    kwargs=kwargs or {}, attempt=0)
+
+    def dump_job(self, job):
+        return serializers.dumps(job, self.serializer)
+
+    def load_job(self, value):
+        return serializers.loads(value)
+
+    def push(self, queue, jobs, eta=None, client=None):
+        """Pushes `jobs` to `queue`, or to its delayed jobs due at the
+        timestamp `eta`.
+        """
+        client = self.redis if client is None else client
+        values = [self.dump_job(job) for job in jobs]
+        if eta is None:
+            client.lpush(self.get_key('queue', queue), *values)
+        else:
+            client.zadd(self.get_key('delayed', queue),
+                        dict((value, eta) for value in values))
+
+    def length(self, queue='default'):
+        """Returns the number of jobs waiting in `queue`, not counting
+        delayed jobs.
+
+        :rtype: int
+        """
+        return self.redis.llen(self.get_key('queue', queue))
+
+
+class Worker(object):
+    """Runs the jobs of `queues` in the order given, so jobs of the first
+    queue take precedence.
+    """
+
+    def __init__(self, queue, queues=('default',), batch_size=10,
+                 heartbeat=60, app=None, connection_pool=None):
+        """
+
+        :param queue: :class:`TaskQueue`
+        :param queues: list of queue names
+        :param batch_size: int -- jobs fetched per round trip
+        :param heartbeat: seconds after which the jobs of a worker not
+                          heard from are recovered, checked by every worker
+                          once per `heartbeat`. The heartbeat is refreshed
+                          between jobs, so no single job may run longer.
+        :param app: :class:`flask.Flask` providing the application context
+                    jobs run in
+        :param connection_pool: :class:`redis.ConnectionPool` whose
+                                connection settings are used instead of
+                                those of :attr:`TaskQueue.connection_pool`
+        """
+        self.queue = queue
+        self.queues = list(queues)
+        self.batch_size = batch_size
+        self.heartbeat = heartbeat
+        self.app = app
+        self.id = '%s-%d-%s' % (socket.gethostname(), os.getpid(),
+                                uuid.uuid4().hex[:6])
+        self.client = dedicated_client(connection_pool or
+                                       queue.connection_pool)
+        self._promote = self.client.register_script(PROMOTE_SCRIPT)
+        self._lmove = None
+        self._beaten_at = self._recovered_at = 0
+        self.stopped = False
+
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def processing_key(self, queue, worker_id=None):
+        return self.queue.get_key('processing', queue, worker_id or self.id)
+
+    def _supports_lmove(self):
+        if self._lmove is None:
+            version = self.client.info('server')['redis_version']
+            self._lmove = tuple(
+                int(part) for part in version.split('.')[:2]) >= (6, 2)
+        return self._lmove
+
+    def _move(self, pipe, queue, timeout=None):
+        source = self.queue.get_key('queue', queue)
+        destination = self.processing_key(queue)
+        if self._supports_lmove():
+            if timeout is None:
+                return pipe.lmove(source, destination, 'RIGHT', 'LEFT')
+            return pipe.blmove(source, destination, timeout, 'RIGHT', 'LEFT')
+        if timeout is None:
+            return pipe.rpoplpush(source, destination)
+        return pipe.brpoplpush(source, destination, timeout)
+
+    def fetch(self):
+        """Refreshes the heartbeat, moves due delayed jobs over and fetches
+        up to :attr:`batch_size` jobs without blocking, all in one round
+        trip.
+
+        :returns: list of tuples of queue name and job value
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.setex(self.queue.get_key('worker', self.id), self.heartbeat, 1)
+        now = self._beaten_at = time.time()
+        for queue in self.queues:
+            queue_script(pipe, self._promote,
+                         [self.queue.get_key('delayed', queue),
+                          self.queue.get_key('queue', queue)],
+                         [now, self.batch_size])
+        for queue in self.queues:
+            for _ in range(self.batch_size):
+                self._move(pipe, queue)
+        replies = pipe.execute(raise_on_error=False)
+
+        # due jobs move next time once the script is loaded again
+        reload_scripts(self.client, replies[1:1 + len(self.queues)],
+                       PROMOTE_SCRIPT)
+        replies = replies[1 + len(self.queues):]
+        fetched = []
+        for i, queue in enumerate(self.queues):
+            fetched.extend(
+                (queue, value)
+                for value in replies[i * self.batch_size:
+                                     (i + 1) * self.batch_size]
+                if value is not None and not isinstance(value, Exception))
+        if len(fetched) > self.batch_size:
+            # jobs of later queues fetched beyond the batch go back in
+            # front of their queue
+            self._requeue(fetched[self.batch_size:])
+        return fetched[:self.batch_size]
+
+    def _requeue(self, jobs):
+        pipe = self.client.pipeline(transaction=False)
+        for queue, value in reversed(jobs):
+            pipe.lrem(self.processing_key(queue), 1, value)
+            pipe.rpush(self.queue.get_key('queue', queue), value)
+        pipe.execute()
+
+    def beat(self):
+        """Refreshes the heartbeat if a third of :attr:`heartbeat` passed
+        since, so the jobs being run are not recovered by other workers.
+        """
+        now = time.time()
+        if now - self._beaten_at >= self.heartbeat / 3.0:
+            self.client.setex(self.queue.get_key('worker', self.id),
+                              self.heartbeat, 1)
+            self._beaten_at = now
+
+    def wait(self, timeout=1):
+        """Blocks up to `timeout` seconds for a job of the first queue.
+
+        :returns: list of tuples of queue name and job value
+        """
+        value = self._move(self.client, self.queues[0], timeout)
+        if value is None:
+            return []
+        return [(self.queues[0], value)]
+
+    def run_jobs(self, jobs):
+        """Runs `jobs` within an application context, then removes them
+        from the processing list and reschedules or buries the failed ones
+        in one round trip.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        context = self.app.app_context() if self.app is not None else None
+        if context is not None:
+            context.push()
+        try:
+            for queue, value in jobs:
+                self.beat()
+                self._run(pipe, queue, value)
+        finally:
+            if context is not None:
+                context.pop()
+        pipe.execute()
+
+    def _run(self, pipe, queue, value):
+        pipe.lrem(self.processing_key(queue), 1, value)
+        try:
+            job = self.queue.load_job(value)
+            task = self.queue.tasks[job['task']]
+        except Exception:
+            logger.exception('Cannot load job of queue %s', queue)
+            self.failed += 1
+            pipe.lpush(self.queue.get_key('dead', queue), value)
+            return
+        try:
+            task.func(*job['args'], **job['kwargs'])
+        except Exception:
+            logger.exception('Job %s of task %s failed', job['id'],
+                             task.name)
+            self.failed += 1
+            if job['attempt'] < task.retries:
+                eta = time.time() + task.retry_delay * 2 ** job['attempt']
+                job['attempt'] += 1
+                self.retried += 1
+                self.queue.push(queue, [job], eta, client=pipe)
+            else:
+                pipe.lpush(self.queue.get_key('dead', queue), value)
+        else:
+            self.processed += 1
+
+    def recover(self):
+        """Pushes the jobs left in the processing lists of workers whose
+        heartbeat expired back to their queues.
+
+        :returns: int -- number of recovered jobs
+        """
+        self._recovered_at = time.time()
+        workers_key = self.queue.get_key('workers')
+        self.client.sadd(workers_key, self.id)
+        recovered = 0
+        for worker_id in self.client.smembers(workers_key):
+            worker_id = worker_id.decode('utf-8') \
+                if isinstance(worker_id, bytes) else worker_id
+            if self.client.exists(self.queue.get_key('worker', worker_id)) \
+                    or worker_id == self.id:
+                continue
+            for queue in self.queues:
+                source = self.processing_key(queue, worker_id)
+                while self.client.rpoplpush(
+                        source, self.queue.get_key('queue', queue)):
+                    recovered += 1
+            if not any(self.client.exists(self.processing_key(q, worker_id))
+                       for q in self.queues):
+                self.client.srem(workers_key, worker_id)
+        if recovered:
+            logger.warning('Recovered %d jobs of stopped workers', recovered)
+        return recovered
+
+    def work(self, burst=False):
+        """Runs jobs until :meth:`stop` is called, or with `burst` until the
+        queues are empty. Jobs of stopped workers are recovered at start and
+        once per :attr:`heartbeat`, so those of a crashed worker are picked
+        up while its replacement is already running.
+        """
+        self.beat()
+        self.client.script_load(PROMOTE_SCRIPT)
+        self.recover()
+        try:
+            while not self.stopped:
+                if time.time() - self._recovered_at >= self.heartbeat:
+                    self.recover()
+                jobs = self.fetch()
+                if not jobs:
+                    if burst:
+                        break
+                    jobs = self.wait()
+                if jobs:
+                    self.run_jobs(jobs)
+        finally:
+            self._shutdown()
+
+    def _shutdown(self):
+        """Returns unfinished jobs to their queues and signs off."""
+        pipe = self.client.pipeline(transaction=False)
+        for queue in self.queues:
+            pipe.lrange(self.processing_key(queue), 0, -1)
+        leftovers = pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        for queue, values in zip(self.queues, leftovers):
+            for value in values:
+                pipe.rpush(self.queue.get_key('queue', queue), value)
+            pipe.delete(self.processing_key(queue))
+        pipe.delete(self.queue.get_key('worker', self.id))
+        pipe.srem(self.queue.get_key('workers'), self.id)
+        pipe.execute()
+
+    def stop(self, *args):
+        """Stops after the current batch, usable as signal handler."""
+        self.stopped = True
+
+
+def run_workers(create_worker, processes=1, burst=False):
+    """Runs `processes` workers created by `create_worker`, forking a
+    process per worker unless only one is asked for. Workers which die are
+    replaced until SIGTERM or SIGINT stops them all.
+
+    :param create_worker: callable returning a :class:`Worker`
+    :returns: int -- number of workers which exited with an error
+    """
+    if processes == 1:
+        worker = create_worker()
+        signal.signal(signal.SIGTERM, worker.stop)
+        worker.work(burst)
+        return 0
+
+    children = {}
+    state = dict(stopping=False, errors=0)
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                worker = create_worker()
+                signal.signal(signal.SIGTERM, worker.stop)
+                signal.signal(signal.SIGINT, worker.stop)
+                worker.work(burst)
+            except Exception:
+                logger.exception('Worker failed')
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = True
+
+    def terminate(*args):
+        state['stopping'] = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for _ in range(processes):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except OSError:
+            # interrupted by a signal
+            continue
+        children.pop(pid, None)
+        if status:
+            state['errors'] += 1
+            if not state['stopping'] and not burst:
+                time.sleep(1)
+                spawn()
+    return state['errors']
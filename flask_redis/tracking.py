@@ -0,0 +1,285 @@
+# -*- coding: UTF-8 -*-
+"""
+    flask.ext.redis.tracking
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    In-process cache of hot keys kept coherent by server-assisted client
+    side caching (``CLIENT TRACKING``, Redis 6 or later).
+
+    Cached reads are sent over connections with tracking enabled, so the
+    server remembers the keys they read. Tracking is redirected to a
+    listener connection subscribed to ``__redis__:invalidate``: once one of
+    those keys is modified or expires the server publishes its name there and
+    a background thread drops it from the cache. While the listener is not
+    connected reads bypass the cache; when it reconnects the cache is
+    cleared, as invalidations may have been missed.
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from .messaging import dedicated_pool
+
+INVALIDATE_CHANNEL = b'__redis__:invalidate'
+
+
+class _TrackingConnectionMixin(object):
+    """Enables tracking redirected to the listener of `tracking_cache` on
+    every (re)connect.
+    """
+
+    def __init__(self, tracking_cache=None, **kwargs):
+        self.tracking_cache = tracking_cache
+        super(_TrackingConnectionMixin, self).__init__(**kwargs)
+
+    def on_connect(self):
+        super(_TrackingConnectionMixin, self).on_connect()
+        listener_id = self.tracking_cache.listener_id
+        if listener_id is None:
+            raise redis.ConnectionError('Invalidation listener not connected')
+        self.send_command('CLIENT', 'TRACKING', 'ON', 'REDIRECT', listener_id)
+        self.read_response()
+
+
+class TrackingCache(object):
+    """Size-bounded LRU cache of GET, HGETALL and MGET replies, optionally
+    expiring entries after `ttl` seconds as a safety net::
+
+        flags = redis.cache.hgetall('feature-flags')
+    """
+
+    def __init__(self, connection_pool, max_size=1024, ttl=None):
+        """
+
+        :param connection_pool: :class:`redis.ConnectionPool` whose
+                                connection settings are used
+        :param max_size: int -- maximum number of cached replies
+        :param ttl: float -- seconds after which replies are dropped even
+                    without invalidation, `None` to keep them until
+                    invalidated or evicted
+        """
+        self.connection_pool = connection_pool
+        self.max_size = max_size
+        self.ttl = ttl
+        self.listener_id = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._fetching = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._pid = None
+        self._client = None
+        self._fallback = redis.StrictRedis(connection_pool=connection_pool)
+
+    def _start(self):
+        pool = self.connection_pool
+        connection_class = type(
+            'Tracking' + pool.connection_class.__name__,
+            (_TrackingConnectionMixin, pool.connection_class), {})
+        self._client = redis.StrictRedis(connection_pool=dedicated_pool(
+            pool, connection_class=connection_class, tracking_cache=self))
+        self._pid = os.getpid()
+        self._ready.clear()
+        self.clear()
+
+        listener = threading.Thread(target=self._listen,
+                                    name='flask-redis-tracking')
+        listener.daemon = True
+        listener.start()
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+
+    def _listen(self):
+        pid = self._pid
+        # the listener idles for as long as no tracked key changes
+        pool = dedicated_pool(self.connection_pool, socket_timeout=None)
+        while self._pid == pid:
+            connection = pool.make_connection()
+            try:
+                connection.connect()
+                connection.send_command('CLIENT', 'ID')
+                listener_id = connection.read_response()
+                connection.send_command('SUBSCRIBE', INVALIDATE_CHANNEL)
+                connection.read_response()
+
+                self.listener_id = listener_id
+                # connections still redirecting to a former listener
+                self._client.connection_pool.disconnect()
+                self.clear()
+                self._ready.set()
+                while self._pid == pid:
+                    self._handle(connection.read_response())
+            except (redis.RedisError, OSError):
+                pass
+            finally:
+                self._ready.clear()
+                self.listener_id = None
+                connection.disconnect()
+            time.sleep(1)
+
+    def _handle(self, message):
+        if message[0] not in (b'message', 'message'):
+            return
+        keys = message[2]
+        if keys is None:
+            self.clear()
+        else:
+            self.invalidate(*keys)
+
+    def invalidate(self, *keys):
+        """Drops the cached replies of `keys`.
+
+        :param keys: bytes
+        """
+        with self._lock:
+            for key in keys:
+                key = self._key(key)
+                self._fetching.pop(key, None)
+                for command in ('GET', 'HGETALL'):
+                    if self._entries.pop((command, key), None) is not None:
+                        self.invalidations += 1
+
+    def clear(self):
+        """Drops all cached replies."""
+        with self._lock:
+            self._entries.clear()
+            self._fetching.clear()
+
+    @staticmethod
+    def _key(name):
+        if isinstance(name, bytes):
+            return name
+        if not isinstance(name, type(u'')):
+            name = str(name)
+        return name.encode('utf-8')
+
+    def _lookup(self, entry_key, now):
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            return None
+        # re-insert as most recently used
+        self._entries[entry_key] = entry
+        return entry
+
+    def _store(self, entry_key, value, token):
+        if self._fetching.get(entry_key[1]) is not token:
+            # invalidated while being fetched
+            return
+        del self._fetching[entry_key[1]]
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        self._entries[entry_key] = (value, expires)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _cached(self, command, name):
+        self._ensure_started()
+        if not self._ready.is_set():
+            self.misses += 1
+            return self._fallback.execute_command(command, name)
+
+        entry_key = (command, self._key(name))
+        token = object()
+        with self._lock:
+            entry = self._lookup(entry_key, time.time())
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            self._fetching[entry_key[1]] = token
+
+        try:
+            value = self._client.execute_command(command, name)
+        except Exception:
+            with self._lock:
+                self._fetching.pop(entry_key[1], None)
+            raise
+        with self._lock:
+            self._store(entry_key, value, token)
+        return value
+
+    def get(self, name):
+        """Cached GET.
+
+        :param name: key
+        """
+        return self._cached('GET', name)
+
+    def hgetall(self, name):
+        """Cached HGETALL.
+
+        :param name: key
+        :rtype: dict
+        """
+        return self._cached('HGETALL', name)
+
+    def mget(self, keys, *args):
+        """Cached MGET, sharing cached replies with :meth:`get`. Only the
+        keys not cached are fetched, in a single MGET.
+
+        :param keys: list of keys
+        :rtype: list
+        """
+        if args:
+            keys = [keys] + list(args)
+        self._ensure_started()
+        if not self._ready.is_set():
+            self.misses += len(keys)
+            return self._fallback.mget(keys)
+
+        values = [None] * len(keys)
+        missing = []
+        token = object()
+        now = time.time()
+        with self._lock:
+            for i, name in enumerate(keys):
+                entry_key = ('GET', self._key(name))
+                entry = self._lookup(entry_key, now)
+                if entry is None:
+                    missing.append((i, entry_key))
+                    self._fetching[entry_key[1]] = token
+                else:
+                    values[i] = entry[0]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return values
+
+        fetched = self._client.mget([keys[i] for i, _ in missing])
+        with self._lock:
+            for (i, entry_key), value in zip(missing, fetched):
+                values[i] = value
+                self._store(entry_key, value, token)
+        return values
+
+    def stats(self):
+        """Returns the number of hits, misses, evictions, invalidations and
+        cached replies.
+
+        :rtype: dict
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions,
+                    invalidations=self.invalidations,
+                    size=len(self._entries))
@@ -0,0 +1,214 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.aio_test
+    ~~~~~~~~~~~~~~
+
+    Testing asyncio support
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import asyncio
+
+import mock
+import redis
+import redis.asyncio
+import redis.asyncio.sentinel
+
+from flask_redis import serializers
+from flask_redis.aio import (AsyncRedis, AsyncRedisSessionInterface,
+                             create_async_connection_pool)
+from flask_redis.session import LocalSessionCache, RedisSession
+from tests import FlaskRedisTestCase, create_app
+
+
+class AsyncRedisTest(FlaskRedisTestCase):
+
+    def test_aio_proxy(self):
+        self.assertIsInstance(self.redis.aio, AsyncRedis)
+        self.assertIs(self.redis.aio, self.redis.aio)
+
+    def test_client_per_event_loop(self):
+        async def client():
+            return self.redis.aio.client, self.redis.aio.client
+
+        a, a2 = asyncio.run(client())
+        b, _ = asyncio.run(client())
+
+        self.assertIs(a, a2)
+        self.assertIsNot(a, b)
+        self.assertIsInstance(a, redis.asyncio.StrictRedis)
+
+    @mock.patch('redis.asyncio.ConnectionPool.disconnect')
+    def test_client_is_dropped_with_its_loop(self, disconnect):
+        async def client():
+            return self.redis.aio.client
+
+        for _ in range(5):
+            asyncio.run(client())
+
+        self.assertEqual({}, self.redis.aio._clients)
+        self.assertEqual(5, disconnect.await_count)
+
+    @mock.patch('redis.cluster.RedisCluster')
+    def test_cluster_is_rejected(self, cluster):
+        app = create_app(dict(REDIS_CLUSTER_NODES=['10.0.0.1:7000']))
+        ext = type(self.redis)(app)
+
+        async def get():
+            return await ext.aio.get('foo')
+
+        with self.assertRaises(RuntimeError) as context:
+            asyncio.run(get())
+        self.assertIn('REDIS_CLUSTER_NODES', str(context.exception))
+
+    def test_private_names_are_not_proxied(self):
+        self.assertRaises(AttributeError, getattr, self.redis.aio, '_pool')
+        self.assertFalse(hasattr(self.redis.aio, '__await__'))
+
+    def test_async_connection_pool_of_sentinel_pool(self):
+        app = create_app(dict(REDIS_SENTINELS=[('10.0.0.1', 26379)],
+                              REDIS_SENTINEL_MASTER='sessions',
+                              REDIS_MAX_CONNECTIONS=4))
+        ext = type(self.redis)(app)
+
+        pool = create_async_connection_pool(ext.connection_pool)
+
+        self.assertIsInstance(pool,
+                              redis.asyncio.sentinel.SentinelConnectionPool)
+        self.assertEqual('sessions', pool.service_name)
+        self.assertTrue(pool.is_master)
+        self.assertEqual(4, pool.max_connections)
+        self.assertIs(redis.asyncio.sentinel.SentinelManagedConnection,
+                      pool.connection_class)
+        sentinel, = pool.sentinel_manager.sentinels
+        self.assertEqual('10.0.0.1',
+                         sentinel.connection_pool.connection_kwargs['host'])
+
+    def test_async_connection_pool(self):
+        pool = create_async_connection_pool(self.redis.connection_pool)
+        self.assertIsInstance(pool, redis.asyncio.ConnectionPool)
+        self.assertEqual('127.0.0.1', pool.connection_kwargs['host'])
+        self.assertEqual(5, pool.connection_kwargs['db'])
+
+        app = create_app(dict(REDIS_BLOCKING_POOL=True,
+                              REDIS_MAX_CONNECTIONS=4,
+                              REDIS_UNIX_SOCKET_PATH='/tmp/redis.sock'))
+        ext = type(self.redis)(app)
+        pool = create_async_connection_pool(ext.connection_pool)
+        self.assertIsInstance(pool, redis.asyncio.BlockingConnectionPool)
+        self.assertEqual(4, pool.max_connections)
+        self.assertIs(redis.asyncio.UnixDomainSocketConnection,
+                      pool.connection_class)
+
+
+class AsyncRedisSessionInterfaceTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.redis_instance.get = mock.AsyncMock(name='get')
+        self.redis_instance.pipeline.return_value.execute = mock.AsyncMock()
+        self.session_interface = AsyncRedisSessionInterface(
+            redis=self.redis_instance)
+        self.session_interface.generate_sid = mock.Mock(return_value='new')
+        self.request = mock.Mock(name='request')
+        self.request.cookies.get.return_value = 'known_sid'
+
+    def test_open_existing_session(self):
+        self.redis_instance.get.return_value = serializers.dumps(
+            dict(a='test_A'), serializers.get_serializer('pickle'))
+
+        session = asyncio.run(
+            self.session_interface.open_session(self.app, self.request))
+
+        self.redis_instance.get.assert_awaited_once_with(
+            'session:known_sid:data')
+        self.assertEqual('known_sid', session.sid)
+        self.assertEqual('test_A', session['a'])
+
+    def test_open_session_with_spoofed_sid(self):
+        self.redis_instance.get.return_value = None
+
+        session = asyncio.run(
+            self.session_interface.open_session(self.app, self.request))
+
+        self.assertTrue(session.new)
+        self.assertIsNone(session.sid)
+
+    def test_save_session(self):
+        session = RedisSession(new=True)
+        session['a'] = 'test_A'
+        response = mock.Mock(name='response')
+
+        asyncio.run(self.session_interface.save_session(self.app, session,
+                                                        response))
+
+        pipe = self.redis_instance.pipeline.return_value
+        self.assertEqual('session:new:data', pipe.setex.call_args[0][0])
+        pipe.execute.assert_awaited_once_with()
+        self.assertTrue(response.set_cookie.called)
+
+    def _cached_interface(self):
+        self.redis_instance.mget = mock.AsyncMock(name='mget')
+        self.redis_instance.delete = mock.AsyncMock(name='delete')
+        self.cache = LocalSessionCache()
+        self.session_interface = AsyncRedisSessionInterface(
+            redis=self.redis_instance, local_cache=self.cache)
+        self.session_interface.generate_sid = mock.Mock(return_value='new')
+
+    def test_save_session_stamps_version(self):
+        self._cached_interface()
+        session = RedisSession(new=True)
+        session['a'] = 'test_A'
+
+        asyncio.run(self.session_interface.save_session(
+            self.app, session, mock.Mock(name='response')))
+
+        pipe = self.redis_instance.pipeline.return_value
+        key, _, version = pipe.setex.call_args_list[1][0]
+        self.assertEqual('session:new:version', key)
+        self.assertEqual(dict(a='test_A'), serializers.loads(
+            self.cache.get('new', version)))
+
+    def test_delete_session_drops_version(self):
+        self._cached_interface()
+        self.cache.put('known_sid', b'v1', b'data')
+        session = RedisSession(sid='known_sid')
+        session.modified = True
+
+        asyncio.run(self.session_interface.save_session(
+            self.app, session, mock.Mock(name='response')))
+
+        self.redis_instance.delete.assert_awaited_once_with(
+            'session:known_sid:data', 'session:known_sid:version')
+        self.assertNotIn('known_sid', self.cache)
+
+    def test_open_session_from_local_cache(self):
+        self._cached_interface()
+        self.cache.put('known_sid', b'v1', serializers.dumps(
+            dict(a='test_A'), serializers.get_serializer('pickle')))
+        self.redis_instance.get.return_value = b'v1'
+
+        session = asyncio.run(
+            self.session_interface.open_session(self.app, self.request))
+
+        self.redis_instance.get.assert_awaited_once_with(
+            'session:known_sid:version')
+        self.assertFalse(self.redis_instance.mget.called)
+        self.assertEqual('test_A', session['a'])
+
+    def test_open_outdated_session_refreshes_local_cache(self):
+        self._cached_interface()
+        self.cache.put('known_sid', b'v1', b'outdated')
+        data = serializers.dumps(dict(a='test_A'),
+                                 serializers.get_serializer('pickle'))
+        self.redis_instance.get.return_value = b'v2'
+        self.redis_instance.mget.return_value = [data, b'v2']
+
+        session = asyncio.run(
+            self.session_interface.open_session(self.app, self.request))
+
+        self.redis_instance.mget.assert_awaited_once_with(
+            ['session:known_sid:data', 'session:known_sid:version'])
+        self.assertEqual('test_A', session['a'])
+        self.assertEqual(data, self.cache.get('known_sid', b'v2'))
@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.batch_test
+    ~~~~~~~~~~~~~~~~
+
+    Testing batches
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+
+import mock
+import redis
+
+from flask_redis.batch import Batch, LazyResult
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.MagicMock(name='client')
+        self.pipeline = self.client.pipeline.return_value
+        self.batch = Batch(self.client)
+
+    def test_commands_are_buffered(self):
+        a = self.batch.get('a')
+        b = self.batch.get('b')
+
+        self.assertIsInstance(a, LazyResult)
+        self.assertFalse(a.ready)
+        self.client.pipeline.assert_called_once_with(transaction=False)
+        self.pipeline.get.assert_has_calls([mock.call('a'), mock.call('b')])
+        self.assertFalse(self.pipeline.execute.called)
+
+        self.pipeline.execute.return_value = ['A', 'B']
+        self.assertEqual('A', a.value)
+        self.assertTrue(b.ready)
+        self.assertEqual('B', b.value)
+        self.pipeline.execute.assert_called_once_with(raise_on_error=False)
+
+    def test_flush_raises_errors(self):
+        a = self.batch.get('a')
+        b = self.batch.incr('b')
+        error = redis.ResponseError('WRONGTYPE')
+        self.pipeline.execute.return_value = ['A', error]
+
+        self.assertRaises(redis.ResponseError, self.batch.flush)
+        self.assertEqual('A', a.value)
+        self.assertRaises(redis.ResponseError, lambda: b.value)
+
+    def test_flush_without_commands(self):
+        self.assertEqual([], self.batch.flush())
+        self.assertFalse(self.pipeline.execute.called)
+
+    def test_unbatched_attributes(self):
+        self.batch.pubsub()
+        self.client.pubsub.assert_called_once_with()
+        self.assertFalse(self.pipeline.pubsub.called)
+
+    def test_unbatched_attributes_flush_buffered_commands(self):
+        manager = mock.Mock()
+        manager.attach_mock(self.pipeline.execute, 'execute')
+        manager.attach_mock(self.client.pipeline, 'pipeline')
+        self.pipeline.execute.return_value = [True]
+        result = self.batch.set('a', 1)
+        manager.reset_mock()
+
+        self.batch.pipeline()
+
+        self.assertEqual([mock.call.execute(raise_on_error=False),
+                          mock.call.pipeline()], manager.mock_calls)
+        self.assertTrue(result.value)
+
+    def test_context_manager(self):
+        context = mock.Mock(name='context', spec=[])
+        batch = Batch(self.client, context)
+        self.pipeline.execute.return_value = ['A']
+
+        with batch:
+            self.assertIs(batch, context.redis_batch)
+            a = batch.get('a')
+
+        self.assertFalse(hasattr(context, 'redis_batch'))
+        self.assertEqual('A', a.value)
+        self.pipeline.execute.assert_called_once_with(raise_on_error=False)
+
+    def test_nested_batch_flushes_outer_batch(self):
+        context = mock.Mock(name='context', spec=[])
+        outer = context.redis_batch = Batch(self.client, context)
+        outer.get('a')
+        self.pipeline.execute.return_value = ['A']
+
+        with Batch(self.client, context):
+            self.pipeline.execute.assert_called_once_with(
+                raise_on_error=False)
+
+        self.assertIs(outer, context.redis_batch)
@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.caching_test
+    ~~~~~~~~~~~~~~~~~~
+
+    Testing response and result caching
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import time
+
+import mock
+import redis
+
+from flask_redis import serializers
+from flask_redis.caching import ADD_TO_TAG_SCRIPT, Cache
+from tests import FlaskRedisTestCase
+
+
+class CacheTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.redis_instance.get.return_value = None
+        self.redis_instance.set.return_value = True
+        self.cache = Cache(self.redis_instance)
+        self.compute = mock.Mock(name='compute', return_value='computed')
+
+    def _stored(self, value, expires_in, delta=0.1):
+        entry = (value, delta, time.time() + expires_in)
+        return serializers.dumps(entry, serializers.get_serializer('pickle'))
+
+    def test_miss(self):
+        rv = self.cache.get_or_compute('cache:key', self.compute, 60,
+                                       tags=['a'])
+
+        self.assertEqual('computed', rv)
+        self.redis_instance.set.assert_called_once_with(
+            'cache:key:lock', mock.ANY, nx=True, px=10000)
+        pipe = self.redis_instance.pipeline.return_value
+        key, value = pipe.set.call_args[0]
+        self.assertEqual('cache:key', key)
+        self.assertEqual(120, pipe.set.call_args[1]['ex'])
+        self.assertEqual('computed', serializers.loads(value)[0])
+        script = self.redis_instance.register_script.return_value
+        pipe.evalsha.assert_called_once_with(script.sha, 1, 'cache:tag:a',
+                                             'cache:key', 120)
+        script.assert_called_once_with(keys=['cache:key:lock'],
+                                       args=[mock.ANY])
+        self.assertEqual(1, self.cache.misses)
+
+    def test_miss_reloads_flushed_tag_script(self):
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.execute.side_effect = [
+            [True, redis.exceptions.NoScriptError()], [1]]
+
+        self.cache.get_or_compute('cache:key', self.compute, 60, tags=['a'])
+
+        self.redis_instance.script_load.assert_called_once_with(
+            ADD_TO_TAG_SCRIPT)
+        self.assertEqual(2, pipe.evalsha.call_count)
+
+    def test_miss_raises_errors_of_store(self):
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.execute.return_value = [redis.exceptions.ResponseError('OOM'),
+                                     redis.exceptions.NoScriptError()]
+
+        self.assertRaises(redis.exceptions.ResponseError,
+                          self.cache.get_or_compute, 'cache:key',
+                          self.compute, 60, tags=['a'])
+        self.assertFalse(self.redis_instance.script_load.called)
+
+    def test_hit(self):
+        self.redis_instance.get.return_value = self._stored('cached', 60)
+
+        rv = self.cache.get_or_compute('cache:key', self.compute, 60)
+
+        self.assertEqual('cached', rv)
+        self.assertFalse(self.compute.called)
+        self.assertFalse(self.redis_instance.set.called)
+        self.assertEqual(1, self.cache.stats()['hit_ratio'])
+
+    def test_stale_value_while_locked(self):
+        self.redis_instance.get.return_value = self._stored('stale', -1)
+        self.redis_instance.set.return_value = None
+
+        rv = self.cache.get_or_compute('cache:key', self.compute, 60)
+
+        self.assertEqual('stale', rv)
+        self.assertFalse(self.compute.called)
+        self.assertEqual(1, self.cache.stale_hits)
+
+    def test_early_recomputation(self):
+        self.redis_instance.get.return_value = self._stored('cached', 1,
+                                                            delta=10)
+
+        with mock.patch('random.random', return_value=0.99):
+            rv = self.cache.get_or_compute('cache:key', self.compute, 60)
+        self.assertEqual('computed', rv)
+
+        with mock.patch('random.random', return_value=0.0):
+            rv = self.cache.get_or_compute('cache:key', self.compute, 60,
+                                           beta=0)
+        self.assertEqual('cached', rv)
+
+    def test_waits_for_computing_caller(self):
+        self.redis_instance.set.return_value = None
+        self.redis_instance.get.side_effect = [
+            None, None, self._stored('cached', 60)]
+        self.cache.poll_interval = 0
+
+        rv = self.cache.get_or_compute('cache:key', self.compute, 60)
+
+        self.assertEqual('cached', rv)
+        self.assertFalse(self.compute.called)
+
+    def test_invalidate_tags(self):
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.execute.return_value = [set([b'cache:a']), set([b'cache:b'])]
+
+        self.cache.invalidate_tags('x', 'y')
+
+        pipe.smembers.assert_has_calls([mock.call('cache:tag:x'),
+                                        mock.call('cache:tag:y')])
+        deleted = set(call[0][0] for call in pipe.delete.call_args_list)
+        self.assertEqual(set([b'cache:a', b'cache:b', 'cache:tag:x',
+                              'cache:tag:y']), deleted)
+
+    def test_memoize(self):
+        func = mock.Mock(name='func', return_value=42, __name__='func')
+        memoized = self.cache.memoize(60)(func)
+
+        self.assertEqual(42, memoized(1, b=2))
+        func.assert_called_once_with(1, b=2)
+        key = self.redis_instance.pipeline.return_value.set.call_args[0][0]
+        self.assertTrue(key.startswith('cache:memoize:'))
+
+    def test_cached_view(self):
+        self.cache = self.redis.caching
+        self.cache.redis = self.redis_instance
+        calls = []
+
+        @self.app.route('/<name>')
+        @self.redis.cached(60, vary_on=['Accept-Language'])
+        def hello(name):
+            calls.append(name)
+            return 'Hello ' + name
+
+        client = self.app.test_client()
+        self.assertEqual(b'Hello you', client.get('/you').data)
+        pipe = self.redis_instance.pipeline.return_value
+        key, value = pipe.set.call_args[0]
+        self.assertTrue(key.startswith('cache:view:hello:'))
+
+        self.redis_instance.get.return_value = value
+        response = client.get('/you')
+        self.assertEqual(b'Hello you', response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['you'], calls)
+
+    def test_cached_view_skips_errors(self):
+        self.redis.caching.redis = self.redis_instance
+
+        @self.app.route('/missing')
+        @self.redis.cached(60)
+        def missing():
+            return 'not found', 404
+
+        response = self.app.test_client().get('/missing')
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(self.redis_instance.pipeline.called)
@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.cli_test
+    ~~~~~~~~~~~~~~
+
+    Testing the session administration commands
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+
+import mock
+
+import flask_redis
+from tests import create_app
+
+
+class SessionCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(dict(REDIS_SESSION=True,
+                                   REDIS_SESSION_USER_KEY='user_id'))
+        flask_redis.Redis(self.app)
+        self.runner = self.app.test_cli_runner()
+        interface = self.app.session_interface
+        for name in ('scan_sessions', 'inspect_sessions', 'delete_sessions',
+                     'get_user_sessions', 'find_unreadable_sessions'):
+            setattr(interface, name, mock.Mock(name=name))
+        self.interface = interface
+        interface.scan_sessions.return_value = iter([['a', 'b'], ['c']])
+        interface.inspect_sessions.side_effect = lambda sids: [
+            dict(sid=sid, ttl=10, idle=100 if sid == 'b' else 1, bytes=50)
+            for sid in sids]
+        interface.delete_sessions.side_effect = len
+
+    def invoke(self, *args):
+        return self.runner.invoke(args=['redis-sessions'] + list(args))
+
+    def test_stats(self):
+        result = self.invoke('stats')
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('3 sessions, 150 bytes', result.output)
+
+    def test_list_user(self):
+        self.interface.get_user_sessions.return_value = ['a']
+
+        result = self.invoke('list', '--user', '42')
+
+        self.interface.get_user_sessions.assert_called_once_with('42')
+        self.assertEqual('a ttl=10 idle=1 bytes=50\n', result.output)
+
+    def test_purge_idle(self):
+        result = self.invoke('purge', '--idle', '60')
+
+        self.interface.delete_sessions.assert_has_calls([mock.call(['b']),
+                                                         mock.call([])])
+        self.assertIn('Deleted 1 sessions, 50 bytes', result.output)
+
+    def test_purge_dry_run(self):
+        result = self.invoke('purge', '--all', '--dry-run')
+
+        self.assertFalse(self.interface.delete_sessions.called)
+        self.assertIn('Would delete 3 sessions, 150 bytes', result.output)
+
+    def test_purge_unreadable(self):
+        self.interface.find_unreadable_sessions.side_effect = lambda sids: [
+            sid for sid in sids if sid == 'c']
+
+        result = self.invoke('purge', '--unreadable')
+
+        self.assertIn('Deleted 1 sessions, 50 bytes', result.output)
+
+    def test_purge_requires_criteria(self):
+        result = self.invoke('purge')
+
+        self.assertNotEqual(0, result.exit_code)
+        self.assertFalse(self.interface.delete_sessions.called)
+
+    def test_purge_user_requires_index(self):
+        self.interface.user_key = None
+
+        result = self.invoke('purge', '--user', '42')
+
+        self.assertIn('REDIS_SESSION_USER_KEY', result.output)
+
+
+class WorkerCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.redis = flask_redis.Redis(self.app)
+        self.runner = self.app.test_cli_runner()
+
+    @mock.patch('flask_redis.cli.run_workers', return_value=0)
+    def test_worker(self, run_workers):
+        result = self.runner.invoke(args=['redis-worker', '-p', '4', '-q',
+                                          'mail', '-q', 'default', '--burst',
+                                          '--heartbeat', '30'])
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('Starting 4 workers on mail, default', result.output)
+        create_worker, processes, burst = run_workers.call_args[0]
+        self.assertEqual((4, True), (processes, burst))
+        with mock.patch('flask_redis.tasks.dedicated_client'):
+            worker = create_worker()
+        self.assertEqual(['mail', 'default'], worker.queues)
+        self.assertIs(self.app, worker.app)
+        self.assertEqual(30, worker.heartbeat)
+
+    @mock.patch('flask_redis.cli.run_workers', return_value=2)
+    def test_failed_workers(self, run_workers):
+        result = self.runner.invoke(args=['redis-worker'])
+
+        self.assertEqual(1, result.exit_code)
+        self.assertIn('2 workers failed', result.output)
@@ -0,0 +1,70 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.compression_test
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Testing compression
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+
+import mock
+
+from flask_redis import compression, serializers
+
+
+class CompressionTest(unittest.TestCase):
+    value = b'\x01' + b'session data ' * 200
+
+    def test_round_trip(self):
+        for name in compression.compressors:
+            compressor = compression.get_compressor(name)
+            value = compression.compress(self.value, compressor)
+            self.assertEqual(compressor.tag, value[:1], name)
+            self.assertLess(len(value), len(self.value), name)
+            self.assertEqual(self.value, compression.decompress(value), name)
+
+    def test_threshold(self):
+        compressor = compression.get_compressor('zlib')
+        value = compression.compress(self.value, compressor,
+                                     threshold=len(self.value) + 1)
+        self.assertEqual(self.value, value)
+
+    def test_incompressible_value_is_stored_as_is(self):
+        compressor = compression.get_compressor('zlib')
+        self.assertEqual(b'\x01ab', compression.compress(b'\x01ab',
+                                                          compressor))
+
+    def test_uncompressed_value_is_returned_as_is(self):
+        self.assertEqual(self.value, compression.decompress(self.value))
+
+    def test_tags_do_not_clash_with_serializers(self):
+        tags = set(cls.tag for cls in compression._compressors_by_tag.values())
+        for serializer in serializers.serializers.values():
+            self.assertNotIn(serializer.tag, tags)
+
+    def test_get_compressor(self):
+        self.assertIsNone(compression.get_compressor(None))
+        compressor = compression.get_compressor('zlib', 9)
+        self.assertEqual(9, compressor.level)
+        self.assertRaises(ValueError, compression.get_compressor, 'bzip')
+
+    def test_missing_library(self):
+        for cls, module in ((compression.LZ4Compressor, 'lz4'),
+                            (compression.ZstdCompressor, 'zstandard')):
+            with mock.patch.object(compression, module, None):
+                with self.assertRaises(RuntimeError) as context:
+                    compression.decompress(cls.tag + b'data')
+            self.assertIn(module, str(context.exception))
+
+    def test_incomplete_compressor_cannot_be_instantiated(self):
+        class Incomplete(compression.Compressor):
+            tag = b'\x7f'
+
+            def compress(self, data):
+                return data
+
+        self.assertRaises(TypeError, Incomplete)
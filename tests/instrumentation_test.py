@@ -0,0 +1,170 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.instrumentation_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Testing command instrumentation
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+
+import flask.sessions
+import mock
+import redis
+
+import flask_redis
+from flask_redis.instrumentation import (Instrumentation, InstrumentedRedis,
+                                         RequestStats, Sink, count_keys,
+                                         get_sink, payload_size)
+from tests import create_app
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = mock.Mock(spec=Sink)
+        self.instrumentation = Instrumentation([self.sink], slow_log_size=2,
+                                               buckets=(0.001, 0.01))
+
+    def test_count_keys(self):
+        self.assertEqual(1, count_keys(('GET', 'a')))
+        self.assertEqual(3, count_keys(('MGET', 'a', 'b', 'c')))
+        self.assertEqual(2, count_keys(('MSET', 'a', 1, 'b', 2)))
+        self.assertEqual(1, count_keys(('EVALSHA', 'sha', 1, 'a', 'arg')))
+        self.assertEqual(0, count_keys(('PING',)))
+
+    def test_payload_size(self):
+        self.assertEqual(7, payload_size(('SET', 'a', b'xyz')))
+        self.assertEqual(5, payload_size({b'a': b'b', u'\xe4': 1}))
+        self.assertEqual(0, payload_size(None))
+
+    def test_record_command(self):
+        stats = RequestStats('index')
+        self.instrumentation.record_command('GET', 1, 1, 10, 0.0005, stats)
+        self.instrumentation.record_command('GET', 1, 1, 10, 0.005, stats)
+        self.instrumentation.record_command('PIPELINE', 3, 2, 30, 0.5, None)
+
+        self.assertEqual([1, 1, 2, 0.0055],
+                         self.instrumentation.histograms['GET'])
+        self.assertEqual([(0.5, 'PIPELINE', 2, 30, None),
+                          (0.005, 'GET', 1, 10, 'index')],
+                         self.instrumentation.slowest())
+        self.assertEqual((2, 2, 20), (stats.commands, stats.round_trips,
+                                      stats.bytes))
+        self.sink.command.assert_called_with('PIPELINE', 2, 30, 0.5, None)
+
+    def test_record_request(self):
+        stats = RequestStats('index')
+        stats.add(3, 2, 10, 0.001)
+        self.instrumentation.record_request(stats)
+        self.instrumentation.record_request(stats)
+
+        self.assertEqual(dict(requests=2, round_trips=1.0, commands=3.0),
+                         self.instrumentation.stats()['endpoints']['index'])
+        self.sink.request.assert_called_with(stats)
+
+    def test_render_prometheus(self):
+        self.instrumentation.record_command('GET', 1, 1, 10, 0.005, None)
+        self.instrumentation.record_request(RequestStats('index'))
+        text = self.instrumentation.render_prometheus()
+
+        self.assertIn('flask_redis_command_duration_seconds_bucket'
+                      '{command="GET",le="0.001"} 0\n', text)
+        self.assertIn('flask_redis_command_duration_seconds_bucket'
+                      '{command="GET",le="0.01"} 1\n', text)
+        self.assertIn('flask_redis_command_duration_seconds_count'
+                      '{command="GET"} 1\n', text)
+        self.assertIn('flask_redis_requests_total{endpoint="index"} 1\n', text)
+
+    def test_get_sink(self):
+        self.assertEqual('LoggingSink', type(get_sink('logging')).__name__)
+        self.assertIs(self.sink, get_sink(self.sink))
+        self.assertRaises(ValueError, get_sink, 'unknown')
+
+    @mock.patch('redis.StrictRedis.execute_command', return_value=b'bar')
+    def test_instrumented_redis(self, execute_command):
+        stats = RequestStats()
+        client = InstrumentedRedis(self.instrumentation, stats,
+                                   connection_pool=mock.Mock())
+
+        self.assertEqual(b'bar', client.get('foo'))
+        execute_command.assert_called_once_with('GET', 'foo')
+        self.assertEqual((1, 1, 9), (stats.commands, stats.keys,
+                                     stats.bytes))
+
+    @mock.patch('redis.client.Pipeline.execute', return_value=[True, b'1'])
+    def test_instrumented_pipeline(self, execute):
+        stats = RequestStats()
+        client = InstrumentedRedis(self.instrumentation, stats,
+                                   connection_pool=mock.Mock())
+
+        pipe = client.pipeline(transaction=False)
+        pipe.set('a', 1)
+        pipe.get('a')
+        self.assertEqual([True, b'1'], pipe.execute())
+        self.assertEqual((2, 1, 2), (stats.commands, stats.round_trips,
+                                     stats.keys))
+        self.assertIn('PIPELINE', self.instrumentation.histograms)
+
+
+class RedisInstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(dict(REDIS_INSTRUMENTATION=True,
+                                   REDIS_METRICS_ENDPOINT='/metrics'))
+        self.redis = flask_redis.Redis(self.app)
+
+        @self.app.route('/')
+        def index():
+            self.redis.get('foo')
+            return 'ok'
+
+    def test_disabled(self):
+        app = create_app()
+        extension = flask_redis.Redis(app)
+        self.assertIsNone(extension.instrumentation)
+        with app.app_context():
+            self.assertIs(redis.StrictRedis, type(extension._connection))
+
+    @mock.patch('redis.StrictRedis.execute_command', return_value=b'bar')
+    def test_request(self, _):
+        response = self.app.test_client().get('/')
+
+        self.assertTrue(response.headers['X-Redis-Stats'].startswith(
+            'commands=1; round-trips=1; keys=1; bytes=9; '))
+        self.assertEqual(dict(requests=1, round_trips=1.0, commands=1.0),
+                         self.redis.instrumentation.stats()['endpoints'][
+                             'index'])
+
+        metrics = self.app.test_client().get('/metrics')
+        self.assertIn(b'{command="GET"} 1\n', metrics.data)
+        self.assertIn(b'flask_redis_pool_connections{pool="primary",'
+                      b'state="in_use"} 0\n', metrics.data)
+
+    @mock.patch('redis.StrictRedis.execute_command', return_value=b'bar')
+    def test_commands_before_url_matching_count_for_endpoint(self, _):
+        extension = self.redis
+
+        class SessionInterface(flask.sessions.SecureCookieSessionInterface):
+            def open_session(self, app, request):
+                # sessions are opened before the URL is matched
+                extension.get('session')
+                return super(SessionInterface, self).open_session(
+                    app, request)
+
+        self.app.session_interface = SessionInterface()
+        self.app.test_client().get('/')
+
+        self.assertEqual(['index'], list(
+            self.redis.instrumentation.stats()['endpoints']))
+
+    @mock.patch('redis.StrictRedis.execute_command', return_value=b'bar')
+    def test_stats_header_disabled(self, _):
+        app = create_app(dict(REDIS_INSTRUMENTATION=True,
+                              REDIS_STATS_HEADER=False))
+        extension = flask_redis.Redis(app)
+        app.add_url_rule('/', 'index', lambda: extension.get('foo'))
+
+        response = app.test_client().get('/')
+        self.assertNotIn('X-Redis-Stats', response.headers)
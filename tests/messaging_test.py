@@ -0,0 +1,181 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.messaging_test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Testing Pub/Sub and stream consumers
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import flask
+import mock
+import redis
+
+import flask_redis
+from flask_redis.messaging import StreamConsumer, dedicated_client
+from tests import FlaskRedisTestCase, create_app
+
+
+class StreamConsumerTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.client = mock.MagicMock(name='client')
+        self.pipe = self.client.pipeline.return_value
+        self.consumer = StreamConsumer('orders', 'billing', mock.Mock(),
+                                       consumer='worker', batch_size=10)
+
+    def test_consumer_name_defaults_to_process(self):
+        consumer = StreamConsumer('orders', 'billing', mock.Mock())
+        with mock.patch('os.getpid', return_value=4711):
+            self.assertTrue(consumer.consumer.endswith('-4711'))
+
+    def test_create_group_ignores_existing(self):
+        self.client.xgroup_create.side_effect = redis.ResponseError(
+            'BUSYGROUP Consumer Group name already exists')
+        self.consumer.create_group(self.client)
+        self.client.xgroup_create.assert_called_once_with(
+            'orders', 'billing', '$', mkstream=True)
+
+        self.client.xgroup_create.side_effect = redis.ResponseError('WRONG')
+        self.assertRaises(redis.ResponseError, self.consumer.create_group,
+                          self.client)
+
+    def test_read_delivers_pending_first(self):
+        self.pipe.execute.side_effect = [
+            [[['orders', [(b'1-0', {b'a': b'1'})]]]],
+            [[]],
+            [[['orders', [(b'2-0', {b'a': b'2'})]]]]]
+
+        self.assertEqual([(b'1-0', {b'a': b'1'})],
+                         self.consumer.read(self.client))
+        self.pipe.xreadgroup.assert_called_with(
+            'billing', 'worker', {'orders': '0'}, count=10)
+
+        self.assertEqual([(b'2-0', {b'a': b'2'})],
+                         self.consumer.read(self.client))
+        self.pipe.xreadgroup.assert_any_call(
+            'billing', 'worker', {'orders': b'1-0'}, count=10)
+        self.pipe.xreadgroup.assert_called_with(
+            'billing', 'worker', {'orders': '>'}, count=10, block=1000)
+        self.assertIsNone(self.consumer.pending_id)
+
+    def test_read_acknowledges_in_same_pipeline(self):
+        self.consumer.pending_id = None
+        self.consumer.acks = [b'1-0', b'2-0']
+        self.pipe.execute.return_value = [2, []]
+
+        self.assertEqual([], self.consumer.read(self.client))
+        self.pipe.xack.assert_called_once_with('orders', 'billing', b'1-0',
+                                               b'2-0')
+        self.assertEqual(1, self.pipe.execute.call_count)
+        self.assertEqual([], self.consumer.acks)
+
+    def test_idle_read_claims_entries(self):
+        self.consumer.pending_id = None
+        self.consumer.claim_after = 60000
+        self.pipe.execute.return_value = [[]]
+        self.client.xautoclaim.return_value = [
+            b'0-0', [(b'1-0', {b'a': b'1'}), (None, None)]]
+
+        self.assertEqual([(b'1-0', {b'a': b'1'})],
+                         self.consumer.read(self.client))
+        self.client.xautoclaim.assert_called_once_with(
+            'orders', 'billing', 'worker', 60000, count=10)
+
+
+class DedicatedClientTest(FlaskRedisTestCase):
+
+    def test_dedicated_client(self):
+        client = dedicated_client(self.redis.connection_pool, 5)
+
+        self.assertIsNot(self.redis.connection_pool, client.connection_pool)
+        self.assertEqual(5, client.connection_pool.connection_kwargs[
+            'socket_timeout'])
+        self.assertEqual('127.0.0.1',
+                         client.connection_pool.connection_kwargs['host'])
+
+    def test_dedicated_client_of_sentinel_pool(self):
+        from redis.sentinel import SentinelConnectionPool
+
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_SENTINELS=[('10.0.0.1', 26379)],
+            REDIS_SENTINEL_MASTER='sessions')))
+        pool = dedicated_client(ext.connection_pool, 5).connection_pool
+
+        self.assertIsInstance(pool, SentinelConnectionPool)
+        self.assertEqual('sessions', pool.service_name)
+        self.assertIs(ext.connection_pool.sentinel_manager,
+                      pool.sentinel_manager)
+        self.assertIs(pool.proxy, pool.connection_kwargs['connection_pool'])
+        self.assertEqual(5, pool.connection_kwargs['socket_timeout'])
+
+
+class DispatcherTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.dispatcher = self.redis.dispatcher
+
+    def test_dispatch_messages(self):
+        received = []
+
+        @self.redis.subscribe('news')
+        def news(message):
+            received.append((flask.current_app.name, message['data']))
+
+        @self.redis.subscribe('news:*', pattern=True)
+        def any_news(message):
+            received.append(message['channel'])
+
+        self.dispatcher.dispatch_messages([
+            dict(type='message', pattern=None, channel=b'news', data=b'1'),
+            dict(type='pmessage', pattern=b'news:*', channel=b'news:de',
+                 data=b'2')])
+
+        self.assertEqual([(self.app.name, b'1'), b'news:de'], received)
+        self.assertEqual(2, self.dispatcher.handled)
+
+    def test_dispatch_entries_acknowledges_handled(self):
+        def bill(entry_id, fields):
+            if fields[b'amount'] == b'-1':
+                raise ValueError(fields)
+
+        self.redis.consume('orders', 'billing')(bill)
+        consumer, = self.dispatcher.consumers
+
+        with mock.patch('flask_redis.messaging.logger'):
+            self.dispatcher.dispatch_entries(consumer, [
+                (b'1-0', {b'amount': b'5'}), (b'2-0', {b'amount': b'-1'}),
+                (b'3-0', None)])
+
+        self.assertEqual([b'1-0', b'3-0'], consumer.acks)
+        self.assertEqual(dict(received=3, handled=1, failed=1),
+                         self.dispatcher.stats())
+
+    def test_started_by_first_request(self):
+        self.app.route('/')(lambda: 'ok')
+        with mock.patch.object(self.dispatcher, 'start') as start:
+            self.app.test_client().get('/')
+            self.assertFalse(start.called)
+
+            self.redis.subscribe('news')(mock.Mock())
+            self.app.test_client().get('/')
+            start.assert_called_once_with()
+
+    def test_start_and_stop(self):
+        self.redis.subscribe('news')(mock.Mock())
+        self.redis.consume('orders', 'billing')(mock.Mock())
+        with mock.patch.object(self.dispatcher, '_spawn') as spawn:
+            self.dispatcher.start()
+            self.dispatcher.start()
+
+        self.assertTrue(self.dispatcher.running)
+        self.assertEqual(['flask-redis-pubsub', 'flask-redis-stream'],
+                         [call[0][1] for call in spawn.call_args_list])
+        self.dispatcher.stop()
+        self.assertFalse(self.dispatcher.running)
+
+    @mock.patch('redis.cluster.RedisCluster')
+    def test_cluster_is_rejected(self, cluster):
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_CLUSTER_NODES=['10.0.0.1:7000'])))
+        self.assertRaises(RuntimeError, ext.dispatcher.start)
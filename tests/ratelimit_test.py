@@ -0,0 +1,136 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.ratelimit_test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Testing rate limiting and locks
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+
+import mock
+
+from flask_redis.ratelimit import (SLIDING_WINDOW_SCRIPT, TOKEN_BUCKET_SCRIPT,
+                                   RateLimiter, parse_rate)
+from tests import FlaskRedisTestCase
+
+
+class ParseRateTest(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual((100, 60), parse_rate('100/minute'))
+        self.assertEqual((10, 1), parse_rate('10 per second'))
+        self.assertEqual((5, 3600), parse_rate('5/hours'))
+        self.assertEqual((1000, 6 * 3600), parse_rate('1000/6h'))
+        self.assertEqual((2, 86400), parse_rate('2/Day'))
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, parse_rate, '100')
+        self.assertRaises(ValueError, parse_rate, '100/fortnight')
+
+
+class RateLimiterTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.script = self.redis_instance.register_script.return_value
+        self.script.return_value = [1, 4, 0]
+        self.limiter = self.redis.rate_limiter
+        self.limiter.redis = self.redis_instance
+
+    def test_sliding_window(self):
+        result = self.limiter.hit('key', '5/minute', cost=2)
+
+        self.assertTrue(result)
+        self.assertEqual(5, result.limit)
+        self.assertEqual(4, result.remaining)
+        self.redis_instance.register_script.assert_called_once_with(
+            SLIDING_WINDOW_SCRIPT)
+        self.script.assert_called_once_with(
+            keys=['ratelimit:key'], args=[5, 60000, 2],
+            client=self.redis_instance)
+
+    def test_token_bucket(self):
+        self.script.return_value = [0, 0, 1500]
+
+        result = self.limiter.hit('key', (10, 1), algorithm='token-bucket',
+                                  burst=20)
+
+        self.assertFalse(result)
+        self.assertEqual(1.5, result.retry_after)
+        self.redis_instance.register_script.assert_called_once_with(
+            TOKEN_BUCKET_SCRIPT)
+        self.script.assert_called_once_with(
+            keys=['ratelimit:key'], args=[10, 1000, 1, 20],
+            client=self.redis_instance)
+
+    def test_scripts_registered_once(self):
+        self.limiter.hit('a', '1/s')
+        self.limiter.hit('b', '1/s')
+
+        self.assertEqual(1, self.redis_instance.register_script.call_count)
+        self.assertEqual(2, self.script.call_count)
+
+    def test_unknown_algorithm(self):
+        self.assertRaises(ValueError, self.limiter.hit, 'key', '1/s',
+                          algorithm='leaky-bucket')
+
+    def test_load_scripts(self):
+        self.limiter.load_scripts()
+
+        self.assertEqual(2, self.redis_instance.script_load.call_count)
+
+    def test_prefix(self):
+        app = self.app
+        app.config['REDIS_RATELIMIT_PREFIX'] = 'rl:'
+        self.redis.init_app(app)
+
+        self.assertEqual('rl:', self.redis.rate_limiter.prefix)
+
+    def test_rate_limit_view(self):
+        @self.app.route('/')
+        @self.redis.rate_limit('5/minute')
+        def index():
+            return 'ok'
+
+        client = self.app.test_client()
+        response = client.get('/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('5', response.headers['X-RateLimit-Limit'])
+        self.assertEqual('4', response.headers['X-RateLimit-Remaining'])
+        self.assertEqual(['ratelimit:index:127.0.0.1'],
+                         self.script.call_args[1]['keys'])
+
+        self.script.return_value = [0, 0, 2500]
+        response = client.get('/')
+        self.assertEqual(429, response.status_code)
+        self.assertEqual('3', response.headers['Retry-After'])
+        self.assertEqual('0', response.headers['X-RateLimit-Remaining'])
+
+    def test_rate_limit_view_key_and_methods(self):
+        @self.app.route('/', methods=['GET', 'POST'])
+        @self.redis.rate_limit('5/minute', key=lambda: 'user',
+                               methods=['POST'])
+        def index():
+            return 'ok'
+
+        client = self.app.test_client()
+        client.get('/')
+        self.assertFalse(self.script.called)
+
+        client.post('/')
+        self.assertEqual(['ratelimit:index:user'],
+                         self.script.call_args[1]['keys'])
+
+
+class LockTest(FlaskRedisTestCase):
+    def test_lock(self):
+        with mock.patch('redis.StrictRedis.lock') as lock:
+            with self.app.app_context():
+                with self.redis.batch():
+                    rv = self.redis.lock('name', timeout=10)
+
+        self.assertIs(lock.return_value, rv)
+        lock.assert_called_once_with('name', timeout=10, sleep=0.1,
+                                     blocking_timeout=None)
@@ -9,9 +9,14 @@
     :author: Tobias Werner <mail@tobiaswerner.net>
     :license: BSD, see LICENSE for more details.
 """
+import os
+import pickle
+
 import mock
+import redis
 
-from tests import FlaskRedisTestCase
+import flask_redis
+from tests import FlaskRedisTestCase, create_app
 
 
 class RedisTestCase(FlaskRedisTestCase):
@@ -38,15 +43,323 @@ class RedisTestCase(FlaskRedisTestCase):
             r_get.assert_called_with('foo')
             self.assertEqual('baz', rv)
 
-    def test_redis_disconnect(self):
+    def test_redis_teardown_keeps_pool_connected(self):
+        cp = mock.Mock(name='connection_pool')
+        self.redis.connection_pool = cp
+
         with self.app.test_request_context():
-            self.redis.echo('TEST')
+            self.assertIs(cp, self.redis._connection.connection_pool)
+
+        self.assertFalse(cp.disconnect.called)
+
+    def test_redis_outside_app_context(self):
+        with mock.patch('redis.StrictRedis.get', return_value='baz') as r_get:
+            self.assertEqual('baz', self.redis.get('foo'))
+            r_get.assert_called_with('foo')
+
+    def test_commands_are_resolved_once(self):
+        with mock.patch('redis.StrictRedis.get', return_value='baz'):
+            with self.app.app_context():
+                self.redis.get('foo')
+                self.assertIn('get', vars(self.redis))
+                self.assertIs(self.redis._connect(), self.redis._connection)
+
+        self.assertRaises(AttributeError, getattr, self.redis, '_unknown')
+
+    def test_commands_before_init_app_raise(self):
+        ext = flask_redis.Redis()
+
+        self.assertRaises(RuntimeError, getattr, ext, 'get')
+        self.assertRaises(RuntimeError, getattr, ext.direct, 'get')
+        self.assertIsNone(ext._shared_client)
+
+    def test_shared_client_follows_connection_pool(self):
+        client = self.redis._connect()
+        self.assertIs(client, self.redis._connect())
+
+        self.redis.connection_pool = cp = mock.Mock(name='connection_pool')
+        self.assertIs(cp, self.redis._connect().connection_pool)
+
+    @mock.patch('redis.Connection.read_response', return_value='bar')
+    @mock.patch('redis.Connection.send_command')
+    @mock.patch('redis.Connection.can_read', return_value=False)
+    @mock.patch('redis.Connection.connect')
+    def test_redis_requests_reuse_connections(self, *_):
+        for _ in range(50):
+            with self.app.test_request_context():
+                self.redis.get('foo')
+                self.redis.get('bar')
+
+        self.assertEqual(1, self.redis.connection_pool._created_connections)
+
+    def test_connection_pool_config(self):
+        pool = flask_redis.create_connection_pool(self.app.config)
+        self.assertIsInstance(pool, flask_redis.ConnectionPool)
+        self.assertEqual('127.0.0.1', pool.connection_kwargs['host'])
+        self.assertEqual(5, pool.connection_kwargs['db'])
+
+        app = create_app(dict(REDIS_BLOCKING_POOL=True,
+                              REDIS_MAX_CONNECTIONS=4,
+                              REDIS_POOL_TIMEOUT=1,
+                              REDIS_IDLE_TIMEOUT=30,
+                              REDIS_UNIX_SOCKET_PATH='/tmp/redis.sock'))
+        ext = flask_redis.Redis(app)
+        pool = ext.connection_pool
+        self.assertIsInstance(pool, flask_redis.BlockingConnectionPool)
+        self.assertEqual(4, pool.max_connections)
+        self.assertEqual(1, pool.timeout)
+        self.assertEqual(30, pool.idle_timeout)
+        self.assertIs(redis.UnixDomainSocketConnection,
+                      pool.connection_class)
+
+    def test_connection_pool_from_config_is_used(self):
+        pool = redis.ConnectionPool()
+        app = create_app(dict(REDIS_CONNECTION_POOL=pool))
+        ext = flask_redis.Redis(app)
+        self.assertIs(pool, ext.connection_pool)
+
+    @mock.patch('redis.Connection.can_read', return_value=False)
+    @mock.patch('redis.Connection.connect')
+    def test_prewarm(self, connect, _):
+        app = create_app(dict(REDIS_POOL_PREWARM=3, REDIS_BLOCKING_POOL=True,
+                              REDIS_MAX_CONNECTIONS=4))
+        ext = flask_redis.Redis(app)
+
+        self.assertEqual(3, connect.call_count)
+        self.assertEqual(dict(primary=dict(in_use=0, idle=3, created=3,
+                                           max=4)), ext.pool_stats())
+        connection = ext.connection_pool.get_connection('GET')
+        self.assertEqual(dict(in_use=1, idle=2, created=3, max=4),
+                         ext.pool_stats()['primary'])
+        # limited by the size of the pool
+        self.assertEqual(3, ext.prewarm(10))
+        ext.connection_pool.release(connection)
+
+    @mock.patch('redis.Connection.connect',
+                side_effect=redis.ConnectionError('refused'))
+    def test_prewarm_failure_is_logged(self, _):
+        with mock.patch('flask_redis.logger') as logger:
+            ext = flask_redis.Redis(create_app(dict(REDIS_POOL_PREWARM=2)))
+
+        self.assertTrue(logger.warning.called)
+        self.assertEqual(0, ext.pool_stats()['primary']['in_use'])
+
+    @mock.patch('redis.Connection.can_read', return_value=False)
+    @mock.patch('redis.Connection.connect')
+    def test_fork_resets_pools(self, *_):
+        pool = redis.ConnectionPool()
+        ext = flask_redis.Redis(create_app(dict(REDIS_CONNECTION_POOL=pool)))
+        client = ext._connect()
+        ext.prewarm(2)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if not pid:
+            try:
+                os.close(read_fd)
+                result = (pool.pid == os.getpid(), ext._shared_client,
+                          ext.pool_stats())
+                os.write(write_fd, pickle.dumps(result))
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as reader:
+            reset, shared_client, stats = pickle.loads(reader.read())
+        os.waitpid(pid, 0)
+
+        self.assertTrue(reset)
+        self.assertIsNone(shared_client)
+        self.assertEqual(0, stats['primary']['created'])
+        # the parent keeps its connections
+        self.assertIs(client, ext._connect())
+        self.assertEqual(2, ext.pool_stats()['primary']['idle'])
+
+    @mock.patch('redis.StrictRedis.pipeline')
+    def test_redis_batch(self, pipeline):
+        pipeline.return_value.execute.return_value = ['A', 'B']
+
+        with self.app.test_request_context():
+            with self.redis.batch():
+                a = self.redis.get('a')
+                c = self.redis.get('c')
+            self.assertIsNone(self.redis._batch)
+
+        self.assertEqual('A', a.value)
+        self.assertEqual('B', c.value)
+        pipeline.return_value.execute.assert_called_once_with(
+            raise_on_error=False)
+
+    @mock.patch('redis.StrictRedis.pipeline')
+    def test_redis_auto_pipeline(self, pipeline):
+        pipeline.return_value.execute.return_value = ['A', True]
+        app = create_app(dict(REDIS_AUTO_PIPELINE=True))
+        ext = flask_redis.Redis(app)
+        results = []
+
+        @app.route('/')
+        def index():
+            results.append(ext.get('a'))
+            results.append(ext.set('b', 'B'))
+            self.assertFalse(pipeline.return_value.execute.called)
+            return 'ok'
+
+        app.test_client().get('/')
+
+        pipeline.return_value.execute.assert_called_once_with(
+            raise_on_error=False)
+        self.assertEqual(['A', True], [r.value for r in results])
+
+    def _replica_app(self, **config):
+        config.setdefault('REDIS_REPLICAS', ['10.0.0.2:6380',
+                                             dict(host='10.0.0.3', db=1)])
+        return create_app(config)
+
+    def test_replica_pools(self):
+        ext = flask_redis.Redis(self._replica_app())
+        first, second = ext.replica_pools
+
+        self.assertEqual('10.0.0.2', first.connection_kwargs['host'])
+        self.assertEqual(6380, first.connection_kwargs['port'])
+        self.assertEqual('10.0.0.3', second.connection_kwargs['host'])
+        self.assertEqual(1, second.connection_kwargs['db'])
+        self.assertEqual([], self.redis.replica_pools)
+
+    @mock.patch.object(redis.StrictRedis, 'set', autospec=True)
+    @mock.patch.object(redis.StrictRedis, 'get', autospec=True)
+    def test_reads_are_routed_to_replicas(self, r_get, r_set):
+        app = self._replica_app()
+        ext = flask_redis.Redis(app)
+
+        with app.test_request_context():
+            ext.get('foo')
+            ext.set('foo', 'bar')
+            ext.get('foo')
+
+        replica_pool = r_get.call_args_list[0][0][0].connection_pool
+        self.assertIn(replica_pool, ext.replica_pools)
+        self.assertIs(ext.connection_pool,
+                      r_set.call_args[0][0].connection_pool)
+        self.assertIs(ext.connection_pool,
+                      r_get.call_args_list[1][0][0].connection_pool)
 
-            cp = mock.Mock(name='connection_pool')
-            self.redis._connection.connection_pool = cp
+    @mock.patch.object(redis.StrictRedis, 'set', autospec=True)
+    @mock.patch.object(redis.StrictRedis, 'get', autospec=True)
+    def test_reads_without_read_your_writes(self, r_get, r_set):
+        app = self._replica_app(REDIS_READ_YOUR_WRITES=False)
+        ext = flask_redis.Redis(app)
 
-            self.app.do_teardown_appcontext()
-            cp.disconnect.assert_called_once_with()
+        with app.test_request_context():
+            ext.set('foo', 'bar')
+            ext.get('foo')
+
+        self.assertIn(r_get.call_args[0][0].connection_pool,
+                      ext.replica_pools)
+
+    def test_sentinel_pools(self):
+        from redis.sentinel import SentinelConnectionPool
+
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_SENTINELS=[('10.0.0.1', 26379)],
+            REDIS_SENTINEL_MASTER='sessions',
+            REDIS_SENTINEL_READ_REPLICAS=True)))
+
+        self.assertIsInstance(ext.connection_pool, SentinelConnectionPool)
+        self.assertTrue(ext.connection_pool.is_master)
+        self.assertEqual('sessions', ext.connection_pool.service_name)
+        replica_pool, = ext.replica_pools
+        self.assertFalse(replica_pool.is_master)
+
+    def test_sentinel_replicas_are_opt_in(self):
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_SENTINELS=[('10.0.0.1', 26379)])))
+
+        self.assertEqual([], ext.replica_pools)
+
+    def test_sentinel_pool_settings(self):
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_SENTINELS=[('10.0.0.1', 26379)],
+            REDIS_SENTINEL_MASTER='sessions', REDIS_IDLE_TIMEOUT=300,
+            REDIS_CIRCUIT_BREAKER_THRESHOLD=5)))
+
+        pool = ext.connection_pool
+        self.assertIsInstance(pool, flask_redis.SentinelConnectionPool)
+        self.assertEqual(300, pool.idle_timeout)
+        self.assertEqual(5, pool.breaker.failure_threshold)
+        self.assertEqual('sessions (master)', pool.breaker.name)
+
+    def test_blocking_sentinel_pool(self):
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_SENTINELS=[('10.0.0.1', 26379)],
+            REDIS_BLOCKING_POOL=True, REDIS_POOL_TIMEOUT=5)))
+
+        pool = ext.connection_pool
+        self.assertIsInstance(pool,
+                              flask_redis.BlockingSentinelConnectionPool)
+        self.assertIsInstance(pool, redis.BlockingConnectionPool)
+        self.assertTrue(pool.is_master)
+        self.assertEqual(50, pool.max_connections)
+        self.assertEqual(5, pool.timeout)
+
+    def test_blocking_sentinel_pool_keeps_connections_in_use(self):
+        ext = flask_redis.Redis(create_app(dict(
+            REDIS_SENTINELS=[('10.0.0.1', 26379)],
+            REDIS_BLOCKING_POOL=True)))
+        pool = ext.connection_pool
+        idle, in_use = mock.Mock(), mock.Mock()
+        pool._connections.extend([idle, in_use])
+        pool.pool.get_nowait()
+        pool.pool.put_nowait(idle)
+
+        pool.disconnect(inuse_connections=False)
+
+        idle.disconnect.assert_called_once_with()
+        self.assertFalse(in_use.disconnect.called)
+
+    @mock.patch('redis.cluster.RedisCluster')
+    def test_cluster(self, cluster):
+        app = create_app(dict(REDIS_CLUSTER_NODES=['10.0.0.1:7000',
+                                                   dict(host='10.0.0.2')],
+                              REDIS_SESSION=True))
+        ext = flask_redis.Redis(app)
+        self.assertFalse(cluster.called)
+        self.assertIsNone(ext.connection_pool)
+        self.assertTrue(app.session_interface.hash_tags)
+
+        with app.app_context():
+            ext.get('foo')
+
+        nodes = cluster.call_args[1]['startup_nodes']
+        self.assertEqual([('10.0.0.1', 7000), ('10.0.0.2', 6379)],
+                         [(node.host, node.port) for node in nodes])
+        self.assertNotIn('db', cluster.call_args[1])
+        cluster.return_value.get.assert_called_once_with('foo')
+
+    @mock.patch('redis.cluster.RedisCluster')
+    def test_cluster_with_instrumentation(self, cluster):
+        app = create_app(dict(REDIS_CLUSTER_NODES=['10.0.0.1:7000'],
+                              REDIS_INSTRUMENTATION=True))
+        ext = flask_redis.Redis(app)
+
+        with app.test_request_context():
+            ext.get('foo')
+            self.assertIs(cluster.return_value, ext._connection)
+
+        cluster.return_value.get.assert_called_once_with('foo')
+
+    def test_cluster_rejects_replicas(self):
+        app = create_app(dict(REDIS_CLUSTER_NODES=['10.0.0.1:7000'],
+                              REDIS_REPLICAS=['10.0.0.2:6379']))
+        self.assertRaises(ValueError, flask_redis.Redis, app)
+
+    def test_session_local_cache(self):
+        app = create_app(dict(REDIS_SESSION=True,
+                              REDIS_SESSION_LOCAL_CACHE=100))
+        flask_redis.Redis(app)
+        self.assertEqual(100, app.session_interface.local_cache.max_size)
+
+        app = create_app(dict(REDIS_SESSION=True, REDIS_SESSION_STORAGE='hash',
+                              REDIS_SESSION_LOCAL_CACHE=100))
+        self.assertRaises(ValueError, flask_redis.Redis, app)
 
     def test_redis_session_is_used_when_configured(self):
         from flask_redis.session import RedisSessionInterface
@@ -58,4 +371,77 @@ class RedisTestCase(FlaskRedisTestCase):
         self.redis.init_app(self.app)
 
         session_interface = self.app.session_interface
-        self.assertIsInstance(session_interface, RedisSessionInterface)
\ No newline at end of file
+        self.assertIsInstance(session_interface, RedisSessionInterface)
+
+    def _bind_app(self, **config):
+        config.setdefault('REDIS_MAX_CONNECTIONS', 20)
+        config.setdefault('REDIS_BINDS', {
+            'cache': dict(host='10.0.0.5', REDIS_DB=1),
+            'sessions': '10.0.0.6:6380'})
+        return create_app(config)
+
+    def test_bind_pools(self):
+        ext = flask_redis.Redis(self._bind_app(REDIS_DB=3))
+        cache = ext.bind_pools['cache']
+        sessions = ext.bind_pools['sessions']
+
+        self.assertEqual('10.0.0.5', cache.connection_kwargs['host'])
+        self.assertEqual(6379, cache.connection_kwargs['port'])
+        self.assertEqual(1, cache.connection_kwargs['db'])
+        self.assertEqual(20, cache.max_connections)
+        self.assertEqual('10.0.0.6', sessions.connection_kwargs['host'])
+        self.assertEqual(6380, sessions.connection_kwargs['port'])
+        self.assertEqual(0, sessions.connection_kwargs['db'])
+        self.assertEqual(3, ext.connection_pool.connection_kwargs['db'])
+        self.assertEqual({}, self.redis.bind_pools)
+
+    def test_bind_client_is_shared(self):
+        ext = flask_redis.Redis(self._bind_app())
+        client = ext.bind('cache')
+
+        self.assertIs(ext.bind_pools['cache'], client.connection_pool)
+        self.assertIs(client, ext.bind('cache'))
+        self.assertRaises(KeyError, ext.bind, 'queues')
+
+    def test_bind_ignores_connection_pool_of_app(self):
+        pool = redis.ConnectionPool()
+        ext = flask_redis.Redis(self._bind_app(REDIS_CONNECTION_POOL=pool))
+
+        self.assertIs(pool, ext.connection_pool)
+        self.assertIsNot(pool, ext.bind_pools['cache'])
+
+    def test_session_and_caching_bind(self):
+        ext = flask_redis.Redis(self._bind_app(
+            REDIS_SESSION=True, REDIS_SESSION_BIND='sessions',
+            REDIS_CACHING_BIND='cache'))
+
+        self.assertIs(ext.bind('sessions'), ext.app.session_interface.redis)
+        self.assertIs(ext.bind('cache'), ext.caching.redis)
+
+    def test_bind_clients_are_created_by_init_app(self):
+        ext = flask_redis.Redis(self._bind_app(REDIS_CACHING_BIND='cache',
+                                               REDIS_INSTRUMENTATION=True))
+
+        self.assertEqual(set(['cache', 'sessions']), set(ext._bind_clients))
+        self.assertIs(ext._bind_clients['cache'], ext.caching.redis)
+        self.assertIs(ext.instrumentation, ext.caching.redis.instrumentation)
+
+    def test_fork_recreates_bind_clients(self):
+        ext = flask_redis.Redis(self._bind_app())
+        client = ext.bind('cache')
+
+        ext._after_fork()
+
+        self.assertIsNot(client, ext.bind('cache'))
+        self.assertIs(ext.bind_pools['cache'],
+                      ext.bind('cache').connection_pool)
+
+    @mock.patch('flask_redis.create_cluster')
+    def test_cluster_bind_is_created_on_first_use(self, create_cluster):
+        ext = flask_redis.Redis(self._bind_app(REDIS_BINDS={
+            'queues': dict(cluster_nodes=['10.0.0.1:7000'])}))
+        self.assertFalse(create_cluster.called)
+
+        self.assertIs(create_cluster.return_value, ext.bind('queues'))
+        self.assertIs(create_cluster.return_value, ext.bind('queues'))
+        create_cluster.assert_called_once_with(ext._bind_clusters['queues'])
@@ -0,0 +1,351 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.resilience_test
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Testing circuit breakers, retries and degraded sessions
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import socket
+import threading
+import time
+import unittest
+
+import flask
+import mock
+import redis
+
+import flask_redis
+from flask_redis.instrumentation import InstrumentedPipeline
+from flask_redis.resilience import (CircuitBreaker, CircuitOpenError,
+                                    ResilientPipeline, ResilientRedis)
+from tests import create_app
+
+
+class FaultyServer(object):
+    """Stands in for a Redis server which is unreachable, ``'close'``
+    closing every connection right away, or slow, ``'hang'`` never replying,
+    or answers every command with nil in mode ``'reply'``.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.connections = []
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except (OSError, socket.error):
+                return
+            if self.mode == 'close':
+                connection.close()
+                continue
+            self.connections.append(connection)
+            thread = threading.Thread(target=self._serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, connection):
+        buf = b''
+        while True:
+            try:
+                data = connection.recv(65536)
+            except (OSError, socket.error):
+                return
+            if not data:
+                return
+            buf += data
+            commands, buf = self._parse(buf)
+            if self.mode == 'reply':
+                connection.sendall(b'$-1\r\n' * commands)
+
+    @staticmethod
+    def _parse(buf):
+        """Counts the complete commands in `buf`.
+
+        :returns: tuple of the count and the remaining bytes
+        """
+        commands = 0
+        while buf.startswith(b'*'):
+            lines = buf.split(b'\r\n')
+            count = int(lines[0][1:])
+            if len(lines) < 2 * count + 2:
+                break
+            consumed = sum(len(line) + 2 for line in lines[:2 * count + 1])
+            buf = buf[consumed:]
+            commands += 1
+        return commands, buf
+
+    def close(self):
+        self.sock.close()
+        for connection in self.connections:
+            connection.close()
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('flask_redis.resilience.timer',
+                             lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    def test_opens_at_threshold(self):
+        self.breaker.failure()
+        self.breaker.check()
+        self.assertEqual('closed', self.breaker.state)
+
+        self.breaker.failure()
+        self.assertEqual('open', self.breaker.state)
+        self.assertRaises(CircuitOpenError, self.breaker.check)
+
+    def test_success_resets_failures(self):
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+
+        self.assertEqual('closed', self.breaker.state)
+
+    def test_half_open(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now += 10
+        self.assertEqual('half-open', self.breaker.state)
+        self.breaker.check()
+
+        self.breaker.failure()
+        self.assertRaises(CircuitOpenError, self.breaker.check)
+
+        self.now += 10
+        self.breaker.success()
+        self.assertEqual('closed', self.breaker.state)
+        self.assertEqual(0, self.breaker.failures)
+
+    def test_half_open_lets_a_single_trial_through(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now += 10
+        self.breaker.check()
+
+        self.assertRaises(CircuitOpenError, self.breaker.check)
+        self.breaker.success()
+        self.breaker.check()
+
+    def test_lost_trial_is_given_up(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now += 10
+        self.breaker.check()
+
+        self.now += 5
+        self.assertRaises(CircuitOpenError, self.breaker.check)
+        self.now += 5
+        self.breaker.check()
+
+    def test_trial_is_run_by_reporting_callers_only(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.now += 10
+        # like pubsub, which never reports back
+        self.assertRaises(CircuitOpenError, self.breaker.check, probe=False)
+
+        self.breaker.check()
+        # connecting for the trial
+        self.breaker.check(probe=False)
+        errors = []
+
+        def check():
+            try:
+                self.breaker.check(probe=False)
+            except CircuitOpenError as e:
+                errors.append(e)
+        thread = threading.Thread(target=check)
+        thread.start()
+        thread.join()
+        self.assertEqual(1, len(errors))
+
+
+class ResilientRedisTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = flask_redis.ConnectionPool(
+            breaker=CircuitBreaker(failure_threshold=5))
+        self.client = ResilientRedis(retries=2, retry_backoff=0,
+                                     connection_pool=self.pool)
+
+    @mock.patch.object(redis.StrictRedis, 'execute_command')
+    def test_idempotent_commands_are_retried(self, execute_command):
+        execute_command.side_effect = [redis.ConnectionError(),
+                                       redis.TimeoutError(), b'value']
+
+        self.assertEqual(b'value', self.client.get('key'))
+        self.assertEqual(3, execute_command.call_count)
+        self.assertEqual(0, self.pool.breaker.failures)
+
+    @mock.patch.object(redis.StrictRedis, 'execute_command')
+    def test_retries_are_limited(self, execute_command):
+        execute_command.side_effect = redis.ConnectionError()
+
+        self.assertRaises(redis.ConnectionError, self.client.get, 'key')
+        self.assertEqual(3, execute_command.call_count)
+        self.assertEqual(3, self.pool.breaker.failures)
+
+    @mock.patch.object(redis.StrictRedis, 'execute_command')
+    def test_other_commands_are_not_retried(self, execute_command):
+        execute_command.side_effect = redis.ConnectionError()
+
+        self.assertRaises(redis.ConnectionError, self.client.incr, 'key')
+        self.assertRaises(redis.ConnectionError, self.client.set, 'key', 1,
+                          nx=True)
+        self.assertEqual(2, execute_command.call_count)
+
+    def test_open_circuit_fails_fast(self):
+        for _ in range(5):
+            self.pool.breaker.failure()
+
+        self.assertRaises(CircuitOpenError, self.client.get, 'key')
+        self.assertRaises(CircuitOpenError, self.client.pipeline().get('key')
+                          .execute)
+
+    @mock.patch.object(redis.client.Pipeline, 'execute')
+    def test_pipeline_failures_are_counted(self, execute):
+        execute.side_effect = redis.ConnectionError()
+        pipe = self.client.pipeline()
+        self.assertIsInstance(pipe, ResilientPipeline)
+
+        self.assertRaises(redis.ConnectionError, pipe.get('key').execute)
+        self.assertEqual(1, self.pool.breaker.failures)
+
+        execute.side_effect = None
+        execute.return_value = [None]
+        self.assertEqual([None], pipe.get('key').execute())
+        self.assertEqual(0, self.pool.breaker.failures)
+
+    @mock.patch.object(redis.StrictRedis, 'execute_command')
+    def test_error_replies_close_the_circuit(self, execute_command):
+        execute_command.side_effect = redis.ResponseError()
+        self.pool.breaker.failure()
+
+        self.assertRaises(redis.ResponseError, self.client.incr, 'key')
+        self.assertEqual(0, self.pool.breaker.failures)
+
+    def test_instrumented_pipeline_reports_failures(self):
+        app = create_app(dict(REDIS_CIRCUIT_BREAKER_THRESHOLD=5,
+                              REDIS_INSTRUMENTATION=True))
+        ext = flask_redis.Redis(app)
+
+        with app.app_context():
+            pipe = ext.pipeline()
+        self.assertIsInstance(pipe, ResilientPipeline)
+        self.assertIsInstance(pipe, InstrumentedPipeline)
+        self.assertIsNotNone(pipe.instrumentation)
+
+
+class ResilienceTest(unittest.TestCase):
+    def _create_app(self, mode, **config):
+        self.server = FaultyServer(mode)
+        self.addCleanup(self.server.close)
+        config.setdefault('REDIS_PORT', self.server.port)
+        config.setdefault('REDIS_SOCKET_TIMEOUT', 0.2)
+        config.setdefault('REDIS_CIRCUIT_BREAKER_THRESHOLD', 2)
+        app = create_app(config)
+        return app, flask_redis.Redis(app)
+
+    def test_circuit_opens_on_timeouts(self):
+        app, ext = self._create_app('hang', REDIS_CIRCUIT_BREAKER_TIMEOUT=0.3)
+        self.assertIsInstance(ext._connect(), ResilientRedis)
+
+        for _ in range(2):
+            self.assertRaises(redis.TimeoutError, ext.get, 'key')
+        started = time.time()
+        self.assertRaises(CircuitOpenError, ext.get, 'key')
+        self.assertLess(time.time() - started, 0.1)
+
+        self.server.mode = 'reply'
+        time.sleep(0.3)
+        self.assertIsNone(ext.get('key'))
+        self.assertEqual('closed', ext.connection_pool.breaker.state)
+
+    def test_half_open_pool_is_kept_from_pubsub(self):
+        app, ext = self._create_app('hang', REDIS_CIRCUIT_BREAKER_TIMEOUT=0.3)
+        for _ in range(2):
+            self.assertRaises(redis.TimeoutError, ext.get, 'key')
+        self.server.mode = 'reply'
+        time.sleep(0.3)
+
+        self.assertRaises(CircuitOpenError, ext.pubsub().subscribe, 'chan')
+        self.assertEqual('half-open', ext.connection_pool.breaker.state)
+        self.assertIsNone(ext.get('key'))
+        self.assertEqual('closed', ext.connection_pool.breaker.state)
+
+    def test_binds_have_own_breakers(self):
+        app, ext = self._create_app('close', REDIS_BINDS={'cache': {
+            'port': 1}})
+
+        self.assertIsNot(ext.connection_pool.breaker,
+                         ext.bind_pools['cache'].breaker)
+        self.assertEqual('localhost:1', ext.bind_pools['cache'].breaker.name)
+
+    def _session_app(self, fallback):
+        app, ext = self._create_app('close', REDIS_SESSION=True,
+                                    REDIS_SESSION_FALLBACK=fallback)
+
+        @app.route('/login')
+        def login():
+            flask.session['user'] = 'alice'
+            return 'ok'
+
+        @app.route('/')
+        def index():
+            return flask.session.get('user', 'anonymous')
+
+        client = app.test_client()
+        client.set_cookie('localhost', app.config['SESSION_COOKIE_NAME'],
+                          'stored')
+        return app, client
+
+    def test_session_without_fallback_fails(self):
+        app, client = self._session_app(None)
+
+        self.assertRaises(redis.ConnectionError, client.get, '/')
+
+    def test_empty_session_fallback(self):
+        app, client = self._session_app('empty')
+
+        response = client.get('/login')
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(b'anonymous', client.get('/').data)
+
+    def test_cookie_session_fallback(self):
+        app, client = self._session_app('cookie')
+
+        response = client.get('/login')
+        self.assertEqual(200, response.status_code)
+        cookie, = response.headers.getlist('Set-Cookie')
+        self.assertTrue(cookie.startswith('session_fallback='))
+        self.assertEqual(b'alice', client.get('/').data)
+
+    def test_cookie_session_fallback_is_restored(self):
+        app, client = self._session_app('cookie')
+        client.get('/login')
+        fallback = app.config['SESSION_COOKIE_NAME'] + '_fallback'
+        self.server.mode = 'reply'
+        client.delete_cookie('localhost', app.config['SESSION_COOKIE_NAME'])
+
+        response = client.get('/')
+        self.assertEqual(b'alice', response.data)
+        cookies = response.headers.getlist('Set-Cookie')
+        self.assertTrue(any(c.startswith(fallback + '=;') for c in cookies))
+        self.assertTrue(any(c.startswith('session=') for c in cookies))
@@ -0,0 +1,48 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.scripting_test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Testing scripts run through pipelines
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+
+import mock
+import redis
+
+from flask_redis.scripting import Scripts, queue_script, reload_scripts
+
+
+class ScriptingTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock(name='client')
+
+    def test_scripts_registered_once(self):
+        scripts = Scripts()
+
+        self.assertIs(scripts.get(self.client, 'return 1'),
+                      scripts.get(self.client, 'return 1'))
+        self.client.register_script.assert_called_once_with('return 1')
+
+    def test_queue_script_by_digest(self):
+        pipe = mock.Mock(name='pipe')
+        script = redis.StrictRedis().register_script('return 1')
+
+        queue_script(pipe, script, ['a', 'b'], [1])
+
+        pipe.evalsha.assert_called_once_with(script.sha, 2, 'a', 'b', 1)
+        self.assertFalse(pipe.script_exists.called)
+
+    def test_reload_scripts(self):
+        self.assertFalse(reload_scripts(self.client, [True, 1], 'return 1'))
+        self.assertFalse(self.client.script_load.called)
+
+        self.assertTrue(reload_scripts(
+            self.client, [True, redis.exceptions.NoScriptError()],
+            'return 1', 'return 2'))
+        self.assertEqual([mock.call('return 1'), mock.call('return 2')],
+                         self.client.script_load.call_args_list)
@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.serializers_test
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Testing serializers
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import datetime
+import unittest
+
+try:
+    import cPickle
+except ImportError:
+    import pickle as cPickle
+
+from flask_redis import serializers
+
+
+class SerializersTest(unittest.TestCase):
+    data = dict(user_id=42, name=u'Jos\xe9', roles=['admin', 'editor'],
+                cart=dict(items=[1, 2, 3], total=12.5), flag=True)
+
+    def test_round_trip(self):
+        for name, serializer in serializers.serializers.items():
+            value = serializers.dumps(self.data, serializer)
+            self.assertEqual(serializer.tag, value[:1], name)
+            self.assertEqual(self.data, serializers.loads(value), name)
+
+    def test_json_round_trips_datetime(self):
+        serializer = serializers.get_serializer('json')
+        now = datetime.datetime(2013, 12, 3, 21, 19, 41)
+        value = serializers.dumps(dict(now=now), serializer)
+        loaded = serializers.loads(value)['now']
+        self.assertEqual(now, loaded.replace(tzinfo=None))
+
+    def test_loads_legacy_pickle(self):
+        value = cPickle.dumps(self.data)
+        self.assertEqual(self.data, serializers.loads(value))
+
+    def test_pickle_uses_highest_protocol(self):
+        serializer = serializers.get_serializer('pickle')
+        self.assertLess(len(serializer.dumps(self.data)),
+                        len(cPickle.dumps(self.data, 0)))
+
+    def test_get_serializer(self):
+        serializer = serializers.PickleSerializer()
+        self.assertIs(serializer, serializers.get_serializer(serializer))
+        self.assertRaises(ValueError, serializers.get_serializer, 'yaml')
+
+    def test_register_serializer_rejects_used_tag(self):
+        class Clash(serializers.PickleSerializer):
+            pass
+
+        self.assertRaises(ValueError, serializers.register_serializer,
+                          'clash', Clash())
+        self.assertNotIn('clash', serializers.serializers)
+
+    def test_register_serializer_rejects_compressor_tags(self):
+        for tag in (b'\x10', b'\x11', b'\x12'):
+            class Clash(serializers.PickleSerializer):
+                pass
+            Clash.tag = tag
+
+            self.assertRaises(ValueError, serializers.register_serializer,
+                              'clash', Clash())
+        self.assertNotIn('clash', serializers.serializers)
+
+    def test_incomplete_serializer_cannot_be_instantiated(self):
+        class Incomplete(serializers.Serializer):
+            tag = b'\x7f'
+
+            def dumps(self, data):
+                return b''
+
+        self.assertRaises(TypeError, Incomplete)
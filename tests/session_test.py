@@ -11,11 +11,19 @@
 """
 
 import datetime
-import cPickle
+import time
+
+try:
+    import cPickle
+except ImportError:
+    import pickle as cPickle
 
 import mock
 
-from flask_redis.session import RedisSession, RedisSessionInterface
+from flask_redis import compression, serializers
+from flask_redis.session import (RedisSession, RedisSessionInterface,
+                                 RedisHashSession, RedisLazyHashSession,
+                                 RedisHashSessionInterface, LocalSessionCache)
 from tests import FlaskRedisTestCase
 
 
@@ -53,11 +61,18 @@ class RedisSessionInterfaceTest(FlaskRedisTestCase):
         self.session_object = mock.MagicMock(name='redis_session')
 
     def test_generate_sid(self):
-        sid = RedisSessionInterface.generate_sid()
+        sid = self.session_interface.generate_sid()
         self.assertIsInstance(sid, str)
-        self.assertTrue(not len(sid) < 16)
+        self.assertEqual(32, len(sid))
         self.assertNotEqual(sid, self.session_interface.generate_sid())
 
+        self.session_interface.sid_bytes = 48
+        self.assertEqual(64, len(self.session_interface.generate_sid()))
+
+    def test_sid_bytes_minimum(self):
+        self.assertRaises(ValueError, RedisSessionInterface,
+                          self.redis_instance, sid_bytes=8)
+
     def test_open_new_session(self):
         request = mock.Mock(name='request')
         cookies_get = mock.Mock(name='cookies.get', return_value=None)
@@ -69,41 +84,66 @@ class RedisSessionInterfaceTest(FlaskRedisTestCase):
         session = self.session_interface.open_session(self.app, request)
 
         self.assertIsInstance(session, RedisSession)
-        self.assertEqual('new__sid', session.sid)
+        self.assertIsNone(session.sid)
         self.assertTrue(session.new)
+        self.assertFalse(generate_sid.called)
 
     def test_open_session_with_spoofed_sid(self):
         request = mock.Mock(name='request')
         cookies_get = mock.Mock(name='cookies.get', return_value='spoofed_sid')
         request.cookies.get = cookies_get
 
-        self.redis_instance.exists.return_value = False
-
-        generate_sid = mock.Mock(name='generate_sid',
-                                 return_value='secure__sid')
-        self.session_interface.generate_sid = generate_sid
+        self.redis_instance.get.return_value = None
 
         session = self.session_interface.open_session(self.app, request)
 
-        self.redis_instance.exists.assert_called_with(
-            'session:spoofed_sid:data')
+        self.redis_instance.get.assert_called_with('session:spoofed_sid:data')
         self.assertIsInstance(session, RedisSession)
+        self.assertIsNone(session.sid)
+
+    def test_save_new_session_generates_sid(self):
+        self.session_interface.generate_sid = mock.Mock(
+            name='generate_sid', return_value='secure__sid')
+        response = mock.Mock(name='response')
+        session = RedisSession(new=True)
+
+        self.session_interface.save_session(self.app, session, response)
+        self.assertIsNone(session.sid)
+        self.assertFalse(self.redis_instance.pipeline.called)
+        self.assertFalse(response.set_cookie.called)
+
+        session['a'] = 'test_A'
+        self.session_interface.save_session(self.app, session, response)
         self.assertEqual('secure__sid', session.sid)
+        pipe = self.redis_instance.pipeline.return_value
+        self.assertEqual('session:secure__sid:data',
+                         pipe.setex.call_args[0][0])
+        self.assertEqual('secure__sid', response.set_cookie.call_args[0][1])
+
+    def test_save_new_session_with_generated_sid(self):
+        response = mock.Mock(name='response')
+        session = RedisSession(new=True)
+        session['a'] = 'test_A'
+
+        self.session_interface.save_session(self.app, session, response)
+
+        self.assertIsInstance(session.sid, str)
+        pipe = self.redis_instance.pipeline.return_value
+        self.assertEqual('session:%s:data' % session.sid,
+                         pipe.setex.call_args[0][0])
+        self.assertEqual(session.sid, response.set_cookie.call_args[0][1])
 
     def test_open_existing_session(self):
         request = mock.Mock(name='request')
         cookies_get = mock.Mock(name='cookies.get', return_value='known_sid')
         request.cookies.get = cookies_get
 
-        self.redis_instance.exists.return_value = True
-
         rv = cPickle.dumps(dict(a='test_A', b='test_B'))
         self.redis_instance.get.return_value = rv
 
         session = self.session_interface.open_session(self.app, request)
 
         cookies_get.assert_called_with(self.app.session_cookie_name)
-        self.redis_instance.exists.assert_called_with('session:known_sid:data')
         self.redis_instance.get.assert_called_with('session:known_sid:data')
 
         self.assertIn('a', session)
@@ -111,6 +151,80 @@ class RedisSessionInterfaceTest(FlaskRedisTestCase):
         self.assertIn('b', session)
         self.assertEqual('test_B', session['b'])
 
+    def test_open_session_with_tagged_value(self):
+        request = mock.Mock(name='request')
+        request.cookies.get.return_value = 'known_sid'
+        self.redis_instance.get.return_value = serializers.dumps(
+            dict(a='test_A'), serializers.get_serializer('json'))
+
+        session = self.session_interface.open_session(self.app, request)
+
+        self.assertEqual('test_A', session['a'])
+
+    def test_save_session_uses_serializer(self):
+        self.session_interface = RedisSessionInterface(
+            redis=self.redis_instance, serializer='json')
+        session = RedisSession(sid='__123__', new=True)
+        session['a'] = 'test_A'
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        pipe = self.redis_instance.pipeline.return_value
+        value = pipe.setex.call_args[0][2]
+        self.assertEqual(serializers.JSONSerializer.tag, value[:1])
+        self.assertEqual(dict(a='test_A'), serializers.loads(value))
+
+    def test_large_session_is_compressed(self):
+        self.session_interface = RedisSessionInterface(
+            redis=self.redis_instance, compressor='zlib',
+            compression_threshold=512)
+        session = RedisSession(sid='__123__', new=True)
+        session['cart'] = ['item %d' % i for i in range(100)]
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        pipe = self.redis_instance.pipeline.return_value
+        value = pipe.setex.call_args[0][2]
+        self.assertEqual(compression.ZlibCompressor.tag, value[:1])
+
+        request = mock.Mock(name='request')
+        request.cookies.get.return_value = '__123__'
+        self.redis_instance.get.return_value = value
+        loaded = self.session_interface.open_session(self.app, request)
+        self.assertEqual(session['cart'], loaded['cart'])
+
+    def test_get_redis_key_with_hash_tags(self):
+        self.assertEqual('session:sid:data',
+                         self.session_interface.get_redis_key('sid'))
+        self.session_interface.hash_tags = True
+        self.assertEqual('session:{sid}:data',
+                         self.session_interface.get_redis_key('sid'))
+        self.assertEqual('session:{sid}:refreshed',
+                         self.session_interface.get_redis_key('sid',
+                                                              'refreshed'))
+
+    def _count_open_session_commands(self, sid, stored):
+        request = mock.Mock(name='request')
+        request.cookies.get.return_value = sid
+        self.session_interface.generate_sid = mock.Mock(return_value='sid')
+        self.redis_instance.reset_mock()
+        self.redis_instance.get.return_value = stored
+
+        self.session_interface.open_session(self.app, request)
+        return len(self.redis_instance.method_calls)
+
+    def test_open_session_round_trips(self):
+        known = cPickle.dumps(dict(a='test_A'))
+
+        self.assertEqual(0, self._count_open_session_commands(None, None))
+        self.assertEqual(1, self._count_open_session_commands('known_sid',
+                                                              known))
+        self.assertEqual(1, self._count_open_session_commands('spoofed_sid',
+                                                              None))
+        self.assertFalse(self.redis_instance.exists.called)
+
     def test_get_redis_expiration_time(self):
         self.assertTrue(self.session_object.permanent)
         lifetime = RedisSessionInterface.get_redis_expiration_time(
@@ -167,9 +281,10 @@ class RedisSessionInterfaceTest(FlaskRedisTestCase):
         response = mock.Mock(name='response')
 
         self.session_object.sid = '__123__'
+        self.session_object.new = False
         self.session_object.modified = True
 
-        self.session_object.__nonzero__.return_value = False
+        self.session_object.__bool__.return_value = False
         self.assertTrue(not self.session_object)
 
         self.session_interface.save_session(self.app, self.session_object,
@@ -178,4 +293,454 @@ class RedisSessionInterfaceTest(FlaskRedisTestCase):
         response.delete_cookie.assert_called_with('session',
                                                   domain='example.com')
 
-        self.redis_instance.delete.assert_called_with('session:__123__:data')
\ No newline at end of file
+        self.redis_instance.delete.assert_called_with('session:__123__:data')
+
+    def _save_unmodified_session(self, refreshed_at=None, permanent=False):
+        session = RedisSession(dict(a='test_A'), sid='__123__',
+                               refreshed_at=refreshed_at)
+        session.permanent = permanent
+        session.modified = False
+        response = mock.Mock(name='response')
+        self.session_interface.save_session(self.app, session, response)
+        return self.redis_instance.pipeline.return_value, response
+
+    def test_save_unmodified_session_refreshes_expiration(self):
+        pipe, response = self._save_unmodified_session()
+
+        pipe.expire.assert_called_once_with('session:__123__:data', 86400)
+        self.assertFalse(pipe.setex.called)
+        pipe.execute.assert_called_once_with()
+        self.assertFalse(response.set_cookie.called)
+
+    def test_save_unmodified_permanent_session_sends_cookie(self):
+        pipe, response = self._save_unmodified_session(permanent=True)
+
+        self.assertFalse(pipe.setex.called)
+        self.assertTrue(response.set_cookie.called)
+
+    def test_save_unmodified_session_without_refresh(self):
+        self.app.config['REDIS_SESSION_REFRESH_EACH_REQUEST'] = False
+        pipe, response = self._save_unmodified_session(permanent=True)
+
+        self.assertFalse(self.redis_instance.pipeline.called)
+        self.assertFalse(response.set_cookie.called)
+
+    def test_save_unmodified_session_refresh_interval(self):
+        self.app.config['REDIS_SESSION_REFRESH_INTERVAL'] = 60
+
+        pipe, response = self._save_unmodified_session(time.time() - 10)
+        self.assertFalse(self.redis_instance.pipeline.called)
+
+        pipe, response = self._save_unmodified_session(time.time() - 100)
+        pipe.expire.assert_called_once_with('session:__123__:data', 86400)
+        self.assertEqual('session:__123__:refreshed',
+                         pipe.setex.call_args[0][0])
+
+    def test_open_session_fetches_refresh_time(self):
+        self.app.config['REDIS_SESSION_REFRESH_INTERVAL'] = 60
+        request = mock.Mock(name='request')
+        request.cookies.get.return_value = 'known_sid'
+        self.redis_instance.mget.return_value = [
+            cPickle.dumps(dict(a='test_A')), '1386100000.5']
+
+        session = self.session_interface.open_session(self.app, request)
+
+        self.redis_instance.mget.assert_called_once_with(
+            'session:known_sid:data', 'session:known_sid:refreshed')
+        self.assertEqual(1386100000.5, session.refreshed_at)
+        self.assertEqual('test_A', session['a'])
+
+
+class LocalSessionCacheTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.cache = LocalSessionCache(max_size=2)
+
+    def test_get_checks_version(self):
+        data = cPickle.dumps(dict(a=1))
+        self.cache.put('sid', b'v1', data)
+
+        self.assertIs(data, self.cache.get('sid', b'v1'))
+        self.assertIsNone(self.cache.get('sid', b'v2'))
+        self.assertNotIn('sid', self.cache)
+        self.assertIsNone(self.cache.get('sid', b'v1'))
+        self.assertEqual((1, 1, 1), (self.cache.hits, self.cache.stale,
+                                     self.cache.misses))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', 'v', b'')
+        self.cache.put('b', 'v', b'')
+        self.cache.get('a', 'v')
+        self.cache.put('c', 'v', b'')
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(1, self.cache.evictions)
+
+    def test_stats(self):
+        self.assertEqual(0.0, self.cache.stats()['hit_ratio'])
+        self.cache.put('a', 'v', b'')
+        self.cache.get('a', 'v')
+        self.cache.lookup('b')
+
+        stats = self.cache.stats()
+        self.assertEqual(0.5, stats['hit_ratio'])
+        self.assertEqual(1, stats['size'])
+
+
+class LocallyCachedSessionInterfaceTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.cache = LocalSessionCache()
+        self.session_interface = RedisSessionInterface(
+            redis=self.redis_instance, local_cache=self.cache)
+        self.request = mock.Mock(name='request')
+        self.request.cookies.get.return_value = 'known_sid'
+
+    def test_open_session_fetches_version_on_hit(self):
+        self.cache.put('known_sid', b'v1', cPickle.dumps(dict(a='test_A')))
+        self.redis_instance.get.return_value = b'v1'
+
+        session = self.session_interface.open_session(self.app, self.request)
+
+        self.redis_instance.get.assert_called_once_with(
+            'session:known_sid:version')
+        self.assertFalse(self.redis_instance.mget.called)
+        self.assertEqual('test_A', session['a'])
+        self.assertEqual(1, self.cache.hits)
+
+    def test_requests_do_not_share_nested_values(self):
+        self.cache.put('known_sid', b'v1', cPickle.dumps(dict(cart=[1])))
+        self.redis_instance.get.return_value = b'v1'
+
+        first = self.session_interface.open_session(self.app, self.request)
+        first['cart'].append(2)
+        second = self.session_interface.open_session(self.app, self.request)
+
+        self.assertEqual([1], second['cart'])
+        self.assertEqual(2, self.cache.hits)
+
+    def test_open_session_caches_on_miss(self):
+        self.redis_instance.mget.return_value = [
+            cPickle.dumps(dict(a='test_A')), b'v1']
+
+        session = self.session_interface.open_session(self.app, self.request)
+
+        self.redis_instance.mget.assert_called_once_with(
+            ['session:known_sid:data', 'session:known_sid:version'])
+        self.assertEqual('test_A', session['a'])
+        self.assertEqual(dict(a='test_A'), cPickle.loads(
+            self.cache.get('known_sid', 'v1')))
+
+    def test_open_session_refetches_stale_entry(self):
+        self.app.config['REDIS_SESSION_REFRESH_INTERVAL'] = 60
+        self.cache.put('known_sid', b'v1', cPickle.dumps(dict(a='old')))
+        self.redis_instance.mget.side_effect = [
+            [b'v2', b'1386100000.5'],
+            [cPickle.dumps(dict(a='new')), b'v2', b'1386100000.5']]
+
+        session = self.session_interface.open_session(self.app, self.request)
+
+        self.assertEqual('new', session['a'])
+        self.assertEqual(1386100000.5, session.refreshed_at)
+        self.assertEqual(1, self.cache.stale)
+
+    def test_save_session_stamps_version(self):
+        session = RedisSession(sid='sid')
+        session['a'] = 1
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        pipe = self.redis_instance.pipeline.return_value
+        key, seconds, version = pipe.setex.call_args_list[1][0]
+        self.assertEqual('session:sid:version', key)
+        self.assertEqual(dict(a=1), serializers.loads(
+            self.cache.get('sid', version)))
+
+    def test_save_unmodified_session_refreshes_version(self):
+        session = RedisSession(dict(a=1), sid='sid')
+        response = mock.Mock(name='response')
+
+        self.session_interface.save_session(self.app, session, response)
+
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.expire.assert_any_call('session:sid:version', 86400)
+        self.assertNotIn('sid', self.cache)
+
+    def test_deleted_session_is_dropped(self):
+        self.cache.put('sid', 'v1', b'')
+        session = RedisSession(dict(a=1), sid='sid')
+        session.clear()
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        self.redis_instance.delete.assert_called_once_with(
+            'session:sid:data', 'session:sid:version')
+        self.assertNotIn('sid', self.cache)
+
+
+class RedisHashSessionTest(FlaskRedisTestCase):
+    def _setUp(self):
+        initial = dict(a='test1', b='test2')
+        self.session_object = RedisHashSession(sid='test123', initial=initial)
+
+    def test_tracks_changes(self):
+        self.session_object['c'] = 'test3'
+        self.session_object.setdefault('d', 'test4')
+        self.session_object.setdefault('a', 'ignored')
+        self.session_object.update(e='test5')
+
+        self.assertEqual(set(['c', 'd', 'e']), self.session_object.changed)
+        self.assertEqual(set(), self.session_object.deleted)
+        self.assertTrue(self.session_object.modified)
+
+    def test_tracks_deletions(self):
+        self.session_object['c'] = 'test3'
+        del self.session_object['a']
+        self.session_object.pop('c')
+        self.session_object.pop('missing', None)
+
+        self.assertEqual(set(), self.session_object.changed)
+        self.assertEqual(set(['a', 'c']), self.session_object.deleted)
+
+        self.session_object.clear()
+        self.assertEqual(set(['a', 'b', 'c']), self.session_object.deleted)
+
+    def test_lazy_session_loads_on_access(self):
+        loader = mock.Mock(name='loader', side_effect=lambda keys: [
+            'value_' + key for key in keys])
+        session = RedisLazyHashSession(['a', 'b', 'c'], sid='test123',
+                                       loader=loader)
+
+        self.assertIn('a', session)
+        self.assertFalse(loader.called)
+        self.assertEqual('value_a', session['a'])
+        self.assertEqual('value_a', session.get('a'))
+        loader.assert_called_once_with(['a'])
+
+        self.assertEqual(dict(a='value_a', b='value_b', c='value_c'),
+                         dict(session.items()))
+        loader.assert_called_with(['b', 'c'])
+        self.assertFalse(session.modified)
+
+
+class RedisHashSessionInterfaceTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.session_interface = RedisHashSessionInterface(
+            redis=self.redis_instance)
+        self.request = mock.Mock(name='request')
+        self.request.cookies.get.return_value = 'known_sid'
+
+    def test_open_session(self):
+        dump_value = self.session_interface.dump_value
+        self.redis_instance.hgetall.return_value = {
+            b'a': dump_value('test_A'), b'b': dump_value([1, 2])}
+
+        session = self.session_interface.open_session(self.app, self.request)
+
+        self.redis_instance.hgetall.assert_called_once_with(
+            'session:known_sid:fields')
+        self.assertEqual(dict(a='test_A', b=[1, 2]), dict(session))
+        self.assertEqual('known_sid', session.sid)
+
+    def test_open_session_with_spoofed_sid(self):
+        self.redis_instance.hgetall.return_value = {}
+
+        session = self.session_interface.open_session(self.app, self.request)
+
+        self.assertTrue(session.new)
+        self.assertIsNone(session.sid)
+
+    def test_save_new_session_generates_sid(self):
+        self.session_interface.generate_sid = mock.Mock(
+            return_value='secure__sid')
+        session = RedisHashSession(new=True)
+        session['a'] = 'test_A'
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        self.assertEqual('secure__sid', session.sid)
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.expire.assert_called_once_with('session:secure__sid:fields',
+                                            mock.ANY)
+
+    def test_open_lazy_session(self):
+        self.session_interface.lazy = True
+        self.redis_instance.hkeys.return_value = [b'a', b'b']
+        self.redis_instance.hmget.return_value = [
+            self.session_interface.dump_value('test_A')]
+
+        session = self.session_interface.open_session(self.app, self.request)
+
+        self.assertIsInstance(session, RedisLazyHashSession)
+        self.assertFalse(self.redis_instance.hgetall.called)
+        self.assertEqual('test_A', session['a'])
+        self.redis_instance.hmget.assert_called_once_with(
+            'session:known_sid:fields', ['a'])
+
+    def test_save_session_writes_changed_fields_only(self):
+        session = RedisHashSession(dict(a='test_A', b='test_B', c='test_C'),
+                                   sid='known_sid')
+        session['a'] = 'new_A'
+        del session['b']
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.hset.assert_called_once_with(
+            'session:known_sid:fields', 'a',
+            self.session_interface.dump_value('new_A'))
+        pipe.hdel.assert_called_once_with('session:known_sid:fields', 'b')
+        pipe.expire.assert_called_once_with('session:known_sid:fields',
+                                            86400)
+        pipe.execute.assert_called_once_with()
+
+    def test_save_session_modified_in_place_writes_all_fields(self):
+        session = RedisHashSession(dict(a='test_A', b=[1]), sid='known_sid')
+        session['b'].append(2)
+        session.modified = True
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        pipe = self.redis_instance.pipeline.return_value
+        self.assertEqual(2, pipe.hset.call_count)
+
+    def test_save_session_with_changed_and_in_place_fields(self):
+        session = RedisHashSession(dict(a='test_A', b=[1], c='test_C'),
+                                   sid='known_sid')
+        session['a'] = 'new_A'
+        del session['c']
+        session['b'].append(2)
+        session.modified = True
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        pipe = self.redis_instance.pipeline.return_value
+        pipe.hset.assert_has_calls([
+            mock.call('session:known_sid:fields', 'a',
+                      self.session_interface.dump_value('new_A')),
+            mock.call('session:known_sid:fields', 'b',
+                      self.session_interface.dump_value([1, 2]))],
+            any_order=True)
+        pipe.hdel.assert_called_once_with('session:known_sid:fields', 'c')
+
+    def test_lazy_session_exports_loaded_values(self):
+        loader = mock.Mock(side_effect=lambda keys: [k.upper() for k in keys])
+        session = RedisLazyHashSession(['a', 'b'], loader=loader)
+
+        self.assertEqual(dict(a='A', b='B'), dict(session))
+        self.assertEqual(1, loader.call_count)
+        self.assertFalse(session.modified)
+
+
+class SessionAdministrationTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.session_interface = RedisSessionInterface(
+            redis=self.redis_instance, user_key='user_id')
+        self.pipe = self.redis_instance.pipeline.return_value
+
+    def test_save_session_indexes_user(self):
+        session = RedisSession(dict(user_id=42), sid='sid', new=True)
+        session.modified = True
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        self.pipe.sadd.assert_called_once_with('session:user:42', 'sid')
+        self.pipe.expire.assert_called_once_with('session:user:42',
+                                                 31 * 24 * 3600)
+        self.assertFalse(self.pipe.srem.called)
+        self.assertEqual(42, session.indexed_user)
+
+    def test_save_session_moves_index_on_user_change(self):
+        request = mock.Mock(name='request')
+        request.cookies.get.return_value = 'sid'
+        self.redis_instance.get.return_value = cPickle.dumps(
+            dict(user_id=42))
+        session = self.session_interface.open_session(self.app, request)
+        self.assertEqual(42, session.indexed_user)
+
+        session['user_id'] = 43
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        self.pipe.srem.assert_called_once_with('session:user:42', 'sid')
+        self.pipe.sadd.assert_called_once_with('session:user:43', 'sid')
+
+    def test_deleted_session_is_unindexed(self):
+        session = RedisSession(sid='sid')
+        session.indexed_user = 42
+
+        self.session_interface.save_session(self.app, session,
+                                            mock.Mock(name='response'))
+
+        self.redis_instance.srem.assert_called_once_with('session:user:42',
+                                                         'sid')
+
+    def test_get_user_sessions_drops_expired(self):
+        self.redis_instance.smembers.return_value = set([b'a', b'b'])
+        self.pipe.execute.side_effect = lambda: [
+            call[0][0] == 'session:a:data'
+            for call in self.pipe.exists.call_args_list]
+
+        self.assertEqual(['a'],
+                         self.session_interface.get_user_sessions('42'))
+        self.redis_instance.srem.assert_called_once_with('session:user:42',
+                                                         'b')
+
+    def test_delete_user_sessions(self):
+        self.redis_instance.smembers.return_value = set([b'a', b'b'])
+        self.pipe.execute.return_value = [1, 0]
+
+        self.assertEqual(1,
+                         self.session_interface.delete_user_sessions('42'))
+        self.pipe.delete.assert_has_calls([
+            mock.call('session:a:data', 'session:a:refreshed'),
+            mock.call('session:b:data', 'session:b:refreshed')],
+            any_order=True)
+        self.redis_instance.delete.assert_called_once_with('session:user:42')
+
+    def test_scan_sessions(self):
+        self.redis_instance.scan_iter.return_value = iter(
+            [b'session:a:data', b'session:b:data', b'session:c:data'])
+
+        batches = list(self.session_interface.scan_sessions(batch_size=2))
+
+        self.assertEqual([['a', 'b'], ['c']], batches)
+        self.redis_instance.scan_iter.assert_called_once_with(
+            match='session:*:data', count=2)
+
+    def test_scan_hash_sessions_with_hash_tags(self):
+        self.session_interface = RedisHashSessionInterface(
+            redis=self.redis_instance, hash_tags=True)
+        self.redis_instance.scan_iter.return_value = iter(
+            [b'session:{a}:fields'])
+
+        self.assertEqual([['a']],
+                         list(self.session_interface.scan_sessions()))
+        self.redis_instance.scan_iter.assert_called_once_with(
+            match='session:{*}:fields', count=1000)
+
+    def test_inspect_sessions(self):
+        self.pipe.execute.return_value = [
+            100, 5, 80, 40, -2, Exception('LFU'), None, None]
+
+        self.assertEqual([
+            dict(sid='a', ttl=100, idle=5, bytes=120),
+            dict(sid='b', ttl=-2, idle=None, bytes=0)],
+            self.session_interface.inspect_sessions(['a', 'b']))
+
+    def test_find_unreadable_sessions(self):
+        self.pipe.execute.return_value = [
+            cPickle.dumps(dict(a=1)), b'\x01garbage', None]
+
+        self.assertEqual(['b'],
+                         self.session_interface.find_unreadable_sessions(
+                             ['a', 'b', 'c']))
@@ -0,0 +1,132 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.streaming_test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Testing streaming of large values
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import io
+
+import mock
+import redis
+
+from flask_redis.streaming import iter_value, open_value, write_chunked
+from tests import FlaskRedisTestCase
+
+
+class StreamingTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.client = mock.MagicMock(name='client')
+        self.pipe = self.client.pipeline.return_value
+
+    def test_open_missing_value(self):
+        self.pipe.execute.return_value = [0, 0, [None, None, None]]
+
+        self.assertIsNone(open_value(self.client, 'blob'))
+        self.assertEqual([], list(iter_value(self.client, 'blob')))
+
+    def test_string_value_is_read_in_ranges(self):
+        self.pipe.execute.side_effect = [
+            [1, 10, redis.ResponseError('WRONGTYPE')],
+            [b'abcd', b'efgh'], [b'ij']]
+
+        size, chunks = open_value(self.client, 'blob', chunk_size=4,
+                                  prefetch=2)
+
+        self.assertEqual(10, size)
+        self.assertEqual([b'abcd', b'efgh', b'ij'], list(chunks))
+        self.pipe.getrange.assert_has_calls([
+            mock.call('blob', 0, 3), mock.call('blob', 4, 7),
+            mock.call('blob', 8, 9)])
+
+    def test_chunked_value_is_read_by_version(self):
+        self.pipe.execute.side_effect = [
+            [1, redis.ResponseError('WRONGTYPE'), [b'v1', b'3', b'9']],
+            [b'abc', b'def'], [b'ghi']]
+
+        size, chunks = open_value(self.client, 'blob', prefetch=2)
+
+        self.assertEqual(9, size)
+        self.assertEqual([b'abc', b'def', b'ghi'], list(chunks))
+        self.pipe.get.assert_has_calls([
+            mock.call('blob:chunk:v1:0'), mock.call('blob:chunk:v1:1'),
+            mock.call('blob:chunk:v1:2')])
+
+    def test_expired_chunk(self):
+        self.pipe.execute.side_effect = [
+            [1, redis.ResponseError('WRONGTYPE'), [b'v1', b'2', b'6']],
+            [b'abc', None]]
+
+        chunks = iter_value(self.client, 'blob')
+        self.assertEqual(b'abc', next(chunks))
+        self.assertRaises(redis.DataError, next, chunks)
+
+    def test_write_chunked(self):
+        sent = []
+        self.pipe.setex.side_effect = lambda key, ttl, view: sent.append(
+            (key, ttl, bytes(view), type(view)))
+        transaction_pipe = mock.MagicMock(name='transaction_pipe')
+        transaction_pipe.type.return_value = b'hash'
+        transaction_pipe.hmget.return_value = [b'old', b'2']
+        self.client.transaction.side_effect = \
+            lambda func, *keys: func(transaction_pipe)
+
+        with mock.patch('uuid.uuid4') as uuid4:
+            uuid4.return_value.hex = 'new'
+            size = write_chunked(self.client, 'blob', io.BytesIO(b'x' * 10),
+                                 chunk_size=4, prefetch=2, grace=30)
+
+        self.assertEqual(10, size)
+        self.assertEqual([('blob:chunk:new:0', 3600, b'xxxx', memoryview),
+                          ('blob:chunk:new:1', 3600, b'xxxx', memoryview),
+                          ('blob:chunk:new:2', 3600, b'xx', memoryview)],
+                         sent)
+        # once per two buffers and at the end
+        self.assertEqual(2, self.pipe.execute.call_count)
+        self.client.transaction.assert_called_once_with(mock.ANY, 'blob')
+        transaction_pipe.persist.assert_has_calls([
+            mock.call('blob:chunk:new:%d' % i) for i in range(3)])
+        transaction_pipe.expire.assert_has_calls([
+            mock.call('blob:chunk:old:0', 30),
+            mock.call('blob:chunk:old:1', 30)])
+        transaction_pipe.hset.assert_called_once_with('blob', mapping=dict(
+            version='new', chunks=3, size=10, chunk_size=4))
+
+    def test_write_chunked_replaces_string(self):
+        transaction_pipe = mock.MagicMock(name='transaction_pipe')
+        transaction_pipe.type.return_value = b'string'
+        self.client.transaction.side_effect = \
+            lambda func, *keys: func(transaction_pipe)
+
+        write_chunked(self.client, 'blob', io.BytesIO(b'abc'))
+
+        self.assertFalse(transaction_pipe.hmget.called)
+        self.assertFalse(transaction_pipe.expire.called)
+        transaction_pipe.delete.assert_called_once_with('blob')
+        self.assertTrue(transaction_pipe.hset.called)
+
+    def test_write_from_stream_without_readinto(self):
+        stream = mock.Mock(spec=['read'])
+        stream.read.side_effect = [b'ab', b'cd', b'e', b'']
+        self.client.transaction.return_value = None
+
+        self.assertEqual(5, write_chunked(self.client, 'blob', stream,
+                                          chunk_size=4))
+        key, ttl, view = self.pipe.setex.call_args_list[0][0]
+        self.assertEqual(b'abcd', bytes(view))
+
+    def test_send_value(self):
+        self.pipe.execute.side_effect = [
+            [1, 6, redis.ResponseError('WRONGTYPE')], [b'abcdef']]
+        with self.app.test_request_context(), \
+                mock.patch.object(self.redis, '_connect',
+                                  return_value=self.client):
+            response = self.redis.send_value('blob', mimetype='text/csv')
+
+            self.assertEqual(6, response.content_length)
+            self.assertEqual('text/csv', response.mimetype)
+            self.assertEqual([b'abcdef'], list(response.response))
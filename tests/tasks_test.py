@@ -0,0 +1,213 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.tasks_test
+    ~~~~~~~~~~~~~~~~
+
+    Testing the job queue
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import flask
+import mock
+import redis
+
+from flask_redis.tasks import Worker
+from tests import FlaskRedisTestCase
+
+
+class TaskTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.redis_instance = mock.MagicMock(name='redis_instance')
+        self.tasks = self.redis.tasks
+        self.tasks.redis = self.redis_instance
+
+        @self.redis.task(retries=2)
+        def add(a, b):
+            return a + b
+        self.add = add
+
+    def test_registers_task(self):
+        self.assertIs(self.add, self.tasks.tasks['tests.tasks_test.add'])
+        self.assertEqual(3, self.add(1, 2))
+
+    def test_delay_pushes_job(self):
+        job_id = self.add.delay(1, b=2)
+
+        key, value = self.redis_instance.lpush.call_args[0]
+        self.assertEqual('tasks:queue:default', key)
+        job = self.tasks.load_job(value)
+        self.assertEqual(job_id, job['id'])
+        self.assertEqual(('tests.tasks_test.add', [1], {'b': 2}, 0),
+                         (job['task'], job['args'], job['kwargs'],
+                          job['attempt']))
+
+    def test_countdown_delays_job(self):
+        with mock.patch('time.time', return_value=1000.0):
+            self.add.apply_async((1, 2), countdown=60)
+
+        key, values = self.redis_instance.zadd.call_args[0]
+        self.assertEqual('tasks:delayed:default', key)
+        self.assertEqual([1060.0], list(values.values()))
+
+    def test_map_pushes_once(self):
+        ids = self.add.map([(1, 2), (3, 4)])
+
+        self.assertEqual(2, len(ids))
+        self.assertEqual(1, self.redis_instance.lpush.call_count)
+        self.assertEqual(3, len(self.redis_instance.lpush.call_args[0]))
+
+    def test_delay_is_batched(self):
+        self.tasks.redis = self.redis
+        with self.app.test_request_context():
+            with mock.patch.object(self.redis, '_connect') as connect:
+                with self.redis.batch():
+                    self.add.delay(1, 2)
+                    self.assertFalse(connect.return_value.lpush.called)
+
+
+class WorkerTest(FlaskRedisTestCase):
+    def _setUp(self):
+        self.calls = []
+
+        @self.redis.task(name='add', retries=1, retry_delay=5)
+        def add(a, b):
+            if a < 0:
+                raise ValueError(a)
+            self.calls.append((flask.current_app.name, a + b))
+
+        patcher = mock.patch('flask_redis.tasks.dedicated_client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.pipe = self.client.pipeline.return_value
+        self.worker = Worker(self.redis.tasks, ['high', 'default'],
+                             batch_size=2, app=self.app)
+        self.worker._lmove = True
+
+    def job(self, *args):
+        return self.redis.tasks.dump_job(self.redis.tasks.create_job(
+            'add', args))
+
+    def test_fetch_in_one_round_trip(self):
+        job1, job2, job3 = self.job(1, 1), self.job(2, 2), self.job(3, 3)
+        self.pipe.execute.return_value = [True, 0, 1, job1, None, job2,
+                                          job3]
+
+        self.assertEqual([('high', job1), ('default', job2)],
+                         self.worker.fetch())
+        self.assertEqual(4, self.pipe.lmove.call_count)
+        self.pipe.lmove.assert_called_with(
+            'tasks:queue:default',
+            'tasks:processing:default:' + self.worker.id, 'RIGHT', 'LEFT')
+        self.assertEqual('tasks:delayed:high',
+                         self.pipe.evalsha.call_args_list[0][0][2])
+        # fetched beyond the batch
+        self.pipe.rpush.assert_called_once_with('tasks:queue:default', job3)
+
+    def test_fetch_batch_in_one_round_trip(self):
+        self.pipe.execute.return_value = [True, 0, 0, None, None, None,
+                                          None]
+
+        self.assertEqual([], self.worker.fetch())
+        self.pipe.setex.assert_called_once_with(
+            'tasks:worker:' + self.worker.id, 60, 1)
+        self.pipe.execute.assert_called_once_with(raise_on_error=False)
+
+    def test_fetch_reloads_flushed_script(self):
+        self.pipe.execute.return_value = [
+            True, redis.exceptions.NoScriptError(), 0, None, None, None,
+            None]
+
+        self.assertEqual([], self.worker.fetch())
+        self.assertTrue(self.client.script_load.called)
+
+    def test_run_jobs(self):
+        ok, failing = self.job(1, 2), self.job(-1, 0)
+        with mock.patch('flask_redis.tasks.logger'), \
+                mock.patch('time.time', return_value=1000.0):
+            self.worker.run_jobs([('default', ok), ('default', failing)])
+
+        self.assertEqual([(self.app.name, 3)], self.calls)
+        processing = 'tasks:processing:default:' + self.worker.id
+        self.pipe.lrem.assert_has_calls([mock.call(processing, 1, ok),
+                                         mock.call(processing, 1, failing)])
+        key, values = self.pipe.zadd.call_args[0]
+        self.assertEqual('tasks:delayed:default', key)
+        value, eta = list(values.items())[0]
+        self.assertEqual(1005.0, eta)
+        self.assertEqual(1, self.redis.tasks.load_job(value)['attempt'])
+        self.pipe.execute.assert_called_once_with()
+        self.assertEqual((1, 1, 1), (self.worker.processed,
+                                     self.worker.failed, self.worker.retried))
+
+    def test_heartbeat_is_refreshed_between_jobs(self):
+        clock = [1000.0]
+        with mock.patch('time.time', side_effect=lambda: clock[0]):
+            def slow_add(a, b):
+                clock[0] += 25
+            self.redis.tasks.tasks['add'].func = slow_add
+            self.worker.run_jobs([('default', self.job(1, 1)),
+                                  ('default', self.job(2, 2))])
+
+        # once before the first job, again 25 seconds later
+        self.assertEqual([mock.call('tasks:worker:' + self.worker.id, 60, 1)]
+                         * 2, self.client.setex.call_args_list)
+
+    def test_exhausted_job_is_dead(self):
+        job = self.redis.tasks.create_job('add', (-1, 0))
+        job['attempt'] = 1
+        value = self.redis.tasks.dump_job(job)
+        with mock.patch('flask_redis.tasks.logger'):
+            self.worker.run_jobs([('default', value), ('default', b'junk')])
+
+        self.pipe.lpush.assert_has_calls([
+            mock.call('tasks:dead:default', value),
+            mock.call('tasks:dead:default', b'junk')])
+        self.assertFalse(self.pipe.zadd.called)
+
+    def test_recover_jobs_of_dead_workers(self):
+        self.client.smembers.return_value = [b'alive', b'gone']
+        self.client.exists.side_effect = lambda key: key.endswith('alive')
+        self.client.rpoplpush.side_effect = [b'job', None, None]
+
+        self.assertEqual(1, self.worker.recover())
+        self.client.rpoplpush.assert_has_calls([
+            mock.call('tasks:processing:high:gone', 'tasks:queue:high'),
+            mock.call('tasks:processing:high:gone', 'tasks:queue:high'),
+            mock.call('tasks:processing:default:gone',
+                      'tasks:queue:default')])
+        self.client.srem.assert_called_once_with('tasks:workers', 'gone')
+
+    def test_recovers_once_per_heartbeat(self):
+        clock = [1000.0]
+        fetched = []
+
+        def fetch():
+            clock[0] += 40
+            fetched.append(clock[0])
+            if len(fetched) == 3:
+                self.worker.stop()
+            return []
+
+        with mock.patch('time.time', side_effect=lambda: clock[0]), \
+                mock.patch.object(self.worker, 'fetch', fetch), \
+                mock.patch.object(self.worker, 'wait', return_value=[]), \
+                mock.patch.object(self.worker, 'recover',
+                                  wraps=self.worker.recover) as recover:
+            self.worker.work()
+
+        # at start and once 60 seconds have passed since
+        self.assertEqual(2, recover.call_count)
+
+    def test_burst(self):
+        self.pipe.execute.side_effect = [
+            [True, 0, 0, self.job(1, 1), None, None, None], None,
+            [True, 0, 0, None, None, None, None],
+            [[], []], None]
+
+        self.worker.work(burst=True)
+
+        self.assertEqual([(self.app.name, 2)], self.calls)
+        self.pipe.srem.assert_called_once_with('tasks:workers',
+                                               self.worker.id)
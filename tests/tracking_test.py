@@ -0,0 +1,198 @@
+# -*- coding: UTF-8 -*-
+"""
+    tests.tracking_test
+    ~~~~~~~~~~~~~~~~~~~
+
+    Testing the tracking cache
+
+    :copyright: (c) 2013 by netzinformatik UG.
+    :author: Tobias Werner <mail@tobiaswerner.net>
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import time
+import unittest
+
+import mock
+import redis.sentinel
+
+from benchmarks import spawn_redis_server
+from flask_redis.tracking import TrackingCache, _TrackingConnectionMixin
+from tests import FlaskRedisTestCase, create_app
+
+
+class TrackingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = TrackingCache(mock.MagicMock(name='pool'), max_size=2)
+        self.cache._pid = os.getpid()
+        self.cache._ready.set()
+        self.client = self.cache._client = mock.MagicMock(name='client')
+        self.client.execute_command.side_effect = lambda command, name: (
+            'value of %s' % name)
+
+    def test_hit_and_miss(self):
+        self.assertEqual('value of a', self.cache.get('a'))
+        self.assertEqual('value of a', self.cache.get('a'))
+        self.assertEqual('value of a', self.cache.hgetall('a'))
+
+        self.assertEqual(2, self.client.execute_command.call_count)
+        self.assertEqual(dict(hits=1, misses=2, evictions=0, invalidations=0,
+                              size=2), self.cache.stats())
+
+    def test_lru_eviction(self):
+        self.cache.get('a')
+        self.cache.get('b')
+        self.cache.get('a')
+        self.cache.get('c')
+
+        self.assertEqual(1, self.cache.evictions)
+        self.cache.get('a')
+        self.assertEqual(3, self.client.execute_command.call_count)
+        self.cache.get('b')
+        self.assertEqual(4, self.client.execute_command.call_count)
+
+    def test_ttl(self):
+        self.cache.ttl = 10
+        self.cache.get('a')
+        with mock.patch('time.time', return_value=time.time() + 11):
+            self.cache.get('a')
+        self.assertEqual(2, self.client.execute_command.call_count)
+
+    def test_invalidation_message(self):
+        self.cache.max_size = 10
+        self.cache.get('a')
+        self.cache.hgetall('a')
+        self.cache.get('b')
+
+        self.cache._handle([b'message', b'__redis__:invalidate', [b'a']])
+        self.assertEqual(2, self.cache.invalidations)
+        self.assertEqual(1, self.cache.stats()['size'])
+
+        self.cache._handle([b'message', b'__redis__:invalidate', None])
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def test_invalidation_during_fetch(self):
+        def fetch(command, name):
+            self.cache.invalidate(name)
+            return 'stale'
+        self.client.execute_command.side_effect = fetch
+
+        self.assertEqual('stale', self.cache.get('a'))
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def test_mget(self):
+        self.cache.get('a')
+        self.client.mget.return_value = ['value of b', 'value of c']
+
+        values = self.cache.mget(['a', 'b', 'c'])
+
+        self.assertEqual(['value of a', 'value of b', 'value of c'], values)
+        self.client.mget.assert_called_once_with(['b', 'c'])
+        self.assertEqual(1, self.cache.hits)
+
+    def test_bypass_without_listener(self):
+        self.cache._ready.clear()
+        fallback = self.cache._fallback = mock.Mock(name='fallback')
+
+        self.cache.get('a')
+
+        fallback.execute_command.assert_called_once_with('GET', 'a')
+        self.assertFalse(self.client.execute_command.called)
+
+
+class RedisCacheConfigTest(FlaskRedisTestCase):
+
+    def test_cache_disabled_by_default(self):
+        self.assertIsNone(self.redis.cache)
+
+    def test_cache_enabled(self):
+        app = create_app(dict(REDIS_CACHE=True, REDIS_CACHE_MAX_SIZE=10,
+                              REDIS_CACHE_TTL=30))
+        ext = type(self.redis)(app)
+        self.assertIsInstance(ext.cache, TrackingCache)
+        self.assertEqual(10, ext.cache.max_size)
+        self.assertEqual(30, ext.cache.ttl)
+
+    @mock.patch('flask_redis.tracking.threading.Thread')
+    @mock.patch('flask_redis.tracking.time.sleep')
+    def test_cache_of_sentinel_pool(self, sleep, thread):
+        app = create_app(dict(REDIS_CACHE=True,
+                              REDIS_SENTINELS=[('10.0.0.1', 26379)]))
+        cache = type(self.redis)(app).cache
+
+        cache._start()
+
+        pool = cache._client.connection_pool
+        self.assertIsInstance(pool, redis.sentinel.SentinelConnectionPool)
+        self.assertTrue(issubclass(pool.connection_class,
+                                   _TrackingConnectionMixin))
+        self.assertTrue(issubclass(pool.connection_class,
+                                   redis.sentinel.SentinelManagedConnection))
+        self.assertIs(pool.proxy, pool.connection_kwargs['connection_pool'])
+        self.assertIs(cache, pool.connection_kwargs['tracking_cache'])
+
+        connection = mock.Mock(name='connection')
+        connection.connect.side_effect = redis.ConnectionError()
+
+        def make_connection(pool):
+            self.assertIsNone(pool.connection_kwargs['socket_timeout'])
+            self.assertIs(pool.proxy, pool.connection_kwargs[
+                'connection_pool'])
+            cache._pid = None
+            return connection
+        with mock.patch.object(redis.sentinel.SentinelConnectionPool,
+                               'make_connection', make_connection):
+            cache._pid = os.getpid()
+            cache._listen()
+        connection.disconnect.assert_called_once_with()
+
+
+class TrackingCacheServerTest(unittest.TestCase):
+    """Runs the cache against a throwaway redis-server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = spawn_redis_server()
+        if cls.server is None:
+            raise unittest.SkipTest('redis-server is not installed')
+
+    @classmethod
+    def tearDownClass(cls):
+        process = cls.server[0]
+        process.terminate()
+        process.wait()
+
+    def setUp(self):
+        self.pool = redis.ConnectionPool(port=self.server[1])
+        self.client = redis.StrictRedis(connection_pool=self.pool)
+        self.client.flushdb()
+        self.cache = TrackingCache(self.pool)
+        self.cache._ensure_started()
+        self.assertTrue(self.cache._ready.wait(3))
+
+    def tearDown(self):
+        # stops the listener once its connection is dropped
+        self.cache._pid = None
+        self.client.client_kill_filter(_type='pubsub')
+        self.pool.disconnect()
+
+    def test_changed_key_is_evicted(self):
+        self.client.set('greeting', 'hello')
+
+        self.assertEqual(b'hello', self.cache.get('greeting'))
+        self.assertEqual(b'hello', self.cache.get('greeting'))
+        self.assertEqual(1, self.cache.hits)
+        tracking = [entry for entry in self.client.client_list()
+                    if 't' in entry['flags']]
+        self.assertEqual(1, len(tracking))
+        self.assertEqual(str(self.cache.listener_id), tracking[0]['redir'])
+
+        redis.StrictRedis(port=self.server[1]).set('greeting', 'bye')
+        for _ in range(100):
+            if self.cache.invalidations:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(1, self.cache.invalidations)
+        self.assertEqual(0, self.cache.stats()['size'])
+        self.assertEqual(b'bye', self.cache.get('greeting'))